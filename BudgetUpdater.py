@@ -1,4 +1,5 @@
 from openpyxl import load_workbook
+from openpyxl.cell import Cell
 from openpyxl.worksheet.formula import ArrayFormula
 from datetime import datetime, timedelta
 from copy import copy
@@ -6,13 +7,25 @@ import re
 import os
 from openpyxl.styles import Alignment, Font, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
+import atomic_save
+import metrics
+import month_shards
 import updateMyBuckets
-from config import (
+import workbook_cache
+from bucket_balances import BucketBalances
+from formula_eval import FormulaError, WorkbookEvaluator
+from records import Transaction, parse_date, to_cents
+from transaction_catalog import Catalog
+from transaction_store import TransactionStore
+from settings import (
+    DEBIT_ID,
     TRANSACTION_DIRECTORY, 
     SPREADSHEET_DIRECTORY, 
     MASTER_SPREADSHEET_NAME, 
+    MASTER_LAYOUT,
     BACKUP_DIRECTORY,
-    SUMMARY_FILE
+    SUMMARY_FILE,
+    ensure_directories
 )
 
 class BudgetUpdater:
@@ -34,16 +47,38 @@ class BudgetUpdater:
         self.current_month_num = self.current_date.month
         self.current_year = self.current_date.year
         
+        # Create the transaction and backup directories on first use
+        ensure_directories()
+
         # Load workbook
-        self.wb = load_workbook(self.file_path, keep_vba=True, data_only=False)
+        with metrics.timer("workbook.load"):
+            self.wb = workbook_cache.load(self.file_path, keep_vba=True)
 
     def _log(self, message, is_error=False):
         """Prints messages if verbose is True or if it's an error."""
+        metrics.log(message)
         if is_error or self.verbose:
             print(message)
 
+    def _cached_value(self, sheet_name, row, column):
+        """
+        The value Excel last calculated for a cell. The workbook is loaded a
+        second time (data_only) on first use, so this is only the fallback for
+        formulas formula_eval cannot evaluate.
+        """
+        if self._cached_wb is None:
+            with metrics.timer("workbook.load"):
+                self._cached_wb = workbook_cache.load(self.file_path, keep_vba=True, data_only=True)
+        return self._cached_wb[sheet_name].cell(row=row, column=column).value
+
     def convert_previous_month_to_values(self):
-        """Converts formulas to values and updates bold formatting for month rows in Total Balance sheet."""
+        """
+        Converts formulas to values and updates bold formatting for month rows in Total Balance sheet.
+
+        Formulas are evaluated in Python (see formula_eval.py), so the values
+        are right even when the workbook was last saved by openpyxl and has
+        no values cached by Excel.
+        """
         sheet_name = "Total Balance"
         if sheet_name not in self.wb.sheetnames:
             self._log(f"⚠ Sheet '{sheet_name}' not found.", is_error=True)
@@ -52,12 +87,8 @@ class BudgetUpdater:
         sheet = self.wb[sheet_name]
         self._log(f"\n🔹 Processing '{sheet_name}' for {self.prev_month}")
 
-        try:
-            wb_data = load_workbook(self.file_path, data_only=True, keep_vba=True)
-            sheet_data = wb_data[sheet_name]
-        except Exception as e:
-            self._log(f"❌ Error loading workbook data: {str(e)}", is_error=True)
-            return
+        evaluator = WorkbookEvaluator(self.wb, SPREADSHEET_DIRECTORY, loader=workbook_cache.load)
+        self._cached_wb = None
 
         prev_month_row = None
         current_month_row = None
@@ -81,14 +112,18 @@ class BudgetUpdater:
                 # Convert formulas and unbold row
                 for col in range(1, sheet.max_column + 1):  # Include column A
                     target = sheet.cell(row=row, column=col)
-                    source = sheet_data.cell(row=row, column=col)
-                    
+
                     # Convert formula to value
                     if target.data_type == 'f':
                         try:
-                            if source.value is not None:
-                                target.value = source.value
-                                target.data_type = 'n' if isinstance(source.value, (int, float)) else 's'
+                            try:
+                                value = evaluator.value(sheet_name, target.coordinate)
+                                metrics.count("formulas.evaluated")
+                            except FormulaError as e:
+                                self._log(f"⚠ Could not evaluate {target.coordinate} ({e}), using Excel's cached value")
+                                value = self._cached_value(sheet_name, row, col)
+                            if value is not None:
+                                target.value = value  # Also sets the data type
                                 self._log(f"🔄 Converted cell {get_column_letter(col)}{row}")
                             else:
                                 self._log(f"⚠ No value for cell {get_column_letter(col)}{row}")
@@ -152,16 +187,17 @@ class BudgetUpdater:
         months = ['January', 'February', 'March', 'April', 'May', 'June',
                 'July', 'August', 'September', 'October', 'November', 'December']
         
-        # Compile pattern once for better performance
-        month_pattern = re.compile(r'\[([^\]]*?)\](' + '|'.join(months) + r')\b')
-        
-        def replace_match(match):
-            workbook_ref = match.group(1)
-            old_month = match.group(2)
-            
-            # Simplify workbook reference handling
-            old_ref = f'[{workbook_ref}]{old_month}'
+        # Compile pattern once for better performance. A quoted reference is
+        # matched with its quotes and folder so they are not doubled up
+        month_pattern = re.compile(r"(?:'([^'\[\]]*))?\[([^\]]*?)\](" + '|'.join(months) + r")\b(?(1)')")
+
+        if MASTER_LAYOUT == "sharded":
+            # Point at the month's own workbook (see month_shards.py)
+            new_ref = month_shards.external_reference(current_month)
+        else:
             new_ref = f"'[{self.workbook_name}]{current_month}'"
+
+        def replace_match(match):
             return new_ref
 
         return month_pattern.sub(replace_match, formula)
@@ -220,12 +256,188 @@ class BudgetUpdater:
             workbook.add_named_style(text_style)
         self.text_style = "text_style"
 
-    def update_jacks_buckets(self):
-        """Updates Jacks Buckets with recent transactions from Debit Transactions excel file"""
+    @staticmethod
+    def _find_debit_file():
+        """
+        Returns the path of the newest Debit Transactions file, or None.
+
+        Files are named "Debit Transactions YYYY.xlsx" and looked up in the
+        transaction catalog; the latest year wins, then the most recently
+        modified (see Catalog.latest_debit).
+        """
+        catalog = Catalog()
+        try:
+            catalog.refresh([TRANSACTION_DIRECTORY])
+            entry = catalog.latest_debit([TRANSACTION_DIRECTORY])
+        finally:
+            catalog.close()
+        return entry.path if entry else None
+
+    def _read_debit_rows(self, since=None, debit_file=None):
+        """
+        Reads debit rows as records.Transaction from debit_file, by default the
+        latest Debit Transactions file.
+
+        The sheet is streamed in read-only mode. When since (a date) is given
+        and the file is exactly as updateMyBuckets exported it, newest first
+        (see TransactionStore.workbook_synced), reading stops at the first row
+        on or before since. Any other file, e.g. one edited or re-sorted by
+        hand, is read in full and filtered, as its row order is unknown.
+        """
+        debit_file = debit_file or self._find_debit_file()
+
+        if not debit_file:
+            self._log("⚠ No Debit Transactions file found.", is_error=True)
+            return None
+
+        self._log(f"✅ Found Debit Transactions file: {debit_file}")
+
+        # Stream the Debit Transactions workbook
+        try:
+            with metrics.timer("workbook.load"):
+                debit_wb = load_workbook(debit_file, read_only=True, data_only=True)
+            debit_sheet = debit_wb.active
+        except Exception as e:
+            self._log(f"❌ Error loading Debit Transactions file: {str(e)}", is_error=True)
+            return None
+
+        since_day = since.date() if isinstance(since, datetime) else since
+        newest_first = since_day is not None and TransactionStore().workbook_synced(debit_file)
+        rows = []
+        try:
+            # Row 1 is the header; columns are Date, Description, Amount
+            for date_value, description, amount in debit_sheet.iter_rows(min_row=2, max_col=3, values_only=True):
+                try:
+                    tx = Transaction(None, parse_date(date_value), description, to_cents(amount))
+                except (TypeError, ValueError):
+                    continue
+                if since_day is not None and tx.date <= since_day:
+                    if newest_first:
+                        break
+                    continue
+                rows.append(tx)
+        finally:
+            debit_wb.close()
+        metrics.count("debit.rows_read", len(rows))
+        return rows
+
+    def _read_store_debit_rows(self, last_date):
+        """
+        Reads debit rows as records.Transaction from the transaction store, or None if it has none.
+        Card repayments linked as transfers are left out, as they are not bucket spend.
+        """
+        store = TransactionStore()
+        if not store.has_account(DEBIT_ID):
+            return None
+        return store.query(account_id=DEBIT_ID, start_date=last_date, include_transfers=False)
+
+    def _drop_linked_transfers(self, debit_rows, last_date):
+        """
+        Leaves out rows read from the Debit Transactions file that the store has
+        linked as card repayments. The file has no ids, so rows are matched on
+        date, description and amount.
+        """
+        store = TransactionStore()
+        linked = {(tx.date, tx.description, tx.amount_cents)
+                  for tx in store.query(account_id=DEBIT_ID, start_date=last_date) if tx.transfer_id is not None}
+        if not linked:
+            return debit_rows
+        kept = [tx for tx in debit_rows if (tx.date, tx.description, tx.amount_cents) not in linked]
+        metrics.count("debit.transfers_skipped", len(debit_rows) - len(kept))
+        return kept
+
+    def _select_new_transactions(self, debit_rows, last_date):
+        """Categorises debit records dated after last_date for Jacks Buckets (in place)."""
+        last_day = last_date.date() if isinstance(last_date, datetime) else last_date
+        new_transactions = []
+        for tx in debit_rows:
+            if tx.date <= last_day:
+                continue
+
+            # Categorization rules (hardcoded)
+            description = tx.description or ""
+            category = None
+            if description.startswith("Direct Credit 617702") and "PAYPAL AUSTRALIA" in description:
+                category = "DataAnnotation"
+            elif "Salary" in description:
+                category = "Salary"
+            elif "Jack weekly spend" in description:
+                category = "Salary"
+            elif "Solar Loan" in description:
+                category = "Salary"
+
+            tx.category = category
+            new_transactions.append(tx)
+            self._log(f"Jacks Buckets updated successfully.")
+        return new_transactions
+
+    def _bucket_row_styles(self, sheet, template_row=None):
+        """
+        Resolves the style of each Jacks Buckets column once: its named style,
+        with the fill and border of template_row on top.
+
+        Returns {(column, negative): StyleArray}, where negative picks the red
+        currency style for the Amount column.
+        """
+        column_styles = [
+            (1, False, self.date_style),
+            (2, False, self.text_style),
+            (3, False, self.text_style),
+            (4, False, self.currency_style),
+            (4, True, self.currency_negative_style),
+        ]
+        styles = {}
+        for column, negative, style in column_styles:
+            cell = Cell(sheet, row=1, column=column)
+            cell.style = style
+            if template_row is not None:
+                above_cell = sheet.cell(row=template_row, column=column)
+                if above_cell.fill and above_cell.fill != PatternFill():
+                    cell.fill = copy(above_cell.fill)
+                if above_cell.border:
+                    cell.border = copy(above_cell.border)
+            styles[column, negative] = cell._style
+        return styles
+
+    def _append_bucket_rows(self, sheet, transactions, template_row=None):
+        """
+        Appends transactions to Jacks Buckets as one contiguous block below the
+        last row. Styles are resolved once and each cell gets a copy of the
+        shared style indices, instead of looking up named styles and copying
+        fills and borders for every cell.
+        """
+        styles = self._bucket_row_styles(sheet, template_row)
+        for trans in transactions:
+            negative = trans.amount_cents < 0
+            row = []
+            for column, value in enumerate((trans.date, trans.description, trans.category, trans.amount), start=1):
+                cell = Cell(sheet, value=value)
+                cell._style = copy(styles[column, negative and column == 4])
+                row.append(cell)
+            sheet.append(row)
+
+    @metrics.timed("buckets.update")
+    def update_jacks_buckets(self, debit_transactions=None, debit_file=None):
+        """
+        Updates Jacks Buckets with recent transactions from the debit account.
+
+        Args:
+            debit_transactions: Rows already fetched and formatted by updateMyBuckets.
+                When given, they are stored and exported instead of fetching again.
+            debit_file: A Debit Transactions file to read new rows from instead of
+                the store, e.g. one that was edited since it was exported.
+
+        New rows are read from the transaction store; the Debit Transactions
+        excel file is only parsed when debit_file is given or the store has no
+        debit history yet.
+        """
         # Run updateMyBuckets to fetch latest transactions
         self._log("\n🔹 Updating transaction list")
         fetcher = updateMyBuckets.updateMyBuckets()
-        fetcher.run()
+        if debit_transactions is None:
+            fetcher.run()
+        elif debit_transactions:
+            fetcher.save_transactions(debit_transactions)
 
         # Check if Jacks Buckets sheet exists
         if "Jacks Buckets" not in self.wb.sheetnames:
@@ -255,153 +467,93 @@ class BudgetUpdater:
 
         self._log(f"✅ Last transaction date in Jacks Buckets: {last_date.strftime('%d/%m/%Y')}")
 
-        # Find the latest Debit Transactions file
-        debit_file = None
-        for file in os.listdir(TRANSACTION_DIRECTORY):
-            if file.startswith("Debit Transactions") and file.endswith(".xlsx"):
-                debit_file = os.path.join(TRANSACTION_DIRECTORY, file)
-                break
+        debit_rows = None if debit_file else self._read_store_debit_rows(last_date)
+        if debit_rows is None:
+            debit_rows = self._read_debit_rows(since=last_date, debit_file=debit_file)
+            if debit_rows is None:
+                return
+            debit_rows = self._drop_linked_transfers(debit_rows, last_date)
 
-        if not debit_file:
-            self._log("⚠ No Debit Transactions file found.", is_error=True)
-            return
-
-        self._log(f"✅ Found Debit Transactions file: {debit_file}")
-
-        # Load the Debit Transactions workbook
-        try:
-            debit_wb = load_workbook(debit_file)
-            debit_sheet = debit_wb.active
-        except Exception as e:
-            self._log(f"❌ Error loading Debit Transactions file: {str(e)}", is_error=True)
-            return
-
-        # Process new transactions
-        new_transactions = []
-        for row in range(2, debit_sheet.max_row + 1):  # Assuming row 1 is header
-            date_str = debit_sheet[f'A{row}'].value
-            if not date_str:
-                continue
-
-            try:
-                if isinstance(date_str, datetime):
-                    trans_date = date_str
-                elif isinstance(date_str, str):
-                    # Convert YYYY-MM-DD to datetime
-                    trans_date = datetime.strptime(date_str, "%Y-%m-%d")
-                else:
-                    continue
-
-                if trans_date > last_date:
-                    description = debit_sheet[f'B{row}'].value
-                    amount = debit_sheet[f'C{row}'].value
-
-                    # Categorization rules (hardcoded)
-                    category = None
-                    if description.startswith("Direct Credit 617702") and "PAYPAL AUSTRALIA" in description:
-                        category = "DataAnnotation"
-                    elif "Salary" in description:
-                        category = "Salary"
-                    elif "Jack weekly spend" in description:
-                        category = "Salary"
-                    elif "Solar Loan" in description:
-                        category = "Salary"
-                    elif "Transfer to xx9545" in description:
-                        category = "Salary"
-
-                    new_transactions.append({
-                        'date': trans_date,
-                        'description': description,
-                        'category': category,
-                        'amount': amount
-                    })
-                    self._log(f"Jacks Buckets updated successfully.")
-            except ValueError:
-                continue
+        new_transactions = self._select_new_transactions(debit_rows, last_date)
 
         self.setup_styles(self.wb)
 
         # Add new transactions to Jacks Buckets
         if new_transactions:
             # Sort transactions by date (oldest first) before adding
-            new_transactions.sort(key=lambda x: x['date'])
+            new_transactions.sort(key=lambda x: x.date)
             
-            start_row = bucket_sheet.max_row + 1
-            for i, trans in enumerate(new_transactions, start=start_row):
-                # Date column (A)
-                date_cell = bucket_sheet[f'A{i}']
-                date_cell.value = trans['date']  # Set as datetime object
-                date_cell.style = self.date_style
-
-                # Description column (B)
-                desc_cell = bucket_sheet[f'B{i}']
-                desc_cell.value = trans['description']
-                desc_cell.style = self.text_style
-
-                # Category column (C)
-                cat_cell = bucket_sheet[f'C{i}']
-                cat_cell.value = trans['category']
-                cat_cell.style = self.text_style
-
-                # Amount column (D)
-                amount_cell = bucket_sheet[f'D{i}']
-                amount_cell.value = trans['amount']
-                # Apply appropriate currency style based on value
-                if trans['amount'] < 0:
-                    amount_cell.style = self.currency_negative_style
-                else:
-                    amount_cell.style = self.currency_style
-
-                # Copy formatting from the row above
-                if start_row > 2:
-                    for col in ['A', 'B', 'C', 'D']:
-                        above_cell = bucket_sheet[f'{col}{i-1}']
-                        current_cell = bucket_sheet[f'{col}{i}']
-                        if above_cell.fill and above_cell.fill != PatternFill():
-                            current_cell.fill = copy(above_cell.fill)
-                        if above_cell.border:
-                            current_cell.border = copy(above_cell.border)
+            # Rows after the header take their fill and border from the last existing row
+            template_row = bucket_sheet.max_row if bucket_sheet.max_row > 1 else None
+            self._append_bucket_rows(bucket_sheet, new_transactions, template_row)
 
+            metrics.count("cells.written", 4 * len(new_transactions))
             self._log(f"✅ Added {len(new_transactions)} new transactions to Jacks Buckets")
         else:
             self._log("ℹ No new transactions found since last update", is_error=True)
 
+        self.update_bucket_balances(bucket_sheet)
+
+    @metrics.timed("buckets.balances")
+    def update_bucket_balances(self, bucket_sheet):
+        """
+        Folds the Jacks Buckets rows added since the last run into the running
+        balances in the hidden Bucket Balances sheet (see bucket_balances.py).
+        """
+        balances = BucketBalances.load(self.wb)
+        if balances is None or not balances.matches(bucket_sheet):
+            self._log("ℹ Rebuilding Jacks Buckets balances from every row")
+            balances = BucketBalances()
+        added = balances.add_rows(bucket_sheet)
+        balances.write(self.wb)
+        metrics.count("buckets.balance_rows", added)
+        self._log(f"✅ Bucket balances updated with {added} row(s) through row {balances.through_row}")
+
     def save_workbook(self, output_path=None):
-        """Saves the modified workbook."""
+        """
+        Saves the modified workbook.
+
+        The workbook is written to a temporary file and renamed over
+        output_path (see atomic_save.py), so Excel or another reader with the
+        file open is never left with a half-written .xlsm. The version it
+        replaces is kept in BACKUP_DIRECTORY as a hard link rather than a copy.
+        """
         try:
             # If output_path is not specified, use the original file path
             if output_path is None:
                 output_path = self.file_path
             
-            # Create backup before saving
-            if os.path.exists(self.file_path):
+            backup_path = None
+            if os.path.exists(output_path):
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 backup_filename = f"{os.path.splitext(os.path.basename(SUMMARY_FILE))[0]}_backup_{timestamp}.xlsm"
                 backup_path = os.path.join(BACKUP_DIRECTORY, backup_filename)
-                
-                # Copy original file to backup
-                import shutil
-                shutil.copy2(self.file_path, backup_path)
-                self._log(f"📁 Created backup at {backup_path}")
             
-            self.wb.save(output_path)
+            with metrics.timer("workbook.save"):
+                atomic_save.save_workbook(self.wb, output_path, backup_path)
+            if backup_path:
+                self._log(f"📁 Created backup at {backup_path}")
+            metrics.count("workbook.bytes_written", os.path.getsize(output_path))
             self._log(f"\n✅ Saved to {output_path}")
         except Exception as e:
             self._log(f"❌ Error saving workbook: {str(e)}", is_error=True)
 
-    def run_all_updates(self):
+    def run_all_updates(self, debit_transactions=None, debit_file=None):
         """Run all update operations in sequence"""
         self.convert_previous_month_to_values()
         self.update_formulas()
-        self.update_jacks_buckets()
+        self.update_jacks_buckets(debit_transactions, debit_file)
 
 if __name__ == "__main__":
+    import profiling
+    metrics.start("BudgetUpdater")
     try:
-        updater = BudgetUpdater(
-            # Use config values instead of hardcoded paths
-            verbose=False  # Set to True for detailed logs
-        )
-        updater.run_all_updates()
-        updater.save_workbook()
+        with profiling.from_command_line("BudgetUpdater"):
+            updater = BudgetUpdater(
+                # Use config values instead of hardcoded paths
+                verbose=False  # Set to True for detailed logs
+            )
+            updater.run_all_updates()
+            updater.save_workbook()
     except Exception as e:
         print(f"❌ An error occurred: {str(e)}")
\ No newline at end of file
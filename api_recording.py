@@ -0,0 +1,188 @@
+import contextlib
+import gzip
+import json
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from settings import DEBIT_ID, POCKETSMITH_API_KEY, POCKETSMITH_API_URL, ULTIMATE_AWARDS_CC_ID
+
+'''
+Record and replay PocketSmith API sessions.
+
+record(path) captures every requests.get made inside it (bank_feeds,
+bank_feeds_psql and updateMyBuckets all fetch through requests.get) into a
+gzipped JSON fixture: the status, paging headers, body and elapsed time of
+each response. Request headers, and so the API key, are never written, and
+the API base URL and the account ids in URLs are replaced by placeholders, so
+fixtures can be shared and replayed against another config.py.
+
+replay(path) answers the same requests from the fixture without touching the
+network, either at wire speed or sleeping for the recorded latencies.
+Requests are matched on account and page; the start and end dates are
+ignored so a replay can run on a later day. A request the fixture does not
+cover raises ReplayMiss.
+
+Example:
+    python run_programs.py --pipeline --start-date 2025-01-01 --record session.json.gz
+    python run_programs.py --pipeline --start-date 2025-01-01 --replay session.json.gz
+'''
+
+FORMAT_VERSION = 1
+_KEPT_HEADERS = ("Content-Type", "Total", "Per-Page", "Link")
+
+
+class ReplayMiss(LookupError):
+    """Raised when a replayed request has no recorded response."""
+
+
+def _placeholders():
+    """Secret or machine-specific values and what they are replaced with, longest first."""
+    values = {
+        POCKETSMITH_API_URL.rstrip("/"): "{POCKETSMITH_API_URL}",
+        f"/accounts/{ULTIMATE_AWARDS_CC_ID}/": "/accounts/{ULTIMATE_AWARDS_CC_ID}/",
+        f"/accounts/{DEBIT_ID}/": "/accounts/{DEBIT_ID}/",
+        str(POCKETSMITH_API_KEY): "{POCKETSMITH_API_KEY}",
+    }
+    return sorted(((value, name) for value, name in values.items() if value), key=lambda item: -len(item[0]))
+
+
+def scrub(text):
+    """Replace the API key, base URL and account ids in URLs with placeholders."""
+    for value, name in _placeholders():
+        text = text.replace(value, name)
+    return text
+
+
+def _unscrub(text):
+    for value, name in _placeholders():
+        text = text.replace(name, value)
+    return text
+
+
+def _scrub_body(value, scrub=scrub):
+    """Apply scrub (or its inverse) to every string in a decoded JSON body."""
+    if isinstance(value, str):
+        return scrub(value)
+    if isinstance(value, list):
+        return [_scrub_body(item, scrub) for item in value]
+    if isinstance(value, dict):
+        return {key: _scrub_body(item, scrub) for key, item in value.items()}
+    return value
+
+
+def request_key(url):
+    """Match key for a request: its scrubbed path plus the page and per_page parameters."""
+    parts = urlsplit(scrub(url))
+    query = parse_qs(parts.query)
+    paging = "&".join(f"{name}={query[name][0]}" for name in ("page", "per_page") if name in query)
+    return f"{parts.path}?{paging}" if paging else parts.path
+
+
+def load(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        recording = json.load(f)
+    if recording.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} API recording")
+    return recording
+
+
+@contextlib.contextmanager
+def record(path):
+    """Record every requests.get made inside the block to a gzipped fixture at path."""
+    real_get = requests.get
+    interactions = []
+    lock = threading.Lock()
+
+    def recording_get(url, *args, **kwargs):
+        started = time.perf_counter()
+        response = real_get(url, *args, **kwargs)
+        elapsed = time.perf_counter() - started
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        interaction = {
+            "key": request_key(url),
+            "url": scrub(url),
+            "status": response.status_code,
+            "headers": {name: scrub(response.headers[name]) for name in _KEPT_HEADERS if name in response.headers},
+            "body": _scrub_body(body),
+            "text": None if body is not None else scrub(response.text),
+            "elapsed": round(elapsed, 4),
+        }
+        with lock:
+            interactions.append(interaction)
+        return response
+
+    requests.get = recording_get
+    try:
+        yield interactions
+    finally:
+        requests.get = real_get
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                       "interactions": interactions}, f, separators=(",", ":"))
+        print(f"Recorded {len(interactions)} API response(s) to {path}")
+
+
+def _response(interaction, url):
+    response = requests.Response()
+    response.status_code = interaction["status"]
+    response.url = url
+    response.headers.update({name: _unscrub(value) for name, value in interaction["headers"].items()})
+    if interaction["body"] is not None:
+        response._content = json.dumps(_scrub_body(interaction["body"], _unscrub)).encode("utf-8")
+    else:
+        response._content = _unscrub(interaction["text"] or "").encode("utf-8")
+    response.encoding = "utf-8"
+    return response
+
+
+@contextlib.contextmanager
+def replay(path, recorded_latency=False):
+    """
+    Answer requests.get inside the block from the fixture at path.
+
+    Repeated requests for the same key get the recorded responses in order,
+    then the last one again. With recorded_latency, each response is delayed
+    by the time it originally took.
+    """
+    recording = load(path)
+    responses = {}
+    for interaction in recording["interactions"]:
+        responses.setdefault(interaction["key"], []).append(interaction)
+    served = {}
+    lock = threading.Lock()
+    real_get = requests.get
+
+    def replaying_get(url, *args, **kwargs):
+        key = request_key(url)
+        with lock:
+            if key not in responses:
+                raise ReplayMiss(f"No recorded response for {key} in {path}")
+            index = served.get(key, 0)
+            served[key] = index + 1
+        interaction = responses[key][min(index, len(responses[key]) - 1)]
+        if recorded_latency:
+            time.sleep(interaction["elapsed"])
+        return _response(interaction, url)
+
+    requests.get = replaying_get
+    try:
+        yield recording
+    finally:
+        requests.get = real_get
+
+
+def session(record_path=None, replay_path=None, recorded_latency=False):
+    """The record or replay context for command-line options, or a no-op if neither is set."""
+    if record_path and replay_path:
+        raise ValueError("Pass either a recording to write or one to replay, not both")
+    if record_path:
+        return record(record_path)
+    if replay_path:
+        return replay(replay_path, recorded_latency)
+    return contextlib.nullcontext()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import stat
+import tempfile
+from contextlib import contextmanager
+
+'''
+Crash-safe saves for every workbook the scripts write.
+
+A workbook is saved to a temporary file next to its destination, flushed to
+disk with fsync and then renamed over the destination with os.replace. The
+rename is atomic, so a crash or error mid-save leaves the previous file
+intact, and a reader that has the file open (Excel, the collator, a report)
+keeps seeing the old version until it reopens it.
+
+With backup_path, the file being replaced is kept there as a hard link to
+the old version, so taking a backup no longer writes a copy of the file. The
+link only falls back to a copy where the file system cannot link (e.g. the
+backup folder is on another drive).
+'''
+
+
+def _fsync_directory(directory):
+    """Persist a rename on POSIX systems; directories cannot be opened for this on Windows."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _default_mode():
+    # os.umask can only be read by setting it, which changes it for every thread in the
+    # process, so this runs once at import rather than while worker threads are saving
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_DEFAULT_MODE = _default_mode()
+
+
+def _file_mode(path):
+    """Permissions for the new file: those of the file it replaces, otherwise the umask default."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return _DEFAULT_MODE
+
+
+def backup(path, backup_path):
+    """Keep the current version of path at backup_path, as a hard link where possible. Returns backup_path."""
+    os.makedirs(os.path.dirname(os.path.abspath(backup_path)), exist_ok=True)
+    if os.path.lexists(backup_path):
+        os.remove(backup_path)
+    try:
+        os.link(path, backup_path)
+    except OSError:
+        shutil.copy2(path, backup_path)
+    return backup_path
+
+
+@contextmanager
+def replacing(path, backup_path=None):
+    """
+    Yield a temporary path in path's directory to write the new file to. When
+    the block finishes, the file is fsynced, the old file is linked to
+    backup_path if given, and the new one is renamed over path. If the block
+    raises, the temporary file is removed and path is left untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield temp_path
+        with open(temp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.chmod(temp_path, _file_mode(path))
+        if backup_path is not None and os.path.exists(path):
+            backup(path, backup_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def save_workbook(workbook, path, backup_path=None):
+    """workbook.save(path), atomically (see replacing)."""
+    with replacing(path, backup_path) as temp_path:
+        workbook.save(temp_path)
@@ -1,23 +1,29 @@
-import requests
-import pandas as pd
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle, Font, PatternFill
-from openpyxl.formatting.rule import FormulaRule
-from openpyxl.worksheet.datavalidation import DataValidation
 from datetime import datetime, timedelta
 import calendar
-import numpy as np
 import os
-from config import (  # Import settings from config.py
+import atomic_save
+import metrics
+from settings import (  # Import settings from config.py
     POCKETSMITH_API_KEY,
+    POCKETSMITH_API_URL,
     ULTIMATE_AWARDS_CC_ID,
+    DEBIT_ID,
     PEOPLE,
     TRANSACTION_DIRECTORY,
-    RUBY_FILL,
-    JACK_FILL,
-    BOTH_FILL,
+    REFUND_WINDOW_DAYS,
+    REFUND_TOLERANCE_CENTS,
+    DEDUP_WINDOW_DAYS,
+    DEDUP_AMOUNT_TOLERANCE,
+    DEDUP_MIN_SIMILARITY,
+    ensure_directories,
 )
+from checkpoint import FETCHED, Checkpoint
+from reconcile import collapse_pending_duplicates, match_refunds
+from records import Transaction
+from streaming import StoreSink, StreamHistory, run_stream
+from transaction_store import TransactionStore
+# requests, openpyxl and the colour fills are imported inside the functions that
+# use them, so the start date prompt appears without paying for them at startup.
 
 '''
 This program will fetch all credit card debits & credits starting from the date in yyyy-mm-dd format as input and ending with today's date as the end date. It will then parse this data into an excel spreadsheet named 'MMM Week X - 202X.xlsx'. As part of this data, it will leverage built-in categorizations from PocketSmith. 
@@ -70,43 +76,114 @@ def generate_spreadsheet_name(start_date,TRANSACTION_DIRECTORY):
     
     return f"{TRANSACTION_DIRECTORY}{filename}"
 
-# Function to fetch bank feed transactions from PocketSmith API
-def fetch_transactions(start_date=None):
+class FetchError(RuntimeError):
+    """A page request failed, so the transactions fetched so far are incomplete."""
+
+    def __init__(self, page, status_code):
+        super().__init__(f"Error fetching transactions: page {page} returned HTTP {status_code}")
+        self.page = page
+        self.status_code = status_code
+
+# Function to fetch bank feed transactions from PocketSmith API, one page at a time
+def iter_transaction_pages(start_date=None, checkpoint=None):
+    """
+    Yield each page of card transactions as soon as it arrives.
+
+    Stops at the first empty page. A failed request raises FetchError, so a
+    partial fetch is never mistaken for a complete one.
+
+    With a checkpoint.Checkpoint, each page is journaled before it is yielded,
+    and pages journaled by an interrupted run are replayed without
+    requesting them again; fetching carries on from the page after them.
+    Every page is requested up to the checkpoint's "end_date" param, fixed when
+    the run started, so pages requested on resuming line up with the journaled
+    ones; without one the range ends now.
+    """
+    import requests
+
     page = 1
-    all_transactions = []
+    end_date = str(datetime.now())
+    if checkpoint is not None:
+        end_date = checkpoint.params.get("end_date", end_date)
+        journaled = checkpoint.pages()
+        for _, transactions in journaled:
+            yield [Transaction.from_api(tx, ULTIMATE_AWARDS_CC_ID) for tx in transactions]
+        if checkpoint.done(FETCHED):
+            return
+        if journaled:
+            page = journaled[-1][0] + 1
 
     while True:
-        url = f"https://api.pocketsmith.com/v2/accounts/{ULTIMATE_AWARDS_CC_ID}/transactions?page={page}&start_date={start_date}&end_date={datetime.now()}"
+        url = f"{POCKETSMITH_API_URL}/accounts/{ULTIMATE_AWARDS_CC_ID}/transactions?page={page}&start_date={start_date}&end_date={end_date}"
         
         headers = {"accept": "application/json", "X-Developer-Key": POCKETSMITH_API_KEY}
 
         print(f"Fetching transactions from PocketSmith API - Page {page}...")
-        response = requests.get(url, headers=headers)
+        with metrics.timer("http.request", histogram=True):
+            response = requests.get(url, headers=headers)
+        metrics.count("http.bytes", len(response.content))
 
         if response.status_code != 200:
-            #print(f"Error fetching transactions: {response.status_code} {response.text}")
-            return all_transactions
+            raise FetchError(page, response.status_code)
 
         transactions = response.json()
 
         if not transactions:  # If there are no transactions, we stop fetching
+            if checkpoint is not None:
+                checkpoint.mark(FETCHED)
             break
+        if checkpoint is not None:
+            checkpoint.add_page(page, transactions)
         
-        # Parse transactions to match our format
-        for tx in transactions:
-            if tx.get('category') and 'title' in tx['category']:
-                category_title = tx['category']['title']
-            else:
-                category_title = ""
-            all_transactions.append({
-                'date': tx['date'],
-                'description': tx['payee'],
-                'bank_category': category_title,
-                'amount': tx['amount']
-            })
+        # Parse transactions into records
+        metrics.count("card.pages")
+        metrics.count("card.rows", len(transactions))
+        yield [Transaction.from_api(tx, ULTIMATE_AWARDS_CC_ID) for tx in transactions]
 
         page += 1  # Move to the next page for the next iteration
-    return all_transactions
+
+# Function to fetch all bank feed transactions from PocketSmith API
+def fetch_transactions(start_date=None, checkpoint=None):
+    return [tx for page in iter_transaction_pages(start_date, checkpoint) for tx in page]
+
+@metrics.timed("label.collapse")
+def collapse_pending_transactions(transactions, account_id=ULTIMATE_AWARDS_CC_ID, store=None):
+    """
+    Drop pending transactions whose posted twin has arrived, before labelling.
+
+    Pending transactions stored by earlier runs are checked too; those are
+    merged into the posted transaction in the store so it keeps their label and
+    weekly workbook instead of being counted a second time. Prints what was
+    collapsed and returns (remaining transactions, DuplicateMatch list).
+    """
+    if not transactions:
+        return transactions, []
+
+    store = store or TransactionStore()
+    window = timedelta(days=DEDUP_WINDOW_DAYS)
+    window_start = min(tx.date for tx in transactions) - window
+    window_end = max(tx.date for tx in transactions) + window
+    batch_ids = {tx.id for tx in transactions}
+    # Stored posted rows are included too, as a posted twin may have been stored
+    # from an earlier page of the same fetch
+    history = [tx for tx in store.query(account_id=account_id, start_date=window_start, end_date=window_end)
+               if tx.id not in batch_ids]
+
+    kept, duplicates = collapse_pending_duplicates(
+        history + transactions,
+        window_days=DEDUP_WINDOW_DAYS,
+        amount_tolerance=DEDUP_AMOUNT_TOLERANCE,
+        min_similarity=DEDUP_MIN_SIMILARITY,
+    )
+    store.merge_duplicates({match.pending.id: match.posted.id for match in duplicates})
+
+    for match in duplicates:
+        print(f"Collapsed pending {match.pending.date} {match.pending.description} {match.pending.amount:.2f}"
+              f" into posted {match.posted.date} {match.posted.description} {match.posted.amount:.2f}"
+              f" (similarity {match.similarity:.2f})")
+    if duplicates:
+        print(f"Collapsed {len(duplicates)} pending transaction(s) into their posted twins.")
+    return [tx for tx in kept if tx.id in batch_ids], duplicates
 
 
 # Function to auto-label bank categories
@@ -131,35 +208,68 @@ def auto_label_bank_category(bank_category):
     else:
         return "Both"  # Default label for all other categories
 
+# Function to categorize and label a single transaction (in place)
+def label_transaction(tx):
+    # Apply auto-labeling to the bank category
+    tx.label = auto_label_bank_category(tx.bank_category)
+
+    # Example categorization based on description (could use PocketSmith rules here)
+    tx.category = None
+    return tx
+
 # Function to categorize and label transactions
+@metrics.timed("label.categorize")
 def categorize_and_label_transactions(transactions):
-    categorized_transactions = []
-    
-    for tx in transactions:
-        description = tx['description']
-        amount = tx['amount']
-        bank_category = tx['bank_category']
-
-        # Apply auto-labeling to the bank category
-        label = auto_label_bank_category(bank_category)
-
-        # Example categorization based on description (could use PocketSmith rules here)
-        category = None
-        label = label if label else None  # If label is None, keep as is
-
-        # Add transaction with categorization and label
-        categorized_transactions.append({
-            'Date': tx['date'],
-            'Description': description,
-            'Amount': amount,
-            'Category': category,
-            'Bank Category': tx['bank_category'],  # Add bank_category to the data
-            'Label': label
-        })
-    
-    return categorized_transactions
+    metrics.count("label.rows", len(transactions))
+    return [label_transaction(tx) for tx in transactions]
+
+@metrics.timed("label.refunds")
+def apply_refund_labels(categorized_transactions, store=None):
+    """
+    Net refunds out of the split by giving each credit the Category and Label of
+    the purchase it reverses.
+
+    Purchases from earlier weeks are looked up in the transaction store, so a
+    refund is still matched when it lands in a later week than the purchase.
+    Stored refunds dated within the batch are matched too and given the
+    purchase's Category and Label in the store where they have none, so the
+    order pages are streamed in does not matter; labels already set on a
+    stored refund (e.g. in an earlier week's workbook) are kept.
+    Returns the list of matches.
+    """
+    if not categorized_transactions:
+        return []
+
+    store = store or TransactionStore()
+    earliest = min(tx.date for tx in categorized_transactions)
+    window = timedelta(days=REFUND_WINDOW_DAYS)
+    window_end = max(tx.date for tx in categorized_transactions) + window
+    batch_ids = {tx.id for tx in categorized_transactions}
+    history = [tx for tx in store.query(account_id=ULTIMATE_AWARDS_CC_ID, start_date=earliest - window, end_date=window_end)
+               if tx.id not in batch_ids and (tx.amount_cents < 0 or tx.date >= earliest)]
+
+    matches = match_refunds(
+        history + categorized_transactions,
+        window_days=REFUND_WINDOW_DAYS,
+        tolerance_cents=REFUND_TOLERANCE_CENTS,
+    )
+    stored_credits = {}
+    for match in matches:
+        match.credit.category = match.debit.category
+        match.credit.label = match.debit.label
+        if match.credit.id not in batch_ids:
+            stored_credits[match.credit.id] = (match.debit.category, match.debit.label)
+    store.fill_labels(stored_credits)
+
+    if matches:
+        print(f"Matched {len(matches)} refund(s) to their original purchases.")
+    return matches
 
 def add_summary_table(ws, data, last_row):
+    import openpyxl
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from settings import RUBY_FILL, JACK_FILL
+
     # Find the index of "Amount" and "Label" columns dynamically by searching headers
     headers = [cell.value for cell in ws[1]]  # Get all headers from the first row
     
@@ -238,12 +348,46 @@ def add_summary_table(ws, data, last_row):
     print("Summary table added successfully.")
 
 # Function to save data to Excel with formatting, dropdown lists, AutoFit, and borders
-def save_to_excel(data):
+def save_to_excel(data, spreadsheet_path=None):
+    """
+    Write the labelled transactions to a formatted weekly workbook.
 
-    # Remove credits that don't have matching debits
-    # filtered_data, credits = remove_non_matching_credits(data)
+    Saves to spreadsheet_path when given, otherwise to the SPREADSHEET_PATH
+    set by main(). The workbook is returned so in-process callers can reuse
+    it without reloading it from disk.
+    """
+    if spreadsheet_path is None:
+        spreadsheet_path = SPREADSHEET_PATH
+
+    wb = build_weekly_workbook(data)
 
-    # 30th Jan 2025: All credits now included by default
+    # Save the workbook to file
+    ensure_directories()
+    with metrics.timer("workbook.save"):
+        atomic_save.save_workbook(wb, spreadsheet_path)
+    metrics.count("workbook.bytes_written", os.path.getsize(spreadsheet_path))
+    print(f"Data saved to {spreadsheet_path}")
+    return wb
+
+@metrics.timed("weekly.build")
+def build_weekly_workbook(data, week_number=None):
+    """
+    Build the formatted weekly workbook in memory without saving it.
+
+    data is a list of records.Transaction, written in the order given.
+
+    week_number defaults to the current week of the month; pass it explicitly
+    when re-rendering an older week (e.g. from the transaction store).
+    """
+    import openpyxl
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle, PatternFill
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.worksheet.datavalidation import DataValidation
+    from settings import RUBY_FILL, JACK_FILL, BOTH_FILL
+
+    # 30th Jan 2025: All credits now included by default. Refunds are netted out
+    # of the split by apply_refund_labels() instead of being removed.
     filtered_data = data
 
     # Create a new workbook and add a worksheet
@@ -252,7 +396,8 @@ def save_to_excel(data):
     ws.title = "Transactions"
     
     # Add "Week X" above the data table based on the end_date
-    week_number = week_of_month(datetime.now().strftime('%Y-%m-%d'))
+    if week_number is None:
+        week_number = week_of_month(datetime.now().strftime('%Y-%m-%d'))
     week_label = f"Week {week_number}"
 
 
@@ -271,9 +416,10 @@ def save_to_excel(data):
         cell.fill = header_fill
     
     # Add data rows with Amount and Category swapped
-    for row in filtered_data:
+    for tx in filtered_data:
         # Swapping Category and Amount columns: [Date, Description, Amount, Category, Label]
-        ws.append([row['Date'], row['Description'], row['Amount'], row['Category'], row['Bank Category'], row['Label']])
+        ws.append([tx.date, tx.description, tx.amount, tx.category, tx.bank_category, tx.label])
+    metrics.count("cells.written", len(headers) * (len(filtered_data) + 1))
  
     # Create date style
     date_style = NamedStyle(name="date_style", number_format="MM/DD/YYYY")
@@ -314,7 +460,7 @@ def save_to_excel(data):
         label_validation.add(ws[f"F{row}"])
 
     # AutoFit column widths
-    for col in range(1,len(filtered_data[0])):  # Columns A to F (1 to 6)
+    for col in range(1,len(headers)):  # Columns A to F (1 to 6)
         max_length = 0
         column = openpyxl.utils.get_column_letter(col)  # Get column name (A, B, C, etc.)
         
@@ -362,26 +508,101 @@ def save_to_excel(data):
             if cell.row == 1 or (cell.column != 2 and cell.row > 1):  
                 cell.alignment = Alignment(horizontal='center')
 
-
-    # Save the workbook to file
-    wb.save(SPREADSHEET_PATH)
-    print(f"Data saved to {SPREADSHEET_PATH}")
+    return wb
     
+def link_card_transfers(start_date=None, store=None):
+    """
+    Link card credits from start_date onwards with the debit-account payments
+    that made them, so both sides drop out of spend and buckets.
+    Returns the list of TransferMatch pairs linked.
+    """
+    store = store or TransactionStore()
+    matches = store.link_transfers(ULTIMATE_AWARDS_CC_ID, DEBIT_ID, start_date=start_date)
+    if matches:
+        print(f"Linked {len(matches)} transfer(s) between the debit account and the card.")
+    return matches
+
+def save_weekly_transactions(categorized_transactions, spreadsheet_path, store=None, link_transfers=True):
+    """
+    Record the labelled transactions in the transaction store and render the
+    weekly workbook from it.
+
+    A transaction already rendered into an earlier week stays in that week, so
+    overlapping date ranges are not split twice. Card repayments from the
+    debit account are linked as transfers and left out of the split, unless
+    link_transfers is False (e.g. the debit rows could not be fetched).
+    Returns the saved workbook.
+    """
+    store = store or TransactionStore()
+    StoreSink(store, weekly_file=os.path.basename(spreadsheet_path)).write(categorized_transactions)
+    start_date = min((tx.date for tx in categorized_transactions), default=None)
+    return render_weekly_workbook(spreadsheet_path, start_date, store, link_transfers)
+
+def render_weekly_workbook(spreadsheet_path, start_date=None, store=None, link_transfers=True):
+    """
+    Render the weekly workbook from the transactions stored under its name,
+    after linking card repayments from start_date onwards as transfers
+    (unless link_transfers is False).
+
+    The styled workbook (widths, validation, summary table) is built in a
+    normal openpyxl workbook, so every row of the week is held in memory
+    here even though the fetch that stored them streamed page by page.
+    Returns the saved workbook.
+    """
+    store = store or TransactionStore()
+    if link_transfers:
+        link_card_transfers(start_date, store)
+
+    rows = store.query(account_id=ULTIMATE_AWARDS_CC_ID, weekly_file=os.path.basename(spreadsheet_path),
+                       include_transfers=False, newest_first=True)
+    wb = save_to_excel(rows, spreadsheet_path)
+    store.mark_workbook_synced(spreadsheet_path)
+    return wb
+
+def stream_transactions(start_date, sinks, store=None, depth=1, checkpoint=None):
+    """
+    Fetch, label and write card transactions page by page.
+
+    The next page is fetched while the current one is de-duplicated, labelled,
+    matched against refunds and handed to the sinks (see streaming.py), so
+    the fetch's memory use depends on the page size rather than the date
+    range. Rendering the styled weekly workbook afterwards does not stream
+    (see render_weekly_workbook).
+    Pending twins and refunds spanning pages are found through store. With
+    store=None nothing is read from or written to the transaction store, and
+    they are only matched within the stream (see streaming.StreamHistory).
+    With a checkpoint, pages are journaled and an interrupted run is resumed
+    (see iter_transaction_pages).
+    Returns the number of transactions written.
+    """
+    history = None
+    if store is None:
+        store = history = StreamHistory(max(DEDUP_WINDOW_DAYS, REFUND_WINDOW_DAYS))
+
+    def collapse(page):
+        transactions, _ = collapse_pending_transactions(page, store=store)
+        return transactions
+
+    def refunds(rows):
+        apply_refund_labels(rows, store)
+        return rows
+
+    stages = [collapse, categorize_and_label_transactions, refunds]
+    if history is not None:
+        stages.append(history.add)
+    return run_stream(iter_transaction_pages(start_date, checkpoint), stages, sinks, depth=depth)
+
 #@staticmethod
 def week_of_month(date_str):
-    # Set the first weekday to be Monday
-    calendar.setfirstweekday(calendar.MONDAY)
-    
     # Parse the input date string
     date = datetime.strptime(date_str, '%Y-%m-%d')
     year, month, day = date.year, date.month, date.day
     
-    # Create a month calendar array
-    month_calendar = np.array(calendar.monthcalendar(year, month))
+    # Weeks of the month as lists of day numbers, with Monday as the first weekday
+    month_calendar = calendar.Calendar(calendar.MONDAY).monthdayscalendar(year, month)
     
     # Find the week of the month
-    week_of_month = np.where(month_calendar == day)[0][0] + 1
-    return week_of_month
+    return next(week for week, days in enumerate(month_calendar, 1) if day in days)
 
 def get_last_run_date():
     """Get the date when this program was last run."""
@@ -395,6 +616,7 @@ def get_last_run_date():
 
 def save_last_run_date():
     """Save the current date as the last run date."""
+    ensure_directories()
     last_run_file = os.path.join(TRANSACTION_DIRECTORY, 'last_run.txt')
     with open(last_run_file, 'w') as f:
         f.write(datetime.now().strftime('%Y-%m-%d'))
@@ -426,16 +648,34 @@ def main(start_date=None):
     days_span = (end_date_obj - start_date_obj).days + 1
     print(f"\nFetching transactions starting from {start_date_obj.strftime('%dth %B %Y')} to {end_date_obj.strftime('%dth %B %Y')} (spans {days_span} days).")
 
-    transactions = fetch_transactions(start_date)
-    categorized_transactions = categorize_and_label_transactions(transactions)
-    
-    # Generate spreadsheet filename with updated logic
+    # Generate spreadsheet filename with updated logic. A resumed run keeps the
+    # file name of the run it resumes, as the stored rows are filed under it
     global SPREADSHEET_PATH
-    SPREADSHEET_PATH = generate_spreadsheet_name(start_date, TRANSACTION_DIRECTORY)
-    
-    save_to_excel(categorized_transactions)
+    checkpoint = Checkpoint(f"bank_feeds:{ULTIMATE_AWARDS_CC_ID}:{start_date}",
+                            params={"spreadsheet": generate_spreadsheet_name(start_date, TRANSACTION_DIRECTORY),
+                                    "end_date": str(datetime.now())})
+    SPREADSHEET_PATH = checkpoint.params["spreadsheet"]
+    if checkpoint.resumed:
+        print(f"Resuming the interrupted fetch into {os.path.basename(SPREADSHEET_PATH)}.")
+
+    # Stream pages into the store as they arrive, then render the week from it (in memory)
+    store = TransactionStore()
+    if not checkpoint.done("stream"):
+        try:
+            stream_transactions(start_date, [StoreSink(store, weekly_file=os.path.basename(SPREADSHEET_PATH))], store,
+                                checkpoint=checkpoint)
+        except FetchError as e:
+            # Nothing is rendered and the last run date is kept, so the next run resumes here
+            print(f"{e}. Run again with the same start date to resume from the pages fetched so far.")
+            return
+        checkpoint.mark("stream")
+    render_weekly_workbook(SPREADSHEET_PATH, start_date, store)
     save_last_run_date()  # Save the current date as last run date
+    checkpoint.complete()
 
 # Run the main function with a specified start_date for testing
 if __name__ == "__main__":
-    main()
+    import profiling
+    metrics.start("bank_feeds")
+    with profiling.from_command_line("bank_feeds"):
+        main()
@@ -1,52 +1,23 @@
-import requests
 from datetime import datetime, timedelta
-import psycopg2
-from psycopg2 import sql
-from config import (  # Import settings from config.py
-    POCKETSMITH_API_KEY,
+from decimal import Decimal
+import metrics
+from settings import (  # Import settings from config.py
     ULTIMATE_AWARDS_CC_ID,
     PEOPLE,
     DB_CONFIG,
     DAYS_TO_FETCH
 )
+from checkpoint import Checkpoint
+from transaction_store import TransactionStore
+from bank_feeds import FetchError, collapse_pending_transactions, iter_transaction_pages, link_card_transfers
 
 # Function to fetch bank feed transactions from PocketSmith API
-def fetch_transactions(start_date=None):
-    page = 1
-    all_transactions = []
-
-    while True:
-        url = f"https://api.pocketsmith.com/v2/accounts/{ULTIMATE_AWARDS_CC_ID}/transactions?page={page}&start_date={start_date}&end_date={datetime.now()}"
-        
-        headers = {"accept": "application/json", "X-Developer-Key": POCKETSMITH_API_KEY}
-
-        print(f"Fetching transactions from PocketSmith API - Page {page}...")
-        response = requests.get(url, headers=headers)
-
-        if response.status_code != 200:
-            return all_transactions
-
-        transactions = response.json()
-
-        if not transactions:  # If there are no transactions, we stop fetching
-            break
-        
-        # Parse transactions to match our format
-        for tx in transactions:
-            if tx.get('category') and 'title' in tx['category']:
-                category_title = tx['category']['title']
-            else:
-                category_title = ""
-            all_transactions.append({
-                'id': tx['id'],
-                'date': tx['date'],
-                'description': tx['payee'],
-                'bank_category': category_title,
-                'amount': tx['amount']
-            })
-
-        page += 1  # Move to the next page for the next iteration
-    return all_transactions
+def fetch_transactions(start_date=None, checkpoint=None):
+    """
+    Fetch every page of card transactions, raising FetchError if a request fails.
+    With a checkpoint, pages are journaled and an interrupted fetch is resumed.
+    """
+    return [tx for page in iter_transaction_pages(start_date, checkpoint) for tx in page]
 
 # Function to auto-label bank categories
 def auto_label_bank_category(bank_category):
@@ -66,37 +37,34 @@ def auto_label_bank_category(bank_category):
     else:
         return "Both"
 
-# Function to categorize and label transactions
+# Function to categorize and label transactions (in place)
 def categorize_and_label_transactions(transactions):
-    categorized_transactions = []
-    
     for tx in transactions:
-        description = tx['description']
-        amount = tx['amount']
-        bank_category = tx['bank_category']
+        tx.label = auto_label_bank_category(tx.bank_category)
+        tx.category = None
+    return transactions
 
-        label = auto_label_bank_category(bank_category)
-        category = None
-        label = label if label else None
+# Function to insert transactions into PostgreSQL database
+def insert_transactions(transactions, collapsed_ids=()):
+    """
+    Insert new transactions, skipping ids already in the table.
 
-        categorized_transactions.append({
-            'id': tx['id'],
-            'date': tx['date'],
-            'description': description,
-            'amount': amount,
-            'category': category,
-            'bank_category': bank_category,
-            'label': label
-        })
-    
-    return categorized_transactions
+    collapsed_ids are pending transactions whose posted twin is in this batch;
+    any copies inserted by an earlier run are deleted so the spend is not counted twice.
+    Returns True once the transaction is committed.
+    """
+    # Imported here so the fetch can start before the database driver loads
+    import psycopg2
+    from psycopg2 import sql
 
-# Function to insert transactions into PostgreSQL database
-def insert_transactions(transactions):
+    conn = cursor = None
     try:
         conn = psycopg2.connect(**DB_CONFIG)
         cursor = conn.cursor()
 
+        if collapsed_ids:
+            cursor.execute("DELETE FROM shared_transactions WHERE id = ANY(%s)", (list(collapsed_ids),))
+
         for tx in transactions:
             insert_query = sql.SQL("""
                 INSERT INTO shared_transactions (id, date, description, amount, category, bank_category, label)
@@ -104,32 +72,66 @@ def insert_transactions(transactions):
                 ON CONFLICT (id) DO NOTHING
             """)
             cursor.execute(insert_query, (
-                tx['id'],
-                tx['date'],
-                tx['description'],
-                tx['amount'],
-                tx['category'],
-                tx['bank_category'],
-                tx['label']
+                tx.id,
+                tx.date,
+                tx.description,
+                Decimal(tx.amount_cents).scaleb(-2),  # exact, unlike a float
+                tx.category,
+                tx.bank_category,
+                tx.label
             ))
 
         conn.commit()
         print("Transactions inserted successfully.")
+        return True
 
     except Exception as e:
         print(f"Error inserting transactions: {e}")
+        return False
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 # Main function to fetch, categorize, and save transactions
 def main():
-    start_date = (datetime.now() - timedelta(days=DAYS_TO_FETCH)).strftime('%Y-%m-%d')
-    print(f"Fetching transactions starting from {start_date} to {datetime.now().strftime('%Y-%m-%d')} (spans {DAYS_TO_FETCH} days).")
+    # An interrupted backfill is resumed from its journal, keeping its original date range
+    checkpoint = Checkpoint.latest(f"bank_feeds_psql:{ULTIMATE_AWARDS_CC_ID}:")
+    if checkpoint is None:
+        start_date = (datetime.now() - timedelta(days=DAYS_TO_FETCH)).strftime('%Y-%m-%d')
+        checkpoint = Checkpoint(f"bank_feeds_psql:{ULTIMATE_AWARDS_CC_ID}:{start_date}",
+                                params={"start_date": start_date, "end_date": str(datetime.now())})
+    else:
+        start_date = checkpoint.params["start_date"]
+        print(f"Resuming the interrupted fetch from {start_date}.")
+    end_date = checkpoint.params.get("end_date", str(datetime.now()))[:10]
+    days_span = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days
+    print(f"Fetching transactions starting from {start_date} to {end_date} (spans {days_span} days).")
+
+    try:
+        fetched = fetch_transactions(start_date, checkpoint)
+    except FetchError as e:
+        print(f"{e}. Run again to resume from the pages fetched so far.")
+        return
 
-    transactions = fetch_transactions(start_date)
+    store = TransactionStore()
+    transactions, duplicates = collapse_pending_transactions(fetched, store=store)
     categorized_transactions = categorize_and_label_transactions(transactions)
-    insert_transactions(categorized_transactions)
+    if not checkpoint.done("store"):
+        store.upsert_transactions(ULTIMATE_AWARDS_CC_ID, categorized_transactions)
+        checkpoint.mark("store")
+
+    # Card repayments from the debit account are not shared spend
+    transfers = {match.incoming.id for match in link_card_transfers(start_date, store)}
+    transfers.update(tx.id for tx in store.query(account_id=ULTIMATE_AWARDS_CC_ID, start_date=start_date)
+                     if tx.transfer_id is not None)
+    shared_transactions = [tx for tx in categorized_transactions if tx.id not in transfers]
+    if insert_transactions(shared_transactions, [match.pending.id for match in duplicates]):
+        checkpoint.complete()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import profiling
+    metrics.start("bank_feeds_psql")
+    with profiling.from_command_line("bank_feeds_psql"):
+        main()
\ No newline at end of file
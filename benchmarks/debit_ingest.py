@@ -0,0 +1,110 @@
+"""
+Benchmark for reading new rows from the Debit Transactions file.
+
+Writes a newest-first debit workbook of each size (as updateMyBuckets does)
+and compares BudgetUpdater._read_debit_rows, which streams the sheet in
+read-only mode and stops at the Jacks Buckets watermark, with the previous
+approach of loading the whole workbook and looking up A/B/C cells per row.
+The watermark is set so that --new-days of transactions are new.
+
+Usage:
+    python benchmarks/debit_ingest.py [--sizes 5000,20000,80000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from end_to_end import REPO_ROOT, write_scratch_config  # noqa: E402
+from synthetic import generate_transactions  # noqa: E402
+
+
+def write_debit_workbook(path, transactions):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Debit Transactions")
+    ws.append(["Date", "Description", "Amount", "Category"])
+    for tx in sorted(transactions, key=lambda tx: tx.date, reverse=True):
+        ws.append([tx.date, tx.description, tx.amount, tx.bank_category])
+    wb.save(path)
+
+
+def full_load_rows(path):
+    """The previous reader: load every cell, then index A/B/C row by row."""
+    from openpyxl import load_workbook
+
+    sheet = load_workbook(path).active
+    rows = []
+    for row in range(2, sheet.max_row + 1):
+        values = [sheet[f"{col}{row}"].value for col in ("A", "B", "C")]
+        if values[0] is not None:
+            rows.append(values)
+    return rows
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, round(seconds, 4), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Debit Transactions ingest benchmark")
+    parser.add_argument("--sizes", default="5000,20000,80000", help="Comma-separated debit row counts")
+    parser.add_argument("--new-days", type=int, default=7, help="Days of transactions newer than the watermark")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    sys.path[:0] = [write_scratch_config(workdir, ["Jack", "Ruby"]), REPO_ROOT]
+    from settings import TRANSACTION_DIRECTORY
+    from BudgetUpdater import BudgetUpdater
+
+    os.makedirs(TRANSACTION_DIRECTORY, exist_ok=True)
+    updater = BudgetUpdater.__new__(BudgetUpdater)  # Skips loading the summary .xlsm
+    updater.verbose = False
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        days = max(size // 50, 30)  # ~50 debit transactions a day
+        start = date.today() - timedelta(days=days)
+        path = os.path.join(TRANSACTION_DIRECTORY, f"Debit Transactions {date.today().year}.xlsx")
+        write_debit_workbook(path, generate_transactions(size, seed=size, start=start, days=days + 1))
+        watermark = datetime.combine(date.today() - timedelta(days=args.new_days), datetime.min.time())
+
+        old_rows, old_seconds, old_peak = measure(lambda: full_load_rows(path))
+        new_rows, new_seconds, new_peak = measure(lambda: updater._read_debit_rows(since=watermark))
+        result = {
+            "rows": size,
+            "new_rows": len(new_rows),
+            "full_load_seconds": old_seconds,
+            "full_load_peak_bytes": old_peak,
+            "streaming_seconds": new_seconds,
+            "streaming_peak_bytes": new_peak,
+            "speedup": round(old_seconds / new_seconds, 1) if new_seconds else None,
+        }
+        assert len(old_rows) == size
+        results.append(result)
+        print("  ".join(f"{key}={value}" for key, value in result.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+End-to-end benchmark of the weekly run on synthetic data.
+
+For each size, generates a deterministic year-to-date set of card and debit
+transactions plus a fake summary .xlsm in a scratch directory, then times
+each stage the way the scripts run it:
+
+- fetch_card / fetch_debit: bank_feeds and updateMyBuckets fetching the
+  synthetic rows over HTTP from fake_pocketsmith.py, with optional latency
+- label: pending collapse, auto-labelling and refund matching
+- weekly_export: one weekly workbook per week via save_weekly_transactions
+- collate: SpreadsheetCollator building the monthly spend workbook
+- budget_update: BudgetUpdater on the fake .xlsm, including the debit export
+
+Each run happens in a fresh interpreter against a throwaway config.py, so
+real spreadsheets are never touched. With --repeat, the fastest time of each
+stage is kept. Results are written as JSON tagged with the git commit; pass
+--compare with an earlier results file to see which stages got slower.
+
+Usage:
+    python benchmarks/end_to_end.py [--sizes 500,2000,8000] [--json out.json]
+    python benchmarks/end_to_end.py --compare benchmarks/results/end_to_end.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+STAGES = ["fetch_card", "fetch_debit", "label", "weekly_export", "collate", "budget_update"]
+
+
+def week_files(transactions, year):
+    """Group transactions by Monday-start week into {weekly file name: rows}."""
+    from bank_feeds import week_of_month
+
+    weeks = {}
+    for tx in transactions:
+        monday = tx.date - timedelta(days=tx.date.weekday())
+        weeks.setdefault(max(monday, date(year, 1, 1)), []).append(tx)
+    files = {}
+    for start, rows in sorted(weeks.items()):
+        end = min(start + timedelta(days=6), date(year, 12, 31))
+        week = week_of_month(end.isoformat())
+        files[f"{start:%d}-{end:%d} {end:%b} Week {week} - {year}.xlsx"] = rows
+    return files
+
+
+def run_worker(args):
+    """Run every stage once in this (fresh) interpreter and return the timings."""
+    from fake_pocketsmith import FakePocketSmith
+    from synthetic import generate_transactions, make_categories, to_api, write_summary_workbook
+
+    import settings
+    from settings import DEBIT_ID, SPREADSHEET_DIRECTORY, SUMMARY_FILE, TRANSACTION_DIRECTORY, ULTIMATE_AWARDS_CC_ID
+
+    today = date.today()
+    start = date(settings.CURRENT_YEAR, 1, 1)
+    days = (today - start).days + 1
+    categories = make_categories(args.categories)
+    card = generate_transactions(args.rows, seed=args.rows, start=start, days=days,
+                                 account_id=ULTIMATE_AWARDS_CC_ID, refund_rate=args.refund_rate,
+                                 categories=categories)
+    debit = generate_transactions(args.debit_rows, seed=args.rows + 1, start=start, days=days,
+                                  account_id=DEBIT_ID, id_start=args.rows + 1, categories=categories)
+    settings.ensure_directories()
+    write_summary_workbook(os.path.join(SPREADSHEET_DIRECTORY, SUMMARY_FILE), settings.CURRENT_YEAR,
+                           start - timedelta(days=1))
+
+    timings = {}
+    output = io.StringIO()
+
+    @contextlib.contextmanager
+    def stage(name):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+            yield
+        timings[name] = time.perf_counter() - started
+
+    server = FakePocketSmith({ULTIMATE_AWARDS_CC_ID: [to_api(tx) for tx in card],
+                              DEBIT_ID: [to_api(tx) for tx in debit]},
+                             page_size=args.page_size, latency=args.latency)
+    settings.POCKETSMITH_API_URL = server.base_url  # Before the scripts import it
+
+    import bank_feeds
+    import updateMyBuckets
+    from BudgetUpdater import BudgetUpdater
+    from collate_spreadsheets import SpreadsheetCollator
+    from transaction_store import TransactionStore
+
+    store = TransactionStore()
+    fetcher = updateMyBuckets.updateMyBuckets()
+    with server:
+        with stage("fetch_card"):
+            transactions = bank_feeds.fetch_transactions(start.isoformat())
+        card_requests = server.stats["ok"]
+        with stage("fetch_debit"):
+            fetcher.format_transaction_data(fetcher.fetch_transactions())
+    # updateMyBuckets only asks for the first page, as it does against the
+    # real API, so the budget update is given the whole synthetic debit set
+    debit_rows = fetcher.format_transaction_data([to_api(tx) for tx in debit])
+    with stage("label"):
+        transactions, _ = bank_feeds.collapse_pending_transactions(transactions, store=store)
+        labelled = bank_feeds.categorize_and_label_transactions(transactions)
+        bank_feeds.apply_refund_labels(labelled, store)
+    files = week_files(labelled, settings.CURRENT_YEAR)
+    with stage("weekly_export"):
+        for name, rows in files.items():
+            bank_feeds.save_weekly_transactions(rows, os.path.join(TRANSACTION_DIRECTORY, name), store)
+    with stage("collate"):
+        SpreadsheetCollator(verbose=False).collate_monthly_spreadsheets(store=store)
+    with stage("budget_update"):
+        updater = BudgetUpdater(verbose=False)
+        updater.run_all_updates(debit_rows)
+        updater.save_workbook()
+
+    return {
+        "stages": {name: round(seconds, 4) for name, seconds in timings.items()},
+        "counts": {
+            "card_rows": len(card),
+            "debit_rows": len(debit),
+            "card_pages": card_requests,
+            "weekly_files": len(files),
+        },
+    }
+
+
+def write_scratch_config(workdir, people):
+    """Generate a config.py pointing at a scratch spreadsheet directory."""
+    with open(os.path.join(REPO_ROOT, "config_template.py")) as f:
+        template = f.read()
+    spreadsheet_dir = os.path.join(workdir, "spreadsheets") + os.sep
+    config_dir = os.path.join(workdir, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.py"), "w") as f:
+        f.write(template.replace("your/path/here", spreadsheet_dir.replace("\\", "/")))
+        f.write(f"\nPEOPLE = {people!r}\n")
+    return config_dir
+
+
+def run_once(args, rows):
+    """Run the worker for one size in a fresh interpreter and scratch directory."""
+    with tempfile.TemporaryDirectory() as workdir:
+        config_dir = write_scratch_config(workdir, args.people.split(","))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([config_dir, REPO_ROOT, BENCH_DIR]))
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--rows", str(rows),
+                   "--debit-rows", str(args.debit_rows or max(rows // 4, 1)),
+                   "--categories", str(args.categories), "--page-size", str(args.page_size),
+                   "--refund-rate", str(args.refund_rate), "--latency", str(args.latency)]
+        if args.verbose:
+            command.append("--verbose")
+        result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"worker failed for {rows} rows:\n{result.stderr}")
+        *output, summary = result.stdout.strip().splitlines()
+        if args.verbose:
+            print("\n".join(output))
+        return json.loads(summary)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print each stage's time against the same size in an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {run["rows"]: run["stages"] for run in baseline["runs"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for run in results["runs"]:
+        before = previous.get(run["rows"])
+        if not before:
+            continue
+        deltas = "  ".join(f"{name}={run['stages'][name] / before[name]:.2f}x"
+                           for name in STAGES if before.get(name))
+        print(f"rows={run['rows']:<7} {deltas}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the weekly run")
+    parser.add_argument("--sizes", default="500,2000,8000", help="Comma-separated card row counts")
+    parser.add_argument("--debit-rows", type=int, help="Debit rows per size (default: a quarter of the card rows)")
+    parser.add_argument("--categories", type=int, default=12, help="Number of distinct bank categories")
+    parser.add_argument("--people", default="Jack,Ruby", help="Comma-separated people to split between")
+    parser.add_argument("--page-size", type=int, default=100, help="Transactions per fake API page")
+    parser.add_argument("--refund-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake API waits per request")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per size; the fastest time per stage is kept")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the scripts' output")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return None
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"categories": args.categories, "people": args.people, "page_size": args.page_size,
+                     "refund_rate": args.refund_rate, "latency": args.latency, "repeat": args.repeat},
+        "runs": [],
+    }
+    for rows in (int(value) for value in args.sizes.split(",")):
+        runs = [run_once(args, rows) for _ in range(args.repeat)]
+        stages = {name: min(run["stages"][name] for run in runs) for name in STAGES}
+        stages["total"] = round(sum(stages.values()), 4)
+        results["runs"].append({"rows": rows, "stages": stages, "counts": runs[0]["counts"]})
+        print(f"rows={rows:<7} " + "  ".join(f"{name}={seconds:.3f}s" for name, seconds in stages.items()))
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark for reconcile.match_refunds on refund-heavy synthetic card data.
+
+Times the hash-join matcher at growing sizes to show it stays linear, and a
+naive all-pairs matcher at the small sizes for comparison.
+
+Usage:
+    python benchmarks/reconcile_refunds.py [--sizes 10000,50000,200000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from reconcile import match_refunds, normalise_payee  # noqa: E402
+from synthetic import generate_transactions  # noqa: E402
+
+NAIVE_LIMIT = 8000  # All-pairs matching gets too slow to time beyond this
+
+
+def naive_match(transactions, window_days):
+    """Quadratic reference: compare every credit with every debit."""
+    used, matches = set(), 0
+    for credit in transactions:
+        if credit.amount_cents <= 0:
+            continue
+        best = None
+        for index, debit in enumerate(transactions):
+            if debit.amount_cents >= 0 or index in used:
+                continue
+            days = (credit.date - debit.date).days
+            if (0 <= days <= window_days and -debit.amount_cents == credit.amount_cents
+                    and normalise_payee(debit.description) == normalise_payee(credit.description)):
+                if best is None or days < best[1]:
+                    best = (index, days)
+        if best is not None:
+            used.add(best[0])
+            matches += 1
+    return matches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refund reconciliation benchmark")
+    parser.add_argument("--sizes", default="1000,4000,25000,100000,365000",
+                        help="Comma-separated row counts (365000 is ~1000 card rows a day for a year)")
+    parser.add_argument("--refund-rate", type=float, default=0.3)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        transactions = generate_transactions(size, seed=size, refund_rate=args.refund_rate)
+        start = time.perf_counter()
+        matches = match_refunds(transactions, window_days=60)
+        elapsed = time.perf_counter() - start
+        result = {
+            "rows": size,
+            "matches": len(matches),
+            "seconds": round(elapsed, 4),
+            "us_per_row": round(elapsed / size * 1e6, 2),
+        }
+        if size <= NAIVE_LIMIT:
+            start = time.perf_counter()
+            result["naive_matches"] = naive_match(transactions, 60)
+            result["naive_seconds"] = round(time.perf_counter() - start, 4)
+        results.append(result)
+        print("  ".join(f"{key}={value}" for key, value in result.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"refund_rate": args.refund_rate, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
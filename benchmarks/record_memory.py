@@ -0,0 +1,122 @@
+"""
+Memory and summing benchmark: per-row dicts versus records.Transaction.
+
+Builds the same synthetic rows twice with tracemalloc running: once as the
+dicts the scripts used to pass around (string dates, float dollar amounts)
+and once as __slots__ records with date objects and integer cents. Also
+times summing the amounts and shows the float drift that cents avoid.
+container_bytes is the size of one row object without the values it holds;
+the totals include the values, where the unique description strings dominate.
+
+Usage:
+    python benchmarks/record_memory.py [--rows 1000000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from records import Transaction  # noqa: E402
+from synthetic import CATEGORIES, PAYEES  # noqa: E402
+
+START = date(2024, 1, 1)
+
+
+def raw_rows(count, seed=0):
+    """Yield (id, date, description, cents, bank_category, label) tuples."""
+    rnd = random.Random(seed)
+    labels = ["Jack", "Ruby", "Both", None]
+    for index in range(count):
+        yield (index, START + timedelta(days=rnd.randrange(365)),
+               f"{rnd.choice(PAYEES)} {rnd.randrange(1000, 9999)}", -rnd.randrange(1, 40000),
+               rnd.choice(CATEGORIES), rnd.choice(labels))
+
+
+def as_dict(row):
+    tx_id, tx_date, description, cents, bank_category, label = row
+    return {
+        'id': tx_id,
+        'Date': tx_date.isoformat(),
+        'Description': description,
+        'Amount': cents / 100,
+        'Category': None,
+        'Bank Category': bank_category,
+        'Label': label,
+        'Status': 'posted',
+    }
+
+
+def as_record(row):
+    tx_id, tx_date, description, cents, bank_category, label = row
+    return Transaction(tx_id, tx_date, description, cents, bank_category=bank_category,
+                       label=label, status='posted')
+
+
+def measure(build, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = [build(row) for row in raw_rows(count)]
+    build_seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, current, peak, build_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transaction record memory benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {"rows": args.rows}
+    exact_cents = sum(row[3] for row in raw_rows(args.rows))
+
+    dicts, current, peak, build_seconds = measure(as_dict, args.rows)
+    start = time.perf_counter()
+    float_total = sum(row['Amount'] for row in dicts)
+    results["dict"] = {
+        "container_bytes": sys.getsizeof(dicts[0]),
+        "bytes": current,
+        "bytes_per_row": round(current / args.rows, 1),
+        "peak_bytes": peak,
+        "build_seconds": round(build_seconds, 3),
+        "sum_seconds": round(time.perf_counter() - start, 4),
+        "sum_drift_cents": round(float_total * 100 - exact_cents, 4),
+    }
+    del dicts
+
+    records, current, peak, build_seconds = measure(as_record, args.rows)
+    start = time.perf_counter()
+    cents_total = sum(tx.amount_cents for tx in records)
+    results["record"] = {
+        "container_bytes": sys.getsizeof(records[0]),
+        "bytes": current,
+        "bytes_per_row": round(current / args.rows, 1),
+        "peak_bytes": peak,
+        "build_seconds": round(build_seconds, 3),
+        "sum_seconds": round(time.perf_counter() - start, 4),
+        "sum_drift_cents": cents_total - exact_cents,
+    }
+    del records
+
+    results["memory_ratio"] = round(results["dict"]["bytes"] / results["record"]["bytes"], 2)
+    for kind in ("dict", "record"):
+        print(f"{kind:<7} " + "  ".join(f"{key}={value}" for key, value in results[kind].items()))
+    print(f"dicts use {results['memory_ratio']}x the memory of records")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
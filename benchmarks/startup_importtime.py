@@ -0,0 +1,115 @@
+"""
+Startup-time audit for every entry point.
+
+Imports each entry-point module in a fresh interpreter under ``-X importtime``
+and records the total import time plus the heaviest top-level imports. Runs
+against a throwaway config.py (generated from config_template.py) unless the
+repository already has one.
+
+Usage:
+    python benchmarks/startup_importtime.py
+    python benchmarks/startup_importtime.py --repo /path/to/other/checkout --json out.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ENTRY_POINTS = [
+    "run_programs",
+    "bank_feeds",
+    "bank_feeds_psql",
+    "updateMyBuckets",
+    "collate_spreadsheets",
+    "BudgetUpdater",
+]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_scratch_config(repo, workdir):
+    """Generate a config.py pointing at a scratch directory so imports never touch real data."""
+    with open(os.path.join(repo, "config_template.py")) as f:
+        template = f.read()
+    spreadsheet_dir = os.path.join(workdir, "spreadsheets") + os.sep
+    config_dir = os.path.join(workdir, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.py"), "w") as f:
+        f.write(template.replace("your/path/here", spreadsheet_dir.replace("\\", "/")))
+    return config_dir
+
+
+def parse_importtime(stderr, module):
+    """Return (cumulative microseconds for module, {direct child import: cumulative microseconds})."""
+    total, children = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Imports are indented under their parent: column 0 is the entry module, 2 spaces its children
+        indent = len(name) - len(name.lstrip()) - 1
+        if indent == 0 and name.strip() == module:
+            total = int(cumulative)
+        elif indent == 2:
+            children[name.strip()] = int(cumulative)
+    return total, children
+
+
+def measure(module, repo, config_dir, runs):
+    """Import module in `runs` fresh interpreters and summarise the results."""
+    env = dict(os.environ)
+    paths = [repo] if os.path.exists(os.path.join(repo, "config.py")) else [config_dir, repo]
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    totals = []
+
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             f"import {module}"],
+            cwd=config_dir, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        total, children = parse_importtime(result.stderr, module)
+        totals.append(total)
+
+    top = sorted(children.items(), key=lambda item: item[1], reverse=True)[:8]
+
+    return {
+        "import_ms_median": round(statistics.median(totals) / 1000, 1),
+        "heaviest_imports_ms": {name: round(us / 1000, 1) for name, us in top},
+        "runs": runs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repo", default=REPO_ROOT, help="Checkout to measure (default: this one)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        config_dir = write_scratch_config(args.repo, workdir)
+        for module in ENTRY_POINTS:
+            if not os.path.exists(os.path.join(args.repo, f"{module}.py")):
+                continue
+            try:
+                results[module] = measure(module, args.repo, config_dir, args.runs)
+            except RuntimeError as e:
+                print(f"Skipping {module}: {e}")
+                continue
+            print(f"{module:<22} {results[module]['import_ms_median']:>8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "entry_points": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Deterministic synthetic transaction generator for benchmarks.
+
+Produces records.Transaction rows. The same arguments always give the same data.
+"""
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Transaction  # noqa: E402
+
+PAYEES = [
+    "Woolworths Metro", "Coles Supermarket", "Aldi Stores", "Amazon AU Marketplace",
+    "Uber Eats Sydney", "Shell Coles Express", "Netflix Com", "Spotify Premium",
+    "JB Hi Fi Online", "Bunnings Warehouse", "Chemist Warehouse", "Kmart Australia",
+    "Qantas Airways", "Airbnb Payments", "Origin Energy", "Sydney Water",
+    "Telstra Mobile", "Anytime Fitness", "Dan Murphys", "Officeworks",
+]
+CATEGORIES = [
+    "Groceries", "Dining", "Fuel", "Bills", "Subscription", "Home", "Travel",
+    "Personal Care", "Entertainment/Recreation", "Gym", "Medical", "Gifts",
+]
+
+
+def generate_transactions(count, seed=0, start=date(2024, 1, 1), days=365, account_id="CC",
+                          refund_rate=0.0, id_start=1, people=("Jack", "Ruby"),
+                          payees=PAYEES, categories=CATEGORIES):
+    """
+    Generate `count` transactions spread over `days` days from `start`.
+
+    refund_rate is the fraction of purchases that get a matching refund
+    ("REFUND <payee>", same amount) 0-30 days later; refunds count toward `count`.
+    """
+    rnd = random.Random(seed)
+    labels = list(people) + ["Both", None]
+    transactions = []
+    next_id = id_start
+    while len(transactions) < count:
+        tx_date = start + timedelta(days=rnd.randrange(days))
+        payee = rnd.choice(payees)
+        amount_cents = -rnd.randrange(200, 40000)
+        purchase = Transaction(
+            id=next_id,
+            date=tx_date,
+            description=f"{payee} {rnd.randrange(1000, 9999)}",
+            amount_cents=amount_cents,
+            account_id=account_id,
+            bank_category=rnd.choice(categories),
+            label=rnd.choice(labels),
+        )
+        transactions.append(purchase)
+        next_id += 1
+
+        if len(transactions) < count and rnd.random() < refund_rate:
+            transactions.append(Transaction(
+                id=next_id,
+                date=tx_date + timedelta(days=rnd.randrange(31)),
+                description=f"REFUND {payee}",
+                amount_cents=-amount_cents,
+                account_id=account_id,
+                bank_category=purchase.bank_category,
+                label=purchase.label,
+            ))
+            next_id += 1
+    return transactions
+
+
+def make_categories(count):
+    """Return `count` bank category names, padding CATEGORIES with numbered ones."""
+    return CATEGORIES[:count] + [f"Category {index}" for index in range(len(CATEGORIES) + 1, count + 1)]
+
+
+def to_api(tx):
+    """Return tx shaped like a transaction from the PocketSmith API."""
+    return {
+        "id": tx.id,
+        "date": tx.date.isoformat(),
+        "payee": tx.description,
+        "amount": tx.amount,
+        "status": tx.status or "posted",
+        "category": {"title": tx.bank_category} if tx.bank_category else None,
+    }
+
+
+def write_summary_workbook(path, year, buckets_since):
+    """
+    Write a fake summary .xlsm with the sheets BudgetUpdater edits.
+
+    Budget holds formulas pointing at last month's sheet of the monthly spend
+    workbook, Total Balance has a formula row per month of `year`, and Jacks
+    Buckets has a header and one row dated `buckets_since`, so every debit
+    transaction after it is new.
+    """
+    from openpyxl import Workbook
+
+    months = ["January", "February", "March", "April", "May", "June", "July",
+              "August", "September", "October", "November", "December"]
+    wb = Workbook()
+    budget = wb.active
+    budget.title = "Budget"
+    budget.append(["Category", "Spend"])
+    for row, category in enumerate(CATEGORIES, start=2):
+        budget.append([category, f"=SUMIF('[{year} Monthly Spend.xlsx]{months[0]}'!D:D,A{row},'[{year} Monthly Spend.xlsx]{months[0]}'!C:C)"])
+
+    balance = wb.create_sheet("Total Balance")
+    balance.append(["Month", "Balance", "Saved"])
+    for month in range(1, 13):
+        row = month + 1
+        balance.append([datetime(year, month, 1), f"=C{row}*2", 100 * month])
+
+    buckets = wb.create_sheet("Jacks Buckets")
+    buckets.append(["Date", "Description", "Category", "Amount"])
+    buckets.append([datetime.combine(buckets_since, datetime.min.time()), "Opening balance", "Salary", 0])
+    wb.save(path)
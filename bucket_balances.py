@@ -0,0 +1,232 @@
+import re
+from datetime import date, datetime
+
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.utils import get_column_letter, quote_sheetname
+from records import parse_date, to_cents
+
+'''
+Running Jacks Buckets balances, kept in a hidden sheet of the summary workbook.
+
+Instead of SUMIFs that scan the whole Jacks Buckets column on every
+recalculation, BudgetUpdater folds the rows it appends into per-category
+totals and a monthly rollup, stored in the "Bucket Balances" sheet:
+
+- A1:D1   the last Jacks Buckets row already counted and a key of that row
+- A3:D*   Category | Balance | Transactions | Last Date, one row per category
+- G3:*    Month | one column per category, with that month's net amount
+
+Each category balance gets a workbook name, Bucket_<Category> (e.g.
+=Bucket_Salary), and the rollup is named BucketMonthly, so formulas read a
+single cell instead of scanning. Categories keep their first-seen position so
+those cells stay put between runs.
+
+Only rows after the recorded one are read on each run. If that row no longer
+holds the same transaction (rows were deleted, sorted or edited above it),
+the totals are rebuilt from the whole sheet; deleting the Bucket Balances
+sheet forces the same.
+'''
+
+SHEET_NAME = "Bucket Balances"
+NAME_PREFIX = "Bucket_"
+MONTHLY_NAME = "BucketMonthly"
+UNCATEGORISED = "Uncategorised"
+HEADER_ROW = 3
+MONTH_COLUMN = 7  # G
+CURRENCY_FORMAT = '"$"#,##0.00_);[Red]("$"#,##0.00)'
+DATE_FORMAT = 'D/MM/YYYY'
+MONTH_FORMAT = 'MMM YYYY'
+
+_NAME_CHARS = re.compile(r"[^A-Za-z0-9_]+")
+
+
+def _row_date(value):
+    """A Jacks Buckets date cell as a date: a datetime, or a 'DD/MM/YYYY' or ISO string."""
+    if isinstance(value, (date, datetime)):
+        return parse_date(value)
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value.strip(), "%d/%m/%Y").date()
+        except ValueError:
+            return parse_date(value)
+    raise TypeError(f"Not a date: {value!r}")
+
+
+def row_key(values):
+    """
+    Identifies a Jacks Buckets row by its date, category and amount, to spot
+    edits above the watermark. Dates and amounts are normalised, as a row
+    appended as a date and a float reads back from the saved workbook as a
+    datetime; values that do not parse are kept as they are.
+    """
+    day, _, category, amount = (tuple(values) + (None,) * 4)[:4]
+    try:
+        day = _row_date(day).isoformat()
+    except (TypeError, ValueError):
+        pass
+    try:
+        amount = to_cents(amount)
+    except (TypeError, ValueError):
+        pass
+    return f"{day}|{category}|{amount}"
+
+
+def balance_name(category):
+    """Workbook name for a category balance, e.g. 'Data Annotation' -> 'Bucket_Data_Annotation'."""
+    return NAME_PREFIX + _NAME_CHARS.sub("_", str(category)).strip("_")
+
+
+def balance_names(categories):
+    """
+    Workbook names for categories, in order, as {category: name}.
+
+    Categories differing only in punctuation, spaces or case (Excel names
+    ignore case) would share a balance_name, so later ones get a numbered
+    suffix, e.g. 'Data-Annotation' then 'Data Annotation' ->
+    Bucket_Data_Annotation and Bucket_Data_Annotation_2. Categories keep their
+    first-seen order, so a name does not move to another category between runs.
+    """
+    names, used = {}, set()
+    for category in categories:
+        base = name = balance_name(category)
+        suffix = 1
+        while name.casefold() in used:
+            suffix += 1
+            name = f"{base}_{suffix}"
+        names[category] = name
+        used.add(name.casefold())
+    return names
+
+
+class BucketBalances:
+    """Per-category totals and monthly rollups of Jacks Buckets, in cents."""
+
+    def __init__(self):
+        self.through_row = 1  # Row 1 of Jacks Buckets is the header
+        self.last_key = None
+        self.totals = {}  # category -> cents, in first-seen order
+        self.counts = {}
+        self.last_dates = {}
+        self.months = {}  # first of month -> {category: cents}
+
+    def add(self, day, category, amount_cents):
+        category = category or UNCATEGORISED
+        self.totals[category] = self.totals.get(category, 0) + amount_cents
+        self.counts[category] = self.counts.get(category, 0) + 1
+        if category not in self.last_dates or day > self.last_dates[category]:
+            self.last_dates[category] = day
+        month = self.months.setdefault(day.replace(day=1), {})
+        month[category] = month.get(category, 0) + amount_cents
+
+    def matches(self, bucket_sheet):
+        """Whether the rows counted so far are still the first through_row rows of bucket_sheet."""
+        if self.through_row > bucket_sheet.max_row:
+            return False
+        if self.through_row < 2:
+            return True
+        values = next(bucket_sheet.iter_rows(min_row=self.through_row, max_row=self.through_row,
+                                             max_col=4, values_only=True))
+        return row_key(values) == self.last_key
+
+    def add_rows(self, bucket_sheet):
+        """Folds the Jacks Buckets rows after through_row into the totals and returns how many were counted."""
+        added = 0
+        last_row = bucket_sheet.max_row
+        if last_row <= self.through_row:
+            return 0
+        values = None
+        for values in bucket_sheet.iter_rows(min_row=self.through_row + 1, max_row=last_row,
+                                             max_col=4, values_only=True):
+            date_value, _, category, amount = (tuple(values) + (None,) * 4)[:4]
+            try:
+                self.add(_row_date(date_value), category, to_cents(amount))
+            except (TypeError, ValueError):
+                continue  # Blank, header-like or non-numeric rows
+            added += 1
+        self.through_row = last_row
+        self.last_key = row_key(values)
+        return added
+
+    @classmethod
+    def load(cls, workbook):
+        """Read the balances from the workbook's Bucket Balances sheet, or None if it has none."""
+        if SHEET_NAME not in workbook.sheetnames:
+            return None
+        sheet = workbook[SHEET_NAME]
+        balances = cls()
+        try:
+            balances.through_row = int(sheet.cell(row=1, column=2).value)
+        except (TypeError, ValueError):
+            return None
+        balances.last_key = sheet.cell(row=1, column=4).value
+
+        for category, balance, count, last_date in sheet.iter_rows(min_row=HEADER_ROW + 1, max_col=4,
+                                                                   values_only=True):
+            if category is None:
+                break
+            balances.totals[category] = to_cents(balance or 0)
+            balances.counts[category] = int(count or 0)
+            if last_date is not None:
+                balances.last_dates[category] = parse_date(last_date)
+
+        header = next(sheet.iter_rows(min_row=HEADER_ROW, max_row=HEADER_ROW, min_col=MONTH_COLUMN + 1,
+                                      values_only=True), ())
+        categories = [category for category in header if category is not None]
+        for values in sheet.iter_rows(min_row=HEADER_ROW + 1, min_col=MONTH_COLUMN,
+                                      max_col=MONTH_COLUMN + len(categories), values_only=True):
+            if values[0] is None:
+                break
+            balances.months[parse_date(values[0])] = {category: to_cents(amount)
+                                                      for category, amount in zip(categories, values[1:])
+                                                      if amount}
+        return balances
+
+    def write(self, workbook):
+        """Write the balances to the hidden Bucket Balances sheet and point the workbook names at them."""
+        if SHEET_NAME in workbook.sheetnames:
+            sheet = workbook[SHEET_NAME]
+            for row in sheet.iter_rows():
+                for cell in row:
+                    cell.value = None
+        else:
+            sheet = workbook.create_sheet(SHEET_NAME)
+        sheet.sheet_state = "hidden"
+
+        sheet.cell(row=1, column=1, value="Through Row")
+        sheet.cell(row=1, column=2, value=self.through_row)
+        sheet.cell(row=1, column=3, value="Row Key")
+        sheet.cell(row=1, column=4, value=self.last_key)
+
+        for column, title in enumerate(("Category", "Balance", "Transactions", "Last Date"), start=1):
+            sheet.cell(row=HEADER_ROW, column=column, value=title)
+        categories = list(self.totals)
+        for row, category in enumerate(categories, start=HEADER_ROW + 1):
+            sheet.cell(row=row, column=1, value=category)
+            sheet.cell(row=row, column=2, value=self.totals[category] / 100).number_format = CURRENCY_FORMAT
+            sheet.cell(row=row, column=3, value=self.counts[category])
+            sheet.cell(row=row, column=4, value=self.last_dates.get(category)).number_format = DATE_FORMAT
+
+        sheet.cell(row=HEADER_ROW, column=MONTH_COLUMN, value="Month")
+        for offset, category in enumerate(categories, start=1):
+            sheet.cell(row=HEADER_ROW, column=MONTH_COLUMN + offset, value=category)
+        months = sorted(self.months)
+        for row, month in enumerate(months, start=HEADER_ROW + 1):
+            sheet.cell(row=row, column=MONTH_COLUMN, value=month).number_format = MONTH_FORMAT
+            for offset, category in enumerate(categories, start=1):
+                cents = self.months[month].get(category, 0)
+                sheet.cell(row=row, column=MONTH_COLUMN + offset, value=cents / 100).number_format = CURRENCY_FORMAT
+
+        self._define_names(workbook, categories, len(months))
+
+    def _define_names(self, workbook, categories, month_count):
+        sheet_ref = quote_sheetname(SHEET_NAME)
+        for name in [name for name in workbook.defined_names if name.startswith(NAME_PREFIX)]:
+            del workbook.defined_names[name]
+        names = balance_names(categories)
+        for row, category in enumerate(categories, start=HEADER_ROW + 1):
+            name = names[category]
+            workbook.defined_names[name] = DefinedName(name, attr_text=f"{sheet_ref}!$B${row}")
+        last_column = get_column_letter(MONTH_COLUMN + max(len(categories), 1))
+        workbook.defined_names[MONTHLY_NAME] = DefinedName(
+            MONTHLY_NAME,
+            attr_text=f"{sheet_ref}!${get_column_letter(MONTH_COLUMN)}${HEADER_ROW}:${last_column}${HEADER_ROW + month_count}")
@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+import metrics
+from settings import CHECKPOINT_PATH, CHECKPOINT_MAX_AGE_HOURS
+
+'''
+Local journal that makes long fetches resumable.
+
+A Checkpoint is one run of a job, e.g. "bank_feeds:<account>:2025-01-01".
+While it runs, every page fetched from PocketSmith is journaled as the raw
+API JSON before it is processed, along with each stage the job finishes
+(e.g. "stream", "render"). If the run dies, the next run of the same job
+replays the journaled pages instead of requesting them again, continues
+fetching from the page after the last one, and skips stages already done.
+
+complete() is called only after the job's last sink has committed (the
+store, the weekly workbook, PostgreSQL). It records completion and drops
+the journaled pages in a single SQLite transaction, so a run is either
+resumable or complete. Journals older than CHECKPOINT_MAX_AGE_HOURS are
+discarded rather than resumed, as the account has moved on since.
+'''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    params TEXT NOT NULL,            -- JSON, e.g. the start date and file a resumed run must reuse
+    started_at TEXT NOT NULL,
+    completed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    job TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    body TEXT NOT NULL,              -- JSON list of API transactions
+    PRIMARY KEY (job, page)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY (job, stage)
+);
+"""
+
+FETCHED = "fetch"  # Stage recorded once the last page has been fetched
+
+
+def _connect(path):
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Pages are journaled from the prefetch thread
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class Checkpoint:
+    """A resumable run of job, journaled in CHECKPOINT_PATH."""
+
+    def __init__(self, job, params=None, path=None, max_age_hours=None, conn=None):
+        self.job = job
+        self.path = path or CHECKPOINT_PATH
+        self.conn = conn or _connect(self.path)
+        max_age_hours = CHECKPOINT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+
+        row = self.conn.execute("SELECT params, started_at, completed_at FROM jobs WHERE job = ?",
+                                (job,)).fetchone()
+        stale = row is not None and datetime.fromisoformat(row[1]) < datetime.now() - timedelta(hours=max_age_hours)
+        if row is None or row[2] is not None or stale:
+            self.resumed = False
+            self.params = dict(params or {})
+            with self.conn:
+                self._clear()
+                self.conn.execute("INSERT OR REPLACE INTO jobs (job, params, started_at) VALUES (?, ?, ?)",
+                                  (job, json.dumps(self.params), datetime.now().isoformat(timespec="seconds")))
+        else:
+            self.resumed = True
+            self.params = json.loads(row[0])
+            metrics.count("checkpoint.resumed")
+
+    @classmethod
+    def latest(cls, prefix, path=None, max_age_hours=None):
+        """The most recently started unfinished run of any job named prefix..., or None."""
+        path = path or CHECKPOINT_PATH
+        max_age_hours = CHECKPOINT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+        if path != ":memory:" and not os.path.exists(path):
+            return None
+        conn = _connect(path)
+        since = (datetime.now() - timedelta(hours=max_age_hours)).isoformat(timespec="seconds")
+        jobs = [job for job, in conn.execute(
+            "SELECT job FROM jobs WHERE completed_at IS NULL AND started_at >= ? ORDER BY started_at DESC", (since,))
+                if job.startswith(prefix)]
+        if not jobs:
+            conn.close()
+            return None
+        return cls(jobs[0], path=path, max_age_hours=max_age_hours, conn=conn)
+
+    def _clear(self):
+        self.conn.execute("DELETE FROM pages WHERE job = ?", (self.job,))
+        self.conn.execute("DELETE FROM stages WHERE job = ?", (self.job,))
+
+    def pages(self):
+        """The journaled pages in order, as (page number, list of API transactions)."""
+        return [(page, json.loads(body)) for page, body in
+                self.conn.execute("SELECT page, body FROM pages WHERE job = ? ORDER BY page", (self.job,))]
+
+    def add_page(self, page, transactions):
+        """Journal a fetched page before it is processed."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO pages (job, page, body) VALUES (?, ?, ?)",
+                              (self.job, page, json.dumps(transactions)))
+        metrics.count("checkpoint.pages")
+
+    def done(self, stage):
+        """Whether stage was finished by this or an earlier run of the job."""
+        return self.conn.execute("SELECT 1 FROM stages WHERE job = ? AND stage = ?",
+                                 (self.job, stage)).fetchone() is not None
+
+    def mark(self, stage):
+        """Record that stage has finished."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO stages (job, stage, completed_at) VALUES (?, ?, ?)",
+                              (self.job, stage, datetime.now().isoformat(timespec="seconds")))
+
+    def complete(self):
+        """Record the run as complete and drop its journal, atomically. Call after the last sink commits."""
+        with self.conn:
+            self._clear()
+            self.conn.execute("UPDATE jobs SET completed_at = ? WHERE job = ?",
+                              (datetime.now().isoformat(timespec="seconds"), self.job))
+
+    def close(self):
+        self.conn.close()
@@ -1,23 +1,38 @@
+import argparse
+import hashlib
+import json
 import os
-import shutil
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from openpyxl import load_workbook, Workbook
+from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import FormulaRule
 from copy import copy
 from openpyxl.formula.translate import Translator
-from config import (
+import atomic_save
+import metrics
+import month_shards
+import workbook_cache
+from transaction_catalog import Catalog, parse_name
+from settings import (
     SPREADSHEET_DIRECTORY,
     TRANSACTION_DIRECTORY,
     CURRENT_YEAR,
     MASTER_SPREADSHEET_NAME,
+    MASTER_LAYOUT,
+    MASTER_SHARD_DIRECTORY,
+    COLLATION_STATE_PATH,
     RUBY_FILL,
     JACK_FILL,
     BOTH_FILL,
     BACKUP_DIRECTORY,
+    ensure_directories,
 )
 
+TRANSACTION_FOLDER = re.compile(r"^(\d{4}) Transactions$")
+
 
 class SpreadsheetCollator:
     """Class to manage the collation of weekly spreadsheets into monthly sheets."""
@@ -27,14 +42,44 @@ class SpreadsheetCollator:
     MONTH_ABBREVIATIONS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
                           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
-    def __init__(self, verbose=True):
-        """Initialize the collator with configuration settings and verbosity option."""
+    def __init__(self, verbose=True, year=None, directories=None):
+        """
+        Initialize the collator with configuration settings and verbosity option.
+
+        Args:
+            verbose: Print progress messages
+            year: Year to collate (default: CURRENT_YEAR). Other years read
+                '{year} Transactions/' and write '{year} Monthly Spend.xlsx'
+            directories: Folders to look for the year's weekly files in, e.g.
+                every year's folder so late weeks filed under the next year are
+                found (default: just the year's own folder)
+        """
         self.master_wb = None
         self.data_appended = False
         self.verbose = verbose
+        self.preloaded_workbooks = {}
+        self.year = year or CURRENT_YEAR
+        if self.year == CURRENT_YEAR:
+            self.transaction_directory = TRANSACTION_DIRECTORY
+            self.master_name = MASTER_SPREADSHEET_NAME
+            self.shard_directory = MASTER_SHARD_DIRECTORY
+        else:
+            self.transaction_directory = os.path.join(SPREADSHEET_DIRECTORY, f"{self.year} Transactions/")
+            self.master_name = f"{self.year} Monthly Spend.xlsx"
+            self.shard_directory = os.path.join(SPREADSHEET_DIRECTORY, f"{self.year} Monthly Spend/")
+        self.directories = list(directories or [self.transaction_directory])
+        self.catalog = Catalog()
+
+    @property
+    def output_path(self):
+        """The master spreadsheet, or the shard index with MASTER_LAYOUT = "sharded"."""
+        if MASTER_LAYOUT == "sharded":
+            return os.path.join(self.shard_directory, month_shards.INDEX_FILE)
+        return os.path.join(SPREADSHEET_DIRECTORY, self.master_name)
 
     def _log(self, message):
         """Helper method to handle conditional printing based on verbosity setting."""
+        metrics.log(message)
         if self.verbose:
             print(message)
 
@@ -109,13 +154,17 @@ class SpreadsheetCollator:
             copy_cf: Whether to copy conditional formatting (default: True)
         """
         # Copy data and styles
-        for row in source_ws.iter_rows(min_row=1, max_col=self.MAX_COLUMN):
-            for cell in row:
-                target_cell = target_ws.cell(
-                    row=start_row + cell.row - 1,
-                    column=cell.column
-                )
-                self._copy_cell_with_styles(cell, target_cell)
+        with metrics.timer("collate.copy_cells"):
+            cells = 0
+            for row in source_ws.iter_rows(min_row=1, max_col=self.MAX_COLUMN):
+                for cell in row:
+                    target_cell = target_ws.cell(
+                        row=start_row + cell.row - 1,
+                        column=cell.column
+                    )
+                    self._copy_cell_with_styles(cell, target_cell)
+                    cells += 1
+        metrics.count("cells.written", cells)
 
         # Copy column widths
         self._copy_column_widths(source_ws, target_ws)
@@ -124,57 +173,67 @@ class SpreadsheetCollator:
         if copy_cf:
             self._copy_conditional_formatting(source_ws, target_ws)
 
-    def ensure_master_workbook_exists(self):
-        """Ensure the master workbook exists, creating it if necessary."""
-        master_path = os.path.join(SPREADSHEET_DIRECTORY, MASTER_SPREADSHEET_NAME)
-        if not os.path.exists(master_path):
-            self.master_wb = Workbook()
-            default_sheet = self.master_wb.active
-            default_sheet.title = "Default"
-            self.master_wb.save(master_path)
-            self._log(f"Created new master spreadsheet: {MASTER_SPREADSHEET_NAME}")
-        else:
-            self._log(f"Master spreadsheet found: {MASTER_SPREADSHEET_NAME}")
+    def backup_path(self):
+        """Where the master spreadsheet replaced by this run is kept, named with the current date."""
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        filename, extension = os.path.splitext(self.master_name)
+        return os.path.join(BACKUP_DIRECTORY, f"{filename}_{current_date}{extension}")
 
-    def backup_existing_spreadsheet(self):
-        """Backup the existing master spreadsheet if it exists by moving it to backup directory."""
-        master_path = os.path.join(SPREADSHEET_DIRECTORY, MASTER_SPREADSHEET_NAME)
-        
-        if os.path.exists(master_path):
-            # Generate backup filename with current date
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            filename, extension = os.path.splitext(MASTER_SPREADSHEET_NAME)
-            backup_filename = f"{filename}_{current_date}{extension}"
-            backup_path = os.path.join(BACKUP_DIRECTORY, backup_filename)
-            
-            # Ensure backup directory exists
-            os.makedirs(BACKUP_DIRECTORY, exist_ok=True)
-            
-            # Move the file to backup directory instead of copying
-            try:
-                shutil.move(master_path, backup_path)
-                self._log(f"Moved existing spreadsheet to backup: {backup_path}")
-                return True
-            except Exception as e:
-                print(f"Error backing up spreadsheet: {e}")
-                return False
-        return False
+    def _render_from_store(self, store):
+        """
+        Render the weekly workbooks recorded in the transaction store in memory.
+
+        Hand edits to each weekly file's Category/Label columns are synced into
+        the store first; files unchanged since the last sync are not parsed.
+        """
+        import bank_feeds
+
+        rendered = {}
+        for file in store.weekly_files(self.year):
+            if file in self.preloaded_workbooks:
+                continue
+            store.sync_labels_from_workbook(self._weekly_path(file))
+            week_num = parse_name(file).week
+            rows = store.query(weekly_file=file, include_transfers=False, newest_first=True)
+            if rows:
+                rendered[file] = bank_feeds.build_weekly_workbook(rows, week_num)
+        self._log(f"Rendered {len(rendered)} weekly spreadsheet(s) from the transaction store.")
+        return rendered
+
+    def _weekly_path(self, file):
+        """Where a weekly file lives: the first of the year's directories that has it."""
+        for directory in self.directories:
+            path = os.path.join(directory, file)
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.transaction_directory, file)
+
+    def _open_weekly(self, file):
+        """The weekly workbook for file, preloaded or read from the transaction directories."""
+        weekly_wb = self.preloaded_workbooks.get(file)
+        if weekly_wb is None:
+            with metrics.timer("workbook.load"):
+                weekly_wb = workbook_cache.load(self._weekly_path(file))
+        return weekly_wb
 
-    def _process_file(self, file, month_name, year):
-        """Process a single weekly file and append it to the appropriate monthly sheet."""
+    def _process_file(self, file, month_name, year, workbook=None, weekly_wb=None):
+        """
+        Process a single weekly file and append it to the appropriate monthly sheet
+        of workbook (the master workbook by default).
+        """
+        workbook = workbook or self.master_wb
         full_month_name = datetime.strptime(month_name, "%b").strftime("%B")
         self._log(f"Processing file: {file} -> Month: {full_month_name}")
 
         try:
-            weekly_wb = load_workbook(os.path.join(TRANSACTION_DIRECTORY, file))
-            weekly_ws = weekly_wb.active
+            weekly_ws = (weekly_wb or self._open_weekly(file)).active
         except Exception as e:
             print(f"Error reading file {file}: {e}")  # Always print exceptions
             return
 
-        if full_month_name not in self.master_wb.sheetnames:
-            self.master_wb.create_sheet(title=full_month_name)
-        month_ws = self.master_wb[full_month_name]
+        if full_month_name not in workbook.sheetnames:
+            workbook.create_sheet(title=full_month_name)
+        month_ws = workbook[full_month_name]
 
         # Determine start row more efficiently
         start_row = 1
@@ -189,67 +248,166 @@ class SpreadsheetCollator:
         )
         self.data_appended = True
 
-    def collate_monthly_spreadsheets(self):
+    def _weekly_files(self):
+        """
+        The weekly files to collate as (file, month abbreviation, year) in week
+        order, or None if the transaction directory cannot be read.
+
+        Files come from the transaction catalog, refreshed first, plus any
+        preloaded workbooks not written to disk.
+        """
+        try:
+            self.catalog.refresh(self.directories)
+        except Exception as e:
+            print(f"Error accessing transaction directory: {e}")
+            return None
+        weekly = {}
+        for entry in self.catalog.entries(kind="weekly", directories=self.directories):
+            weekly.setdefault(entry.name, entry)
+        for file in self.preloaded_workbooks:
+            if file not in weekly and parse_name(file).kind == "weekly":
+                weekly[file] = parse_name(file)
+
+        weekly_files = []
+        for file in sorted(weekly):
+            if weekly[file].week is None:
+                self._log(f"Skipping file {file}: cannot parse week number.")
+                continue
+            weekly_files.append((file, weekly[file]))
+
+        # Sort files by week number
+        weekly_files.sort(key=lambda x: x[1].week)
+
+        selected = []
+        for file, info in weekly_files:
+            if info.month is None:
+                self._log(f"Skipping file {file}: month abbreviation not found.")
+                continue
+            if info.year != self.year:
+                self._log(f"Skipping file {file}: invalid or mismatched year.")
+                continue
+            selected.append((file, self.MONTH_ABBREVIATIONS[info.month - 1], str(info.year)))
+        return selected
+
+    def _write_shard(self, month_number, files, entry):
+        """
+        Build and save one month's shard from its weekly files, unless they are
+        unchanged since entry was written. Returns the index entry for the month.
+        """
+        path = month_shards.shard_path(month_number, self.year, self.shard_directory)
+        weekly_workbooks = []
+        for file, _, _ in files:
+            try:
+                weekly_workbooks.append((file, self._open_weekly(file)))
+            except Exception as e:
+                print(f"Error reading file {file}: {e}")  # Always print exceptions
+        digest = month_shards.source_digest(weekly_workbooks, self.MAX_COLUMN)
+        if entry is not None and entry.digest == digest and os.path.exists(path):
+            self._log(f"{entry.month} is unchanged, keeping {entry.file}")
+            return entry._replace(closed=month_shards.is_closed(month_number, self.year))
+
+        shard_wb = Workbook()
+        shard_wb.active.title = month_shards.MONTHS[month_number - 1]
+        weekly_by_file = dict(weekly_workbooks)
+        for file, month_name, year_part in files:
+            if file in weekly_by_file:
+                self._process_file(file, month_name, year_part, workbook=shard_wb, weekly_wb=weekly_by_file[file])
+        with metrics.timer("workbook.save"):
+            atomic_save.save_workbook(shard_wb, path)
+        metrics.count("workbook.bytes_written", os.path.getsize(path))
+        metrics.count("shards.written")
+        self._log(f"Wrote {path}")
+        return month_shards.new_entry(month_number, shard_wb.active.max_row, digest, self.year)
+
+    def collate_month_shards(self, weekly_files):
+        """
+        Write each month to its own workbook in MASTER_SHARD_DIRECTORY (or the
+        year's '{year} Monthly Spend/'), plus an index (MASTER_LAYOUT =
+        "sharded", see month_shards.py).
+
+        Closed months are never rewritten and open months only when their
+        weekly data has changed.
+        """
+        os.makedirs(self.shard_directory, exist_ok=True)
+        index = month_shards.read_index(self.shard_directory)
+
+        by_month = {}
+        for file, month_name, year_part in weekly_files:
+            month_number = self.MONTH_ABBREVIATIONS.index(month_name) + 1
+            by_month.setdefault(month_number, []).append((file, month_name, year_part))
+
+        jobs = []
+        for month_number, files in sorted(by_month.items()):
+            entry = index.get(month_shards.MONTHS[month_number - 1])
+            if entry is not None and entry.closed and os.path.exists(
+                    month_shards.shard_path(month_number, self.year, self.shard_directory)):
+                self._log(f"{entry.month} is closed, not rewriting {entry.file}")
+                continue
+            jobs.append((month_number, files, entry))
+
+        for month_number, files, entry in jobs:
+            try:
+                entry = self._write_shard(month_number, files, entry)
+            except Exception as e:
+                print(f"Skipping {month_shards.MONTHS[month_number - 1]}: error writing shard ({e})")
+                continue
+            index[entry.month] = entry
+        if jobs:
+            self.data_appended = True
+        path = month_shards.write_index(index, self.shard_directory)
+        self._log(f"Collated {len(by_month)} month(s) into {self.shard_directory} "
+                  f"({len(jobs)} checked, index at {path}).")
+
+    def collate_monthly_spreadsheets(self, preloaded_workbooks=None, store=None):
         """
         Collate all weekly spreadsheets into a single master spreadsheet organized by month.
         
         This method:
-        1. Creates or ensures the master workbook exists
-        2. Backs up any existing master spreadsheet
-        3. Creates a new workbook if needed
-        4. Processes all weekly files in the transaction directory
-        5. Sorts files by week number
-        6. Appends data to the appropriate monthly sheets
+        1. Creates a new master workbook in memory
+        2. Processes all weekly files in the transaction directory
+        3. Sorts files by week number
+        4. Appends data to the appropriate monthly sheets
+        5. Saves it over the existing master in one atomic rename, keeping
+           the previous version in BACKUP_DIRECTORY (see atomic_save.py)
+
+        The existing master stays in place and readable until the new one
+        replaces it, so a failed run leaves it untouched.
+        
+        Args:
+            preloaded_workbooks: Optional mapping of weekly file name to an already
+                open workbook, used instead of reloading that file from disk
+            store: Optional TransactionStore. Weeks recorded in it are rendered
+                from queries instead of parsing their weekly files
         
         Returns:
             None
         """
-        self.ensure_master_workbook_exists()
-        
-        # Backup existing spreadsheet before making changes
-        self.backup_existing_spreadsheet()
-        
+        self.preloaded_workbooks = dict(preloaded_workbooks or {})
+        ensure_directories()
+        if store is not None:
+            self.preloaded_workbooks.update(self._render_from_store(store))
+        if MASTER_LAYOUT == "sharded":
+            weekly_files = self._weekly_files()
+            if weekly_files is not None:
+                self.collate_month_shards(weekly_files)
+            return
+
         try:
-            # Create a new workbook since the old one was moved to backup
+            # Build a new workbook; the current master is only replaced once it is saved
             self.master_wb = Workbook()
             default_sheet = self.master_wb.active
             default_sheet.title = "Default"
-            self._log(f"Created new master workbook after backing up the previous one")
+            self._log(f"Created new master workbook")
         except Exception as e:
             print(f"Error creating new master workbook: {e}")
             return
 
-        # Get and filter files in one pass
-        weekly_files = []
-        try:
-            for f in os.listdir(TRANSACTION_DIRECTORY):
-                if f.endswith(".xlsx") and "Week" in f:
-                    try:
-                        week_num = int(f.split("Week")[1].split()[0])
-                        weekly_files.append((f, week_num))
-                    except (ValueError, IndexError):
-                        self._log(f"Skipping file {f}: cannot parse week number.")
-                        continue
-        except Exception as e:
-            print(f"Error accessing transaction directory: {e}")
+        weekly_files = self._weekly_files()
+        if weekly_files is None:
             return
-            
-        # Sort files by week number
-        weekly_files.sort(key=lambda x: x[1])
-        weekly_files = [f[0] for f in weekly_files]
 
-        for file in weekly_files:
+        for file, month_name, year_part in weekly_files:
             try:
-                month_name = next((m for m in self.MONTH_ABBREVIATIONS if m in file), None)
-                if not month_name:
-                    self._log(f"Skipping file {file}: month abbreviation not found.")
-                    continue
-
-                year_part = file.split(" ")[-1].replace(".xlsx", "")
-                if not year_part.isdigit() or int(year_part) != CURRENT_YEAR:
-                    self._log(f"Skipping file {file}: invalid or mismatched year.")
-                    continue
-
                 self._process_file(file, month_name, year_part)
             except Exception as e:
                 print(f"Skipping file {file}: error processing ({e})")
@@ -262,12 +420,148 @@ class SpreadsheetCollator:
 
         try:
             # Save the output file to SPREADSHEET_DIRECTORY
-            output_path = os.path.join(SPREADSHEET_DIRECTORY, MASTER_SPREADSHEET_NAME)
-            self.master_wb.save(output_path)
+            output_path = os.path.join(SPREADSHEET_DIRECTORY, self.master_name)
+            backup_path = self.backup_path() if os.path.exists(output_path) else None
+            with metrics.timer("workbook.save"):
+                atomic_save.save_workbook(self.master_wb, output_path, backup_path)
+            metrics.count("workbook.bytes_written", os.path.getsize(output_path))
+            if backup_path:
+                self._log(f"Kept the previous spreadsheet as backup: {backup_path}")
             self._log(f"All data collated into {output_path}.")
         except Exception as e:
             print(f"Error saving master spreadsheet: {e}")  # Always print exceptions
 
+
+def discover_years(directory=None):
+    """{year: folder} for every '{year} Transactions' folder in SPREADSHEET_DIRECTORY."""
+    directory = directory or SPREADSHEET_DIRECTORY
+    years = {}
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        print(f"Error accessing spreadsheet directory: {e}")
+        return years
+    for name in names:
+        match = TRANSACTION_FOLDER.match(name)
+        if match and os.path.isdir(os.path.join(directory, name)):
+            years[int(match.group(1))] = os.path.join(directory, name, "")
+    return years
+
+
+def year_fingerprint(year, directories):
+    """Digest of the name, size and modification time of every weekly file for year in directories."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(MASTER_LAYOUT.encode("utf-8"))
+    for directory in directories:
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        for name in names:
+            if "Week" in name and name.rsplit(" ", 1)[-1] == f"{year}.xlsx":
+                stat = os.stat(os.path.join(directory, name))
+                digest.update(f"{name}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_state(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_state(path, state):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def _collate_year(year, directories, verbose, attempts=3):
+    """
+    Collate one year; runs in a worker process, so it opens its own store.
+
+    The store and catalog wait for locks held by the other years' workers, and
+    the year is collated again if one is still held past that wait.
+    """
+    from transaction_store import TransactionStore
+
+    for attempt in range(1, attempts + 1):
+        store = TransactionStore()
+        try:
+            SpreadsheetCollator(verbose=verbose, year=year, directories=directories).collate_monthly_spreadsheets(
+                store=store)
+            return year
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == attempts:
+                raise
+            print(f"{year}: database is locked, collating again ({attempt}/{attempts - 1})")
+        finally:
+            store.close()
+
+
+def collate_all_years(verbose=False, workers=None, force=False, state_path=None):
+    """
+    Collate every year that has a '{year} Transactions' folder, one worker
+    process per year.
+
+    Each year reads its weekly files from all the folders, so a late December
+    week filed under the next year's folder still lands in its own year.
+    A year that closed (SHARD_CLOSE_DAYS after 31 December) is skipped while
+    its weekly files are unchanged since it was last collated, as recorded in
+    COLLATION_STATE_PATH; force=True collates every year again.
+
+    Returns the years that were collated.
+    """
+    state_path = state_path or COLLATION_STATE_PATH
+    years = discover_years()
+    directories = [years[year] for year in sorted(years)]
+    state = _read_state(state_path)
+
+    jobs = {}
+    for year in sorted(years):
+        fingerprint = year_fingerprint(year, directories)
+        output_path = SpreadsheetCollator(verbose=False, year=year).output_path
+        if (not force and month_shards.is_closed(12, year) and os.path.exists(output_path)
+                and state.get(str(year), {}).get("fingerprint") == fingerprint):
+            metrics.count("collate.years_skipped")
+            if verbose:
+                print(f"{year} is closed and unchanged, keeping {output_path}")
+            continue
+        jobs[year] = fingerprint
+    if not jobs:
+        return []
+
+    collated = []
+    with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as executor:
+        futures = {executor.submit(_collate_year, year, directories, verbose): year for year in jobs}
+        for future, year in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Skipping {year}: error collating ({e})")  # Always print exceptions
+                continue
+            state[str(year)] = {"fingerprint": jobs[year], "collated": datetime.now().isoformat(timespec="seconds")}
+            collated.append(year)
+    metrics.count("collate.years", len(collated))
+    _write_state(state_path, state)
+    return collated
+
+
 if __name__ == "__main__":
-    collator = SpreadsheetCollator(verbose=False)
-    collator.collate_monthly_spreadsheets()
\ No newline at end of file
+    import profiling
+    from transaction_store import TransactionStore
+    metrics.start("collate_spreadsheets")
+    with profiling.from_command_line("collate_spreadsheets"):
+        parser = argparse.ArgumentParser(description="Collate weekly spreadsheets into the monthly spend")
+        parser.add_argument("--all-years", action="store_true",
+                            help="Collate every '{year} Transactions' folder, one worker process per year")
+        parser.add_argument("--workers", type=int, help="Worker processes for --all-years (default: one per year)")
+        parser.add_argument("--force", action="store_true", help="With --all-years, also redo closed, unchanged years")
+        args = parser.parse_args()
+        if args.all_years:
+            collate_all_years(workers=args.workers, force=args.force)
+        else:
+            collator = SpreadsheetCollator(verbose=False)
+            collator.collate_monthly_spreadsheets(store=TransactionStore())
\ No newline at end of file
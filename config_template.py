@@ -1,6 +1,8 @@
 # Configuration for the program
+# Importing this module has no side effects and does not pull in openpyxl, so
+# entry points start quickly. The scripts read it through settings.py, which
+# holds the defaults of every optional setting (see the end of this file).
 from datetime import datetime
-from openpyxl.styles import PatternFill
 import os
 
 # PocketSmith API settings
@@ -14,12 +16,6 @@ DEBIT_ID = 'YOUR_DEBIT_ID' # used in BudgetUpdater.py to update debit transactio
 # List of users to split finance payments with 
 PEOPLE = ["Jack", "Ruby"]
 
-# List of colorings used for above users
-#TODO: This is stil hardcoded. Need to update all references in all python files if this name is updated below.
-RUBY_FILL = PatternFill(start_color="FF2C55", end_color="FF2C55", fill_type="solid")  # Red 
-JACK_FILL = PatternFill(start_color="5582AE", end_color="5582AE", fill_type="solid")  # Blue
-BOTH_FILL = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")  # Green
-
 # File path for saving spreadsheets
 # UPDATE THIS
 SPREADSHEET_DIRECTORY = "your/path/here"
@@ -36,19 +32,11 @@ TRANSACTION_DIRECTORY = os.path.join(
     f"{CURRENT_YEAR} Transactions/"
 )
 
-# Ensure the transaction directory exists
-if not os.path.exists(TRANSACTION_DIRECTORY):
-    os.makedirs(TRANSACTION_DIRECTORY)
-
 # Backup directory for storing backup files
 BACKUP_DIRECTORY = os.path.join(
     SPREADSHEET_DIRECTORY,
     "Backup/"
 )
-# Ensure the backup directory exists
-if not os.path.exists(BACKUP_DIRECTORY):
-    print("Back up directory created")
-    os.makedirs(BACKUP_DIRECTORY)
 
 MASTER_SPREADSHEET_NAME = f"{CURRENT_YEAR} Monthly Spend.xlsx"  # Dynamic name based on the year
 
@@ -67,3 +55,37 @@ DB_CONFIG = {
 # Transaction fetching configuration
 DAYS_TO_FETCH = 30  # Number of days to fetch transactions for
 
+# Optional settings
+# Every setting below has a default in settings.py and only needs to be set here
+# to change it. Uncomment and edit any of these examples:
+
+# Point at fake_pocketsmith.py to run offline
+#POCKETSMITH_API_URL = 'http://127.0.0.1:8765/v2'
+
+# Colours of RUBY_FILL, JACK_FILL and BOTH_FILL, the fills used for the above users
+#FILL_COLORS = {"RUBY_FILL": "FF9999", "JACK_FILL": "99CCFF", "BOTH_FILL": "CCFFCC"}
+
+# Write one workbook per month plus an index instead of MASTER_SPREADSHEET_NAME (see month_shards.py)
+#MASTER_LAYOUT = "sharded"
+#SHARD_CLOSE_DAYS = 14  # Days after a month ends before its shard is closed and never rewritten
+
+# The scripts keep their own files in SPREADSHEET_DIRECTORY unless moved, e.g.
+#TRANSACTION_STORE_PATH = "another/path/transactions.db"
+# Likewise MASTER_SHARD_DIRECTORY, ARCHIVE_DIRECTORY, REPORT_CACHE_PATH, COLLATION_STATE_PATH,
+# CATALOG_PATH, CHECKPOINT_PATH, METRICS_DIRECTORY, PROFILE_DIRECTORY and WORKBOOK_CACHE_DIRECTORY
+
+#CATALOG_POLL_SECONDS = 30  # How often transaction_catalog.py --watch checks for changed files
+#CHECKPOINT_MAX_AGE_HOURS = 48  # Older unfinished fetches start over instead of resuming
+
+# Refund reconciliation and pending/posted duplicate collapse (see reconcile.py)
+#REFUND_WINDOW_DAYS = 90  # How far back a refund may reach for the purchase it reverses
+#REFUND_TOLERANCE_CENTS = 50  # Allowed difference between refund and purchase amounts, e.g. for FX
+#DEDUP_WINDOW_DAYS = 7  # Days between a pending transaction and its posted twin
+#DEDUP_AMOUNT_TOLERANCE = 0.2  # Allowed amount change as a fraction, e.g. tips or FX settlement
+#DEDUP_MIN_SIMILARITY = 0.7  # Minimum payee similarity (0-1) for the pair to count as one transaction
+#TRANSFER_WINDOW_DAYS = 5  # Days a card repayment from the debit account may take to land
+
+# Run metrics and caches (see metrics.py and workbook_cache.py)
+#METRICS_FORMAT = "json"  # or "openmetrics": write stage timings and counters when a script exits
+#METRICS_RUN_LOG = True  # Also log every timed stage and message, even with verbose=False
+#WORKBOOK_CACHE_MAX_MB = 512  # Size of the parsed workbook cache; 0 turns it off
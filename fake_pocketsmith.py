@@ -0,0 +1,246 @@
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+'''
+Local stand-in for the PocketSmith API, for offline runs and load testing.
+
+Serves GET /v2/accounts/{id}/transactions from a fixture dataset with the
+paging and date filtering the scripts rely on: newest first, `page` and
+`per_page` parameters, `start_date`/`end_date` filters, and Total, Per-Page
+and Link headers. Requests without an X-Developer-Key or Authorization header
+get a 401, like the real API.
+
+Faults can be injected to see how the scripts behave under load:
+
+- latency / jitter: seconds added to every response
+- error_rate: fraction of requests answered with a 500
+- rate_limit: requests per second allowed before answering 429 with Retry-After
+
+Point the scripts at it by setting POCKETSMITH_API_URL in config.py to the
+printed base URL. A fixture is a JSON (optionally gzipped) object mapping
+account ids to lists of API transactions, or a recording made with
+api_recording.py; without one, synthetic rows from benchmarks/synthetic.py
+are served for the configured card and debit accounts.
+
+Example:
+    python fake_pocketsmith.py --fixture card.json.gz --port 8765 --latency 0.05 --rate-limit 20
+'''
+
+API_PREFIX = "/v2"
+_TRANSACTIONS_PATH = re.compile(r"^/accounts/([^/]+)/transactions/?$")
+
+
+def load_fixture(path):
+    """
+    Read {account id: [API transaction, ...]} from a .json or .json.gz file.
+
+    Recordings made by api_recording.py are accepted too: the transactions in
+    their successful responses are served for the account ids in config.py.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        fixture = json.load(f)
+    if "interactions" not in fixture:
+        return fixture
+
+    from settings import DEBIT_ID, ULTIMATE_AWARDS_CC_ID
+
+    account_ids = {"{ULTIMATE_AWARDS_CC_ID}": str(ULTIMATE_AWARDS_CC_ID), "{DEBIT_ID}": str(DEBIT_ID)}
+    accounts = {}
+    for interaction in fixture["interactions"]:
+        match = re.search(r"/accounts/([^/]+)/transactions", interaction["key"])
+        if not match or interaction["status"] != 200 or not interaction["body"]:
+            continue
+        rows = accounts.setdefault(account_ids.get(match.group(1), match.group(1)), {})
+        rows.update((row["id"], row) for row in interaction["body"])
+    return {account_id: list(rows.values()) for account_id, rows in accounts.items()}
+
+
+class FakePocketSmith(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering PocketSmith transaction requests.
+
+    Use as a context manager to serve on a background thread; base_url is
+    what POCKETSMITH_API_URL should be set to. stats counts requests by
+    outcome ('ok', 'throttled', 'error', 'unauthorised', 'not_found').
+    """
+
+    daemon_threads = True
+
+    def __init__(self, accounts, host="127.0.0.1", port=0, page_size=30, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit=None, seed=0):
+        super().__init__((host, port), _Handler)
+        self.accounts = {str(account_id): sorted(rows, key=lambda row: row["date"], reverse=True)
+                         for account_id, rows in accounts.items()}
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.stats = {"ok": 0, "throttled": 0, "error": 0, "unauthorised": 0, "not_found": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def delay(self):
+        """Seconds to wait before answering, with up to `jitter` seconds of noise either way."""
+        with self._lock:
+            noise = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(self.latency + noise, 0.0)
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def should_throttle(self):
+        """True once more than rate_limit requests have arrived in the current second."""
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    def transactions(self, account_id, query):
+        """Return (rows on the page, page, per_page, total matching rows) for one request."""
+        rows = self.accounts.get(account_id)
+        if rows is None:
+            return None, 0, 0, 0
+        start_date = query.get("start_date", [""])[0][:10]
+        end_date = query.get("end_date", [""])[0][:10]
+        if start_date:
+            rows = [row for row in rows if row["date"] >= start_date]
+        if end_date:
+            rows = [row for row in rows if row["date"] <= end_date]
+        per_page = int(query.get("per_page", [self.page_size])[0])
+        page = max(int(query.get("page", [1])[0]), 1)
+        return rows[(page - 1) * per_page:page * per_page], page, per_page, len(rows)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-pocketsmith", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakePocketSmith/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        delay = server.delay()
+        if delay:
+            time.sleep(delay)
+
+        if not (self.headers.get("X-Developer-Key") or self.headers.get("Authorization")):
+            server.count("unauthorised")
+            return self._send_json(401, {"error": "Missing API key"})
+        if server.should_throttle():
+            server.count("throttled")
+            return self._send_json(429, {"error": "Too many requests"}, [("Retry-After", "1")])
+        if server.should_fail():
+            server.count("error")
+            return self._send_json(500, {"error": "Injected failure"})
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        match = _TRANSACTIONS_PATH.match(path)
+        rows, page, per_page, total = server.transactions(match.group(1), query) if match else (None, 0, 0, 0)
+        if rows is None:
+            server.count("not_found")
+            return self._send_json(404, {"error": f"No such resource: {url.path}"})
+
+        headers = [("Total", str(total)), ("Per-Page", str(per_page))]
+        if page * per_page < total:
+            query["page"] = [str(page + 1)]
+            headers.append(("Link", f'<{server.base_url}{path}?{urlencode(query, doseq=True)}>; rel="next"'))
+        server.count("ok")
+        self._send_json(200, rows, headers)
+
+
+def synthetic_accounts(rows, debit_rows=None, seed=0):
+    """Synthetic card and debit rows for the account ids in config.py, as API transactions."""
+    import os
+    import sys
+    from datetime import date
+
+    from settings import DEBIT_ID, ULTIMATE_AWARDS_CC_ID
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    from synthetic import generate_transactions, to_api
+
+    start = date(date.today().year, 1, 1)
+    days = (date.today() - start).days + 1
+    card = generate_transactions(rows, seed=seed, start=start, days=days, refund_rate=0.05)
+    debit = generate_transactions(debit_rows or max(rows // 4, 1), seed=seed + 1, start=start, days=days,
+                                  id_start=rows + 1)
+    return {ULTIMATE_AWARDS_CC_ID: [to_api(tx) for tx in card], DEBIT_ID: [to_api(tx) for tx in debit]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake PocketSmith transactions API locally")
+    parser.add_argument("--fixture", help="JSON or .json.gz file mapping account ids to API transactions")
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic card rows when no fixture is given")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--page-size", type=int, default=30, help="Default per_page")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds on top of --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit", type=int, help="Requests per second before answering 429")
+    args = parser.parse_args(argv)
+
+    accounts = load_fixture(args.fixture) if args.fixture else synthetic_accounts(args.rows)
+    server = FakePocketSmith(accounts, args.host, args.port, page_size=args.page_size, latency=args.latency,
+                             jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit)
+    print(f"Serving {sum(len(rows) for rows in accounts.values())} transactions for "
+          f"{len(accounts)} account(s) at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
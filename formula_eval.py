@@ -0,0 +1,678 @@
+import os
+import re
+from collections import namedtuple
+from datetime import date, datetime, time
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from urllib.parse import unquote
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.formula import Tokenizer
+from openpyxl.formula.tokenizer import Token
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import to_excel
+from openpyxl.worksheet.formula import ArrayFormula
+
+'''
+Evaluates worksheet formulas in Python, for workbooks last saved by openpyxl
+(which keeps formulas but not the values Excel calculated for them).
+
+Covers the subset the summary workbook uses: arithmetic, comparison and &
+operators, cell and range references (whole columns, other sheets, defined
+names and external workbooks such as '[2025 Monthly Spend.xlsx]October'!C:C),
+and SUM, SUMIF(S), COUNT(IF(S)), AVERAGE, MIN, MAX, ROUND, ABS, IF, IFERROR,
+AND, OR, NOT, INDEX, MATCH and DATE. Anything else raises FormulaError so the
+caller can fall back to Excel's cached value.
+
+Each cell is evaluated once and memoised, and the references each formula read
+are kept as a dependency graph, so invalidate() after changing a cell only
+forgets the formulas that depend on it. External workbooks are opened from
+directory on first use (with loader, load_workbook by default), or answered
+from the values Excel cached in the link when the file is not there.
+
+Example:
+    evaluator = WorkbookEvaluator(load_workbook("summary_updated.xlsm"), SPREADSHEET_DIRECTORY)
+    evaluator.value("Total Balance", "B14")
+'''
+
+Reference = namedtuple("Reference", ["book", "sheet", "name", "min_col", "min_row", "max_col", "max_row"])
+
+
+class FormulaError(ValueError):
+    """Raised when a formula cannot be evaluated (unsupported syntax or function, unknown reference)."""
+
+
+class CircularReference(FormulaError):
+    """Raised when a formula depends on its own value."""
+
+
+class ExcelError(FormulaError):
+    """An Excel error value such as #DIV/0!, raised so it propagates through formulas as in Excel."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class Range:
+    """The values of a rectangular range, row by row."""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def values(self):
+        return [value for row in self.rows for value in row]
+
+
+# Operator precedence, lowest first; prefix minus binds tighter than ^ as in Excel
+_INFIX = {"=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1, "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5}
+_EXTERNAL = re.compile(r"^(.*[\\/])?\[([^\]]+)\](.*)$")
+_CRITERION = re.compile(r"^(<=|>=|<>|<|>|=)?(.*)$", re.S)
+
+
+def parse_reference(text):
+    """Parse 'A1', 'Sheet'!$C:$C, '[Book.xlsx]Sheet'!A1:B2, [1]Sheet!A1 or a defined name into a Reference."""
+    book = sheet = None
+    address = text
+    if "!" in text:
+        prefix, address = text.rsplit("!", 1)
+        if prefix.startswith("'") and prefix.endswith("'"):
+            prefix = prefix[1:-1].replace("''", "'")
+        external = _EXTERNAL.match(prefix)
+        if external:
+            folder, book, prefix = external.groups()
+            book = (folder or "") + book
+        sheet = prefix
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(address.replace("$", ""))
+    except ValueError:
+        if sheet is not None:
+            raise FormulaError(f"Unsupported reference {text!r}")
+        return Reference(None, None, address, None, None, None, None)
+    return Reference(book, sheet, None, min_col, min_row, max_col, max_row)
+
+
+class _Parser:
+    """Precedence-climbing parser over openpyxl's formula tokens."""
+
+    def __init__(self, tokens, formula):
+        self.tokens = tokens
+        self.formula = formula
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise FormulaError(f"Unexpected end of {self.formula!r}")
+        self.position += 1
+        return token
+
+    def expression(self, min_precedence=1):
+        left = self.unary()
+        while True:
+            token = self.peek()
+            if token is None or token.type != Token.OP_IN:
+                return left
+            precedence = _INFIX.get(token.value)
+            if precedence is None:
+                raise FormulaError(f"Unsupported operator {token.value!r} in {self.formula!r}")
+            if precedence < min_precedence:
+                return left
+            self.take()
+            left = ("op", token.value, left, self.expression(precedence + 1))
+
+    def unary(self):
+        token = self.peek()
+        if token is not None and token.type == Token.OP_PRE:
+            self.take()
+            operand = self.unary()
+            node = ("neg", operand) if token.value == "-" else operand
+        else:
+            node = self.primary()
+        while self.peek() is not None and self.peek().type == Token.OP_POST:
+            self.take()
+            node = ("percent", node)
+        return node
+
+    def primary(self):
+        token = self.take()
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                return ("value", float(token.value))
+            if token.subtype == Token.TEXT:
+                return ("value", token.value[1:-1].replace('""', '"'))
+            if token.subtype == Token.LOGICAL:
+                return ("value", token.value.upper() == "TRUE")
+            if token.subtype == Token.ERROR:
+                return ("error", token.value)
+            if token.subtype == Token.RANGE:
+                return ("ref", parse_reference(token.value))
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            node = self.expression()
+            closer = self.take()
+            if closer.type != Token.PAREN:
+                raise FormulaError(f"Expected ) in {self.formula!r}")
+            return node
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            return self.call(token.value[:-1].upper().replace("_XLFN.", ""))
+        raise FormulaError(f"Unsupported {token.value!r} in {self.formula!r}")
+
+    def _at_argument_end(self):
+        token = self.peek()
+        return token is not None and (token.type == Token.SEP or (token.type == Token.FUNC and token.subtype == Token.CLOSE))
+
+    def call(self, name):
+        args = []
+        token = self.peek()
+        if token is not None and token.type == Token.FUNC and token.subtype == Token.CLOSE:
+            self.take()
+            return ("call", name, ())
+        while True:
+            # An omitted argument, as in INDEX(range,,2)
+            args.append(("value", None) if self._at_argument_end() else self.expression())
+            separator = self.take()
+            if separator.type == Token.FUNC and separator.subtype == Token.CLOSE:
+                return ("call", name, tuple(args))
+            if separator.type != Token.SEP or separator.subtype != Token.ARG:
+                raise FormulaError(f"Unexpected {separator.value!r} in {self.formula!r}")
+
+
+@lru_cache(maxsize=4096)
+def parse(formula):
+    """Parse formula text (with or without the leading =) into a tree of tuples."""
+    text = formula if formula.startswith("=") else "=" + formula
+    try:
+        tokens = [token for token in Tokenizer(text).items if token.type != Token.WSPACE]
+    except Exception as e:
+        raise FormulaError(f"Cannot tokenize {formula!r}: {e}") from e
+    parser = _Parser(tokens, formula)
+    tree = parser.expression()
+    if parser.position != len(tokens):
+        raise FormulaError(f"Unexpected {tokens[parser.position].value!r} in {formula!r}")
+    return tree
+
+
+def _is_formula(raw):
+    return isinstance(raw, ArrayFormula) or (isinstance(raw, str) and raw.startswith("=") and len(raw) > 1)
+
+
+def _normalise(value):
+    """A stored cell value as formulas see it: dates and times become Excel serial numbers."""
+    if isinstance(value, (datetime, date, time)):
+        return to_excel(value)
+    return value
+
+
+def _scalar(value):
+    if isinstance(value, Range):
+        if len(value.rows) == 1 and len(value.rows[0]) == 1:
+            return value.rows[0][0]
+        raise ExcelError("#VALUE!")
+    return value
+
+
+def _number(value):
+    value = _scalar(value)
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ExcelError("#VALUE!") from None
+
+
+def _text(value):
+    value = _scalar(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _truthy(value):
+    value = _scalar(value)
+    if isinstance(value, str):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        raise ExcelError("#VALUE!")
+    return bool(_number(value))
+
+
+def _compare(left, right):
+    """Excel ordering: numbers < text < booleans, text case-insensitive, blanks as 0 or ""."""
+    left, right = _scalar(left), _scalar(right)
+    if left is None:
+        left = "" if isinstance(right, str) else 0
+    if right is None:
+        right = "" if isinstance(left, str) else 0
+
+    def rank(value):
+        if isinstance(value, bool):
+            return 2, value
+        if isinstance(value, str):
+            return 1, value.lower()
+        return 0, value
+
+    left, right = rank(left), rank(right)
+    return (left > right) - (left < right)
+
+
+def _numbers(args):
+    """The numbers among args: referenced text, blanks and booleans are skipped, typed arguments are converted."""
+    for arg in args:
+        if isinstance(arg, Range):
+            for value in arg.values():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield value
+        elif arg is not None:
+            yield _number(arg)
+
+
+def _criterion(criterion):
+    """A predicate for a SUMIF-style criterion such as 5, ">=100", "<>Food" or "Sal*"."""
+    criterion = _scalar(criterion)
+    if not isinstance(criterion, str):
+        return lambda value: value is not None and _compare(value, criterion) == 0
+    operator, operand = _CRITERION.match(criterion).groups()
+    try:
+        target = float(operand)
+    except ValueError:
+        target = operand
+
+    if isinstance(target, str) and operator in (None, "=", "<>"):
+        if target == "":
+            matches = lambda value: value is None or value == ""
+        elif "*" in target or "?" in target:
+            pattern = re.compile(re.escape(target).replace(r"\*", ".*").replace(r"\?", "."), re.I | re.S)
+            matches = lambda value: isinstance(value, str) and pattern.fullmatch(value) is not None
+        else:
+            matches = lambda value: isinstance(value, str) and value.lower() == target.lower()
+        return (lambda value: not matches(value)) if operator == "<>" else matches
+
+    def same_type(value):
+        if isinstance(target, float):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        return isinstance(value, str)
+
+    tests = {
+        None: lambda order: order == 0, "=": lambda order: order == 0, "<>": lambda order: order != 0,
+        "<": lambda order: order < 0, ">": lambda order: order > 0,
+        "<=": lambda order: order <= 0, ">=": lambda order: order >= 0,
+    }
+    test = tests[operator]
+    if operator == "<>":
+        return lambda value: not same_type(value) or test(_compare(value, target))
+    return lambda value: same_type(value) and test(_compare(value, target))
+
+
+def _criteria_mask(pairs):
+    """Which positions meet every (range, criterion) pair, for the *IFS functions."""
+    mask = None
+    for criteria_range, criterion in pairs:
+        if not isinstance(criteria_range, Range):
+            criteria_range = Range([[criteria_range]])
+        values = criteria_range.values()
+        if mask is not None and len(values) != len(mask):
+            raise ExcelError("#VALUE!")
+        predicate = _criterion(criterion)
+        matched = [predicate(value) for value in values]
+        mask = matched if mask is None else [a and b for a, b in zip(mask, matched)]
+    return mask
+
+
+def _round(number, digits):
+    """Round half away from zero, as Excel does."""
+    exponent = Decimal(1).scaleb(-int(digits))
+    rounded = Decimal(repr(number)).quantize(exponent, rounding=ROUND_HALF_UP)
+    return float(rounded)
+
+
+def _sumif(criteria_range, criterion, sum_range=None):
+    sum_range = criteria_range if sum_range is None else sum_range
+    mask = _criteria_mask([(criteria_range, criterion)])
+    values = sum_range.values() if isinstance(sum_range, Range) else [sum_range]
+    return sum(value for value, keep in zip(values, mask)
+               if keep and isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def _sumifs(sum_range, *pairs):
+    mask = _criteria_mask(zip(pairs[::2], pairs[1::2]))
+    values = sum_range.values() if isinstance(sum_range, Range) else [sum_range]
+    if len(values) != len(mask):
+        raise ExcelError("#VALUE!")
+    return sum(value for value, keep in zip(values, mask)
+               if keep and isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def _average(*args):
+    numbers = list(_numbers(args))
+    if not numbers:
+        raise ExcelError("#DIV/0!")
+    return sum(numbers) / len(numbers)
+
+
+def _index(values, row=None, column=None):
+    if not isinstance(values, Range):
+        values = Range([[values]])
+    rows = values.rows
+    row = int(_number(row)) if row is not None else 0
+    column = int(_number(column)) if column is not None else 0
+    if len(rows) == 1 and column == 0:
+        row, column = 1, row  # INDEX(row_range, n)
+    if row == 0:
+        return Range([[r[column - 1]] for r in rows])
+    if column == 0:
+        if len(rows[0]) == 1:
+            return rows[row - 1][0]
+        return Range([rows[row - 1]])
+    try:
+        return rows[row - 1][column - 1]
+    except IndexError:
+        raise ExcelError("#REF!") from None
+
+
+def _match(value, lookup, match_type=1):
+    values = lookup.values() if isinstance(lookup, Range) else [lookup]
+    match_type = int(_number(match_type)) if match_type is not None else 1
+    if match_type == 0:
+        predicate = _criterion(value) if isinstance(_scalar(value), str) else (
+            lambda candidate: candidate is not None and _compare(candidate, value) == 0)
+        for position, candidate in enumerate(values, start=1):
+            if predicate(candidate):
+                return position
+        raise ExcelError("#N/A")
+    # Approximate match over sorted values: the last position not past value
+    found = None
+    for position, candidate in enumerate(values, start=1):
+        if candidate is None:
+            continue
+        order = _compare(candidate, value)
+        if (order <= 0) if match_type > 0 else (order >= 0):
+            found = position
+        else:
+            break
+    if found is None:
+        raise ExcelError("#N/A")
+    return found
+
+
+def _date(year, month, day):
+    year, month, day = int(_number(year)), int(_number(month)), int(_number(day))
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return to_excel(date(year, month, 1)) + day - 1
+
+
+_FUNCTIONS = {
+    "SUM": lambda *args: sum(_numbers(args)),
+    "SUMIF": _sumif,
+    "SUMIFS": _sumifs,
+    "COUNT": lambda *args: sum(1 for _ in _numbers(args)),
+    "COUNTA": lambda *args: sum(1 for arg in args
+                                for value in (arg.values() if isinstance(arg, Range) else [arg])
+                                if value is not None),
+    "COUNTIF": lambda criteria_range, criterion: sum(_criteria_mask([(criteria_range, criterion)])),
+    "COUNTIFS": lambda *pairs: sum(_criteria_mask(zip(pairs[::2], pairs[1::2]))),
+    "AVERAGE": _average,
+    "MIN": lambda *args: min(_numbers(args), default=0),
+    "MAX": lambda *args: max(_numbers(args), default=0),
+    "ABS": lambda value: abs(_number(value)),
+    "ROUND": lambda value, digits=0: _round(_number(value), _number(digits)),
+    "AND": lambda *args: all(_truthy(value) for arg in args
+                             for value in (arg.values() if isinstance(arg, Range) else [arg]) if value is not None),
+    "OR": lambda *args: any(_truthy(value) for arg in args
+                            for value in (arg.values() if isinstance(arg, Range) else [arg]) if value is not None),
+    "NOT": lambda value: not _truthy(value),
+    "INDEX": _index,
+    "MATCH": _match,
+    "DATE": _date,
+}
+
+
+def _covers(reference, sheet_name, key):
+    """Whether a Reference read by a formula on sheet_name includes the cell key."""
+    if reference.book is not None:
+        return False
+    if reference.name is not None:
+        return True  # Defined names are not resolved here; assume they might
+    if (reference.sheet or sheet_name) != key[0]:
+        return False
+    row, column = key[1], key[2]
+    return ((reference.min_row is None or reference.min_row <= row <= reference.max_row)
+            and (reference.min_col is None or reference.min_col <= column <= reference.max_col))
+
+
+class WorkbookEvaluator:
+    """Evaluates the formulas of a workbook loaded with formulas (data_only=False)."""
+
+    def __init__(self, workbook, directory=None, loader=load_workbook, _books=None):
+        self.workbook = workbook
+        self.directory = directory
+        self.loader = loader
+        self._values = {}       # (sheet, row, column) -> value
+        self._ranges = {}       # (sheet, bounds) -> Range
+        self._precedents = {}   # (sheet, row, column) -> References its formula read
+        self._evaluating = set()
+        self._dimensions = {}
+        self._books = {} if _books is None else _books  # Shared with the evaluators of external workbooks
+
+    def value(self, sheet_name, coordinate):
+        """The value of a cell, e.g. value("Total Balance", "B14"), evaluating its formula if it has one."""
+        row, column = coordinate_to_tuple(coordinate)
+        return _scalar(self.cell_value(sheet_name, row, column))
+
+    def precedents(self, sheet_name, coordinate):
+        """The References read by a cell's formula, once it has been evaluated."""
+        row, column = coordinate_to_tuple(coordinate)
+        return list(self._precedents.get((sheet_name, row, column), ()))
+
+    def invalidate(self, sheet_name, coordinate):
+        """Forget a changed cell and every memoised formula that depends on it."""
+        row, column = coordinate_to_tuple(coordinate)
+        self._ranges.clear()
+        pending = [(sheet_name, row, column)]
+        while pending:
+            key = pending.pop()
+            self._values.pop(key, None)
+            pending.extend(dependent for dependent, references in self._precedents.items()
+                           if dependent in self._values
+                           and any(_covers(reference, dependent[0], key) for reference in references))
+
+    def _sheet(self, sheet_name):
+        if sheet_name not in self.workbook.sheetnames:
+            raise ExcelError("#REF!")
+        sheet = self.workbook[sheet_name]
+        if sheet_name not in self._dimensions:
+            # max_row/max_column scan every cell, so look them up once per sheet
+            self._dimensions[sheet_name] = (sheet.max_row, sheet.max_column)
+        return sheet, self._dimensions[sheet_name]
+
+    def cell_value(self, sheet_name, row, column):
+        key = (sheet_name, row, column)
+        if key in self._values:
+            return self._values[key]
+        sheet, (max_row, max_column) = self._sheet(sheet_name)
+        raw = sheet.cell(row=row, column=column).value if row <= max_row and column <= max_column else None
+        if _is_formula(raw):
+            result = self._evaluate_cell(key, raw)
+        else:
+            result = _normalise(raw)
+        self._values[key] = result
+        return result
+
+    def _evaluate_cell(self, key, raw):
+        if key in self._evaluating:
+            raise CircularReference(f"Circular reference at {key[0]}!{get_column_letter(key[2])}{key[1]}")
+        text = raw.text if isinstance(raw, ArrayFormula) else raw
+        self._evaluating.add(key)
+        try:
+            return _scalar(self._evaluate(parse(text), key))
+        finally:
+            self._evaluating.discard(key)
+
+    def _evaluate(self, node, key):
+        kind = node[0]
+        if kind == "value":
+            return node[1]
+        if kind == "error":
+            raise ExcelError(node[1])
+        if kind == "ref":
+            self._precedents.setdefault(key, []).append(node[1])
+            return self._resolve(node[1], key)
+        if kind == "neg":
+            return -_number(self._evaluate(node[1], key))
+        if kind == "percent":
+            return _number(self._evaluate(node[1], key)) / 100
+        if kind == "op":
+            return self._operator(node[1], self._evaluate(node[2], key), self._evaluate(node[3], key))
+        if kind == "call":
+            return self._call(node[1], node[2], key)
+        raise FormulaError(f"Unknown node {kind!r}")
+
+    @staticmethod
+    def _operator(operator, left, right):
+        if operator == "&":
+            return _text(left) + _text(right)
+        if operator in ("=", "<>", "<", ">", "<=", ">="):
+            order = _compare(left, right)
+            return {"=": order == 0, "<>": order != 0, "<": order < 0, ">": order > 0,
+                    "<=": order <= 0, ">=": order >= 0}[operator]
+        left, right = _number(left), _number(right)
+        if operator == "+":
+            return left + right
+        if operator == "-":
+            return left - right
+        if operator == "*":
+            return left * right
+        if operator == "/":
+            if right == 0:
+                raise ExcelError("#DIV/0!")
+            return left / right
+        try:
+            return left ** right
+        except (ZeroDivisionError, OverflowError):
+            raise ExcelError("#NUM!") from None
+
+    def _call(self, name, args, key):
+        # IF and IFERROR only evaluate the branch they return
+        if name == "IF":
+            condition = _truthy(self._evaluate(args[0], key))
+            if condition:
+                return self._evaluate(args[1], key) if len(args) > 1 else True
+            return self._evaluate(args[2], key) if len(args) > 2 else False
+        if name == "IFERROR":
+            try:
+                return _scalar(self._evaluate(args[0], key))
+            except ExcelError:
+                return self._evaluate(args[1], key)
+        function = _FUNCTIONS.get(name)
+        if function is None:
+            raise FormulaError(f"Unsupported function {name}")
+        values = [self._evaluate(arg, key) for arg in args]
+        try:
+            return function(*values)
+        except TypeError as e:
+            raise FormulaError(f"Bad arguments to {name}: {e}") from e
+
+    def _resolve(self, reference, key):
+        if reference.name is not None:
+            return self._resolve_name(reference.name, key)
+        if reference.book is not None:
+            external = self._external(reference.book)
+            return external._resolve(reference._replace(book=None), (reference.sheet, 0, 0))
+
+        sheet_name = reference.sheet or key[0]
+        if reference.min_row is not None and (reference.min_row, reference.min_col) == (reference.max_row, reference.max_col):
+            return self.cell_value(sheet_name, reference.min_row, reference.min_col)
+        return self._range(sheet_name, reference)
+
+    def _resolve_name(self, name, key):
+        defined = self.workbook.defined_names.get(name)
+        if defined is None and key[0] in self.workbook.sheetnames:
+            defined = self.workbook[key[0]].defined_names.get(name)
+        if defined is None:
+            raise ExcelError("#NAME?")
+        return self._evaluate(parse(defined.attr_text), key)
+
+    def _range(self, sheet_name, reference):
+        sheet, (max_row, max_column) = self._sheet(sheet_name)
+        min_row, min_col = reference.min_row or 1, reference.min_col or 1
+        last_row = reference.max_row or max_row  # Whole columns end at the last used row
+        last_col = reference.max_col or max_column
+        cache_key = (sheet_name, min_row, min_col, last_row, last_col)
+        if cache_key in self._ranges:
+            return self._ranges[cache_key]
+
+        width = last_col - min_col + 1
+        rows = []
+        if min_row <= max_row and min_col <= max_column:
+            read = sheet.iter_rows(min_row=min_row, max_row=min(last_row, max_row),
+                                   min_col=min_col, max_col=min(last_col, max_column), values_only=True)
+            for row, values in enumerate(read, start=min_row):
+                cells = [self.cell_value(sheet_name, row, column) if _is_formula(raw) else _normalise(raw)
+                         for column, raw in enumerate(values, start=min_col)]
+                rows.append(cells + [None] * (width - len(cells)))
+        rows += [[None] * width for _ in range(last_row - min_row + 1 - len(rows))]
+        result = self._ranges[cache_key] = Range(rows)
+        return result
+
+    def _book_name(self, book):
+        """The file name of an external workbook, from [n] link indexes as well as [name] references."""
+        if not book.isdigit():
+            return book
+        links = self.workbook._external_links
+        index = int(book) - 1
+        if not 0 <= index < len(links) or links[index].file_link is None:
+            raise FormulaError(f"Unknown external link [{book}]")
+        return os.path.basename(unquote(links[index].file_link.Target).replace("\\", "/"))
+
+    def _external(self, book):
+        name = self._book_name(book)
+        if name not in self._books:
+            # A path in the reference wins, then the file name in directory
+            base = os.path.basename(name.replace("\\", "/"))
+            candidates = [name] if os.path.isabs(name) else []
+            if self.directory:
+                candidates += [os.path.join(self.directory, name), os.path.join(self.directory, base)]
+            path = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+            if path:
+                external = self.loader(path)
+            else:
+                external = self._cached_link_workbook(base)
+            self._books[name] = WorkbookEvaluator(external, self.directory, self.loader, self._books)
+        return self._books[name]
+
+    def _cached_link_workbook(self, name):
+        """A workbook of the values Excel cached for an external link, for when its file is missing."""
+        for link in self.workbook._external_links:
+            target = link.file_link.Target if link.file_link is not None else ""
+            if os.path.basename(unquote(target).replace("\\", "/")) != name or link.externalBook is None:
+                continue
+            book = link.externalBook
+            cached = Workbook()
+            cached.remove(cached.active)
+            sheet_names = book.sheetNames.sheetName if book.sheetNames is not None else []
+            sheets = [cached.create_sheet(sheet_name) for sheet_name in sheet_names]
+            for data in (book.sheetDataSet.sheetData if book.sheetDataSet is not None else []):
+                for row in data.row:
+                    for cell in row.cell:
+                        value = cell.v
+                        if value is not None and cell.t in (None, "n"):
+                            value = float(value)
+                        elif cell.t == "b":
+                            value = value == "1"
+                        sheets[data.sheetId][cell.r] = value
+            return cached
+        raise FormulaError(f"External workbook {name} not found")
@@ -0,0 +1,199 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+'''
+Lightweight run metrics: stage timers, counters and latency histograms.
+
+Every script records into one process-wide registry as it runs:
+
+- timer(name): wall time of a stage (HTTP page fetch, labelling, workbook
+  load, cell writes, save), as a call count, total and maximum
+- count(name, n): rows, pages, cells and bytes handled
+- observe(name, seconds): latencies bucketed into a histogram (HTTP requests)
+
+Recording is always on and costs a dictionary update per event. Nothing is
+written unless start() is called, which the scripts do from __main__ when
+METRICS_FORMAT is set in config.py: at exit a JSON or OpenMetrics-text
+summary is written to METRICS_DIRECTORY, and with METRICS_RUN_LOG a per-run
+log of every timed event and log message (including those hidden by
+verbose=False) is written next to it.
+'''
+
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+FORMATS = ("json", "openmetrics")
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_histograms = {}
+_run = {"name": None, "started": None, "log": None}
+
+
+def reset():
+    """Forget everything recorded so far."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _histograms.clear()
+
+
+def count(name, value=1):
+    """Add value to the counter called name."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Record one latency sample in the histogram called name."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "count": 0, "sum": 0.0}
+        for index, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+
+def _add_time(name, seconds):
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+        timer["count"] += 1
+        timer["seconds"] += seconds
+        timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+
+@contextlib.contextmanager
+def timer(name, histogram=False):
+    """Time the block under name (also recorded when it raises), optionally into a histogram too."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _add_time(name, seconds)
+        if histogram:
+            observe(name, seconds)
+        log(f"{name} took {seconds:.3f}s", event=name, seconds=round(seconds, 6))
+
+
+def timed(name):
+    """Decorator form of timer()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log(message, **fields):
+    """Append a line to the per-run log, if one is open."""
+    log_file = _run["log"]
+    if log_file is None:
+        return
+    line = json.dumps({"time": datetime.now().isoformat(timespec="milliseconds"), "message": message, **fields},
+                      ensure_ascii=False)
+    with _lock:
+        log_file.write(line + "\n")
+
+
+def summary():
+    """Everything recorded so far as a JSON-serialisable dict."""
+    with _lock:
+        return {
+            "run": _run["name"],
+            "started": _run["started"],
+            "timers": {name: {"count": timer["count"], "seconds": round(timer["seconds"], 6),
+                              "max_seconds": round(timer["max_seconds"], 6)}
+                       for name, timer in sorted(_timers.items())},
+            "counters": dict(sorted(_counters.items())),
+            "histograms": {name: {"buckets": {("+Inf" if bound == float("inf") else str(bound)): hits
+                                              for bound, hits in zip(HISTOGRAM_BUCKETS, histogram["buckets"])},
+                                  "count": histogram["count"], "sum": round(histogram["sum"], 6)}
+                           for name, histogram in sorted(_histograms.items())},
+        }
+
+
+def _metric_name(name):
+    return "finance_" + "".join(char if char.isalnum() else "_" for char in name)
+
+
+def to_openmetrics(data=None):
+    """Render a summary() dict in the OpenMetrics text format."""
+    data = data or summary()
+    lines = []
+    for name, timer in data["timers"].items():
+        if name in data["histograms"]:
+            continue  # Exposed as the histogram of the same name below
+        metric = _metric_name(name) + "_seconds"
+        lines += [f"# TYPE {metric} summary", f"{metric}_count {timer['count']}", f"{metric}_sum {timer['seconds']}"]
+    for name, value in data["counters"].items():
+        metric = _metric_name(name)
+        lines += [f"# TYPE {metric} counter", f"{metric}_total {value}"]
+    for name, histogram in data["histograms"].items():
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        lines += [f'{metric}_bucket{{le="{bound}"}} {hits}' for bound, hits in histogram["buckets"].items()]
+        lines += [f"{metric}_count {histogram['count']}", f"{metric}_sum {histogram['sum']}"]
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_summary(path, fmt="json"):
+    """Write the summary to path as JSON or OpenMetrics text."""
+    data = summary()
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "openmetrics":
+            f.write(to_openmetrics(data))
+        else:
+            json.dump(data, f, indent=2)
+    return path
+
+
+def start(run_name, fmt=None, directory=None, run_log=None):
+    """
+    Write a summary of this run when the process exits.
+
+    fmt, directory and run_log default to METRICS_FORMAT, METRICS_DIRECTORY
+    and METRICS_RUN_LOG from config.py; nothing happens when the format is
+    None. Files are named after run_name and the start time. Returns the
+    summary path that will be written, or None.
+    """
+    from settings import METRICS_DIRECTORY, METRICS_FORMAT, METRICS_RUN_LOG
+
+    fmt = fmt or METRICS_FORMAT
+    if not fmt:
+        return None
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown metrics format {fmt!r}; use one of {', '.join(FORMATS)}")
+
+    directory = directory or METRICS_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.now()
+    stem = os.path.join(directory, f"{run_name}-{started:%Y%m%d-%H%M%S}")
+    _run.update(name=run_name, started=started.isoformat(timespec="seconds"))
+    if METRICS_RUN_LOG if run_log is None else run_log:
+        _run["log"] = open(f"{stem}.log", "a", encoding="utf-8")
+
+    path = f"{stem}.{'prom' if fmt == 'openmetrics' else 'json'}"
+
+    def finish():
+        write_summary(path, fmt)
+        if _run["log"] is not None:
+            _run["log"].close()
+            _run["log"] = None
+        print(f"Metrics written to {path}")
+
+    atexit.register(finish)
+    return path
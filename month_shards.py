@@ -0,0 +1,118 @@
+import calendar
+import hashlib
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import atomic_save
+from openpyxl import Workbook, load_workbook
+from settings import CURRENT_YEAR, MASTER_SHARD_DIRECTORY, SHARD_CLOSE_DAYS
+
+'''
+Per-month layout of the collated monthly spend (MASTER_LAYOUT = "sharded").
+
+Instead of one "{year} Monthly Spend.xlsx" rebuilt as a whole, the collator
+writes each month to its own workbook in MASTER_SHARD_DIRECTORY, e.g.
+"2025-03 March.xlsx" holding a "March" sheet, plus a small index.xlsx listing
+every shard with its row count, a digest of the weekly data it was built
+from and whether the month is closed.
+
+A month is closed SHARD_CLOSE_DAYS after it ends; its shard is then never
+rewritten, and open months are only rewritten when their weekly data
+changes. Readers open just the month they need with open_month(), and the
+Budget sheet's external references point at the shard of the month (see
+external_reference()).
+'''
+
+INDEX_FILE = "index.xlsx"
+INDEX_SHEET = "Index"
+INDEX_HEADER = ["Month", "Number", "File", "Rows", "Source Digest", "Closed", "Written"]
+MONTHS = list(calendar.month_name)[1:]
+
+ShardEntry = namedtuple("ShardEntry", ["month", "number", "file", "rows", "digest", "closed", "written"])
+
+
+def shard_file(month_number, year=CURRENT_YEAR):
+    """File name of a month's shard, e.g. shard_file(3, 2025) -> '2025-03 March.xlsx'."""
+    return f"{year}-{month_number:02d} {MONTHS[month_number - 1]}.xlsx"
+
+
+def shard_path(month_number, year=CURRENT_YEAR, directory=None):
+    return os.path.join(directory or MASTER_SHARD_DIRECTORY, shard_file(month_number, year))
+
+
+def is_closed(month_number, year=CURRENT_YEAR, today=None, grace_days=None):
+    """Whether a month ended more than grace_days (SHARD_CLOSE_DAYS) ago."""
+    today = today or date.today()
+    grace_days = SHARD_CLOSE_DAYS if grace_days is None else grace_days
+    last_day = date(year, month_number, calendar.monthrange(year, month_number)[1])
+    return today > last_day + timedelta(days=grace_days)
+
+
+def source_digest(weekly_workbooks, max_column):
+    """Digest of the weekly data a shard is built from: each file name and the values of its active sheet."""
+    digest = hashlib.blake2b(digest_size=16)
+    for file, workbook in weekly_workbooks:
+        digest.update(file.encode("utf-8"))
+        for row in workbook.active.iter_rows(max_col=max_column, values_only=True):
+            digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_index(directory=None):
+    """The shard index as {month name: ShardEntry}, empty if there is none yet."""
+    path = os.path.join(directory or MASTER_SHARD_DIRECTORY, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    wb = load_workbook(path, read_only=True)
+    try:
+        entries = {}
+        for values in wb[INDEX_SHEET].iter_rows(min_row=2, max_col=len(INDEX_HEADER), values_only=True):
+            if values[0] is None:
+                continue
+            entry = ShardEntry(*values)
+            entries[entry.month] = entry._replace(number=int(entry.number), rows=int(entry.rows or 0),
+                                                  closed=bool(entry.closed))
+        return entries
+    finally:
+        wb.close()
+
+
+def write_index(entries, directory=None):
+    """Write the shard index, one row per month in calendar order."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = INDEX_SHEET
+    ws.append(INDEX_HEADER)
+    for entry in sorted(entries.values(), key=lambda entry: entry.number):
+        ws.append(list(entry))
+        ws.cell(row=ws.max_row, column=len(INDEX_HEADER)).number_format = "D/MM/YYYY H:MM"
+    path = os.path.join(directory or MASTER_SHARD_DIRECTORY, INDEX_FILE)
+    atomic_save.save_workbook(wb, path)
+    return path
+
+
+def new_entry(month_number, rows, digest, year=CURRENT_YEAR):
+    return ShardEntry(MONTHS[month_number - 1], month_number, shard_file(month_number, year), rows, digest,
+                      is_closed(month_number, year), datetime.now().replace(microsecond=0))
+
+
+def open_month(month, year=CURRENT_YEAR, directory=None, **load_options):
+    """
+    Open only the shard for month (a name like 'March' or a number), or None
+    if it has not been written. Loads go through workbook_cache.
+    """
+    import workbook_cache
+
+    number = month if isinstance(month, int) else MONTHS.index(month) + 1
+    path = shard_path(number, year, directory)
+    if not os.path.exists(path):
+        return None
+    return workbook_cache.load(path, **load_options)
+
+
+def external_reference(month, year=CURRENT_YEAR, directory=None):
+    """The quoted workbook and sheet prefix formulas use for a month's shard, e.g. '/dir/[2025-03 March.xlsx]March'."""
+    number = month if isinstance(month, int) else MONTHS.index(month) + 1
+    folder = os.path.join(directory or MASTER_SHARD_DIRECTORY, "").replace("'", "''")
+    return f"'{folder}[{shard_file(number, year)}]{MONTHS[number - 1]}'"
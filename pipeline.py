@@ -0,0 +1,252 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from functools import partial
+import metrics
+import profiling
+
+'''
+In-process pipeline runner.
+
+Runs the whole weekly process (fetch card, fetch debit, label, write weekly,
+collate, update budget) inside one Python process as a DAG of stages. Each
+stage receives the results of the stages it depends on as keyword arguments,
+so transactions and workbooks are handed along in memory instead of being
+re-fetched or re-read from disk, and stages that do not depend on each other
+(e.g. the card and debit fetches) run concurrently.
+'''
+
+
+class Stage:
+    """A named unit of work, the names of the stages it depends on and those it only runs after."""
+
+    def __init__(self, name, func, deps=(), optional=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.optional = tuple(optional)
+
+
+class Pipeline:
+    """Runs a DAG of stages in-process, starting each stage as soon as its dependencies finish."""
+
+    def __init__(self, max_workers=4, verbose=True):
+        self.stages = {}
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.failed = set()
+
+    def _log(self, message, is_error=False):
+        """Prints messages if verbose is True or if it's an error."""
+        metrics.log(message)
+        if is_error or self.verbose:
+            print(message)
+
+    def add_stage(self, name, func, deps=(), optional=()):
+        """
+        Register a stage.
+
+        Optional dependencies are waited for but do not have to succeed: the
+        stage receives their result, or None if they failed or were skipped.
+        Dependencies must already be registered, which keeps the graph acyclic
+        and the registration order a valid topological order.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        unknown = [dep for dep in tuple(deps) + tuple(optional) if dep not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(unknown)}")
+        self.stages[name] = Stage(name, func, deps, optional)
+
+    def run(self):
+        """
+        Run every stage and return a dict of stage name to result.
+
+        A failing stage does not stop independent branches; only the stages
+        that depend on it are skipped, not those for which it is optional.
+        Failed and skipped stages are recorded in self.failed.
+        """
+        results = {}
+        self.failed = set()
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Registration order is topological, so one pass skips transitive dependents
+                for name, stage in list(pending.items()):
+                    if any(dep in self.failed for dep in stage.deps):
+                        self._log(f"⏭ Skipping {name}: an upstream stage failed", is_error=True)
+                        self.failed.add(name)
+                        del pending[name]
+
+                # Start every stage whose dependencies have all completed
+                for name, stage in list(pending.items()):
+                    if (all(dep in results for dep in stage.deps)
+                            and all(dep in results or dep in self.failed for dep in stage.optional)):
+                        self._log(f"▶ Starting {name}")
+                        kwargs = {dep: results[dep] for dep in stage.deps}
+                        kwargs.update({dep: results.get(dep) for dep in stage.optional})
+                        func = metrics.timed(f"stage.{name}")(profiling.stage(name)(stage.func))
+                        running[executor.submit(func, **kwargs)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        self._log(f"✅ Finished {name}")
+                    except Exception as e:
+                        self.failed.add(name)
+                        self._log(f"❌ Stage {name} failed: {str(e)}", is_error=True)
+
+        return results
+
+
+def default_start_date():
+    """Start from the last bank_feeds run, or DAYS_TO_FETCH days ago if it has never run."""
+    import bank_feeds
+    from settings import DAYS_TO_FETCH
+
+    last_run = bank_feeds.get_last_run_date()
+    if last_run is None:
+        last_run = (datetime.now() - timedelta(days=DAYS_TO_FETCH)).date()
+    return last_run.strftime('%Y-%m-%d')
+
+
+# Stage functions. Parameter names match the stage names they consume.
+
+def _card_checkpoint(start_date):
+    from checkpoint import Checkpoint
+    from settings import ULTIMATE_AWARDS_CC_ID
+    # A resumed fetch keeps the end date of the run it resumes
+    return Checkpoint(f"pipeline:{ULTIMATE_AWARDS_CC_ID}:{start_date}", params={"end_date": str(datetime.now())})
+
+
+def _fetch_card(start_date, card_checkpoint):
+    import bank_feeds
+    # Pages are journaled, so a rerun after a failed fetch resumes instead of starting over
+    return bank_feeds.fetch_transactions(start_date, card_checkpoint)
+
+
+def _fetch_debit():
+    import updateMyBuckets
+    fetcher = updateMyBuckets.updateMyBuckets()
+    return fetcher.format_transaction_data(fetcher.fetch_transactions())
+
+
+def _store_debit(fetch_debit):
+    import updateMyBuckets
+    # Stored before the weekly workbook is written so card repayments are linked as transfers
+    updateMyBuckets.updateMyBuckets().store_transactions(fetch_debit)
+    return True
+
+
+def _export_debit(store_debit):
+    import updateMyBuckets
+    return updateMyBuckets.updateMyBuckets().export_transactions()
+
+
+def _load_budget(verbose):
+    from BudgetUpdater import BudgetUpdater
+    return BudgetUpdater(verbose=verbose)
+
+
+def _label(fetch_card):
+    import bank_feeds
+    transactions, _ = bank_feeds.collapse_pending_transactions(fetch_card)
+    categorized = bank_feeds.categorize_and_label_transactions(transactions)
+    bank_feeds.apply_refund_labels(categorized)
+    return categorized
+
+
+def _write_weekly(start_date, label, card_checkpoint, store_debit=None):
+    import bank_feeds
+    from settings import TRANSACTION_DIRECTORY
+
+    if not label:
+        print("No card transactions found; weekly spreadsheet not written.")
+        card_checkpoint.complete()
+        return {}
+
+    spreadsheet_path = bank_feeds.generate_spreadsheet_name(start_date, TRANSACTION_DIRECTORY)
+    # Without this run's debit rows, linking now could miss repayments; the next run links them
+    wb = bank_feeds.save_weekly_transactions(label, spreadsheet_path, link_transfers=bool(store_debit))
+    bank_feeds.save_last_run_date()
+    card_checkpoint.complete()
+    return {os.path.basename(spreadsheet_path): wb}
+
+
+def _collate(verbose, write_weekly):
+    from collate_spreadsheets import SpreadsheetCollator
+    from transaction_store import TransactionStore
+    collator = SpreadsheetCollator(verbose=verbose)
+    collator.collate_monthly_spreadsheets(preloaded_workbooks=write_weekly, store=TransactionStore())
+
+
+def _update_budget(load_budget, export_debit, collate):
+    # The debit rows were stored and exported by their own stages; nothing to fetch or save again
+    load_budget.run_all_updates(debit_transactions=[])
+    load_budget.save_workbook()
+
+
+def _archive(start_date, update_budget):
+    import transaction_archive
+    if not transaction_archive.pyarrow_available():
+        print("pyarrow is not installed; transaction archive not updated.")
+        return 0
+    # Partitions are rewritten whole, so refresh from the start of the first month fetched
+    return transaction_archive.export_archive(start_date=start_date[:8] + "01")
+
+
+def build_default_pipeline(start_date, verbose=False, max_workers=4):
+    """
+    Build the standard weekly pipeline.
+
+    fetch_card ──> label ───────> write_weekly ──> collate ──┐
+    fetch_debit ──> store_debit ┄┄┘                          │
+                         └──> export_debit ──────────────────┼──> update_budget
+    load_budget ─────────────────────────────────────────────┘           └──> archive
+
+    Loading the budget .xlsm has no inputs, so it overlaps the API fetches.
+    card_checkpoint journals the pages fetch_card gets and is completed by
+    write_weekly once the week is saved, so a failed fetch resumes on rerun.
+    store_debit is optional for write_weekly (┄): the week is written even if
+    the debit fetch fails, and card repayments are only linked when it worked.
+    Debit rows are stored and linked once by store_debit and exported once by
+    export_debit; update_budget reads them from the store.
+    """
+    pipeline = Pipeline(max_workers=max_workers, verbose=verbose)
+    pipeline.add_stage("card_checkpoint", partial(_card_checkpoint, start_date))
+    pipeline.add_stage("fetch_card", partial(_fetch_card, start_date), deps=("card_checkpoint",))
+    pipeline.add_stage("fetch_debit", _fetch_debit)
+    pipeline.add_stage("load_budget", partial(_load_budget, verbose))
+    pipeline.add_stage("label", _label, deps=("fetch_card",))
+    pipeline.add_stage("store_debit", _store_debit, deps=("fetch_debit",))
+    pipeline.add_stage("write_weekly", partial(_write_weekly, start_date),
+                       deps=("label", "card_checkpoint"), optional=("store_debit",))
+    pipeline.add_stage("collate", partial(_collate, verbose), deps=("write_weekly",))
+    pipeline.add_stage("export_debit", _export_debit, deps=("store_debit",))
+    pipeline.add_stage("update_budget", _update_budget, deps=("load_budget", "export_debit", "collate"))
+    pipeline.add_stage("archive", partial(_archive, start_date), deps=("update_budget",))
+    return pipeline
+
+
+def run_pipeline(start_date=None, verbose=False):
+    """Run the standard pipeline without prompting. Returns True if every stage succeeded."""
+    if start_date is None:
+        start_date = default_start_date()
+    print(f"\nRunning pipeline for transactions from {start_date}...")
+
+    pipeline = build_default_pipeline(start_date, verbose=verbose)
+    pipeline.run()
+
+    if pipeline.failed:
+        print(f"\nPipeline finished with failed or skipped stages: {', '.join(sorted(pipeline.failed))}")
+        return False
+    print("\nPipeline completed successfully!")
+    return True
@@ -0,0 +1,188 @@
+import cProfile
+import contextlib
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+'''
+--profile support for every entry point.
+
+Each script's __main__ runs inside from_command_line(name), which takes
+--profile[=DIR] and --flamegraph off the command line before the script
+parses it. With --profile the run is wrapped in cProfile and tracemalloc and
+these files are written to DIR (default PROFILE_DIRECTORY in config.py):
+
+- {name}-{time}.pstats: the cProfile stats, for pstats or snakeviz
+- {name}-{time}-alloc.txt: the top allocation sites still held at the end,
+  and the top sites each pipeline stage allocated
+- {name}-{time}-stage-{stage}.pstats: one per pipeline stage (stages run on
+  worker threads, which the whole-run profile does not see)
+- {name}-{time}.collapsed: with --flamegraph, stacks sampled from every
+  thread in the collapsed format read by flamegraph.pl and speedscope
+
+Example:
+    python collate_spreadsheets.py --profile --flamegraph
+    python run_programs.py --pipeline --profile=/tmp/profiles
+'''
+
+TOP_N = 25
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples for --flamegraph
+
+_session = None
+
+
+class ProfileSession:
+    """Profiles one run and writes its reports under directory/prefix."""
+
+    def __init__(self, name, directory, flamegraph=False, top=TOP_N):
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+        self.flamegraph = flamegraph
+        self.top = top
+        self.profiler = cProfile.Profile()
+        self.stage_allocations = []
+        self._lock = threading.Lock()
+        self._sampler = _StackSampler() if flamegraph else None
+
+    def __enter__(self):
+        global _session
+        _session = self
+        tracemalloc.start()
+        if self._sampler:
+            self._sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _session
+        self.profiler.disable()
+        if self._sampler:
+            self._sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        _session = None
+        self.write_reports(snapshot)
+
+    def profile_stage(self, stage_name, func, *args, **kwargs):
+        """Run func under its own cProfile and record what it allocated."""
+        profiler = cProfile.Profile()
+        before = tracemalloc.take_snapshot()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process, and the
+            # whole-run profile already sees every thread there
+            profiler = None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(f"{self.prefix}-stage-{stage_name}.pstats")
+            # Comparing snapshots walks every traced block, so this is the slow part of a profiled pipeline
+            allocated = tracemalloc.take_snapshot().compare_to(before, "lineno")
+            with self._lock:
+                self.stage_allocations.append((stage_name, allocated[:self.top]))
+
+    def write_reports(self, snapshot):
+        self.profiler.dump_stats(f"{self.prefix}.pstats")
+
+        with open(f"{self.prefix}-alloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"Top {self.top} allocation sites still held at exit\n\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+            for stage_name, allocated in self.stage_allocations:
+                f.write(f"\nTop {self.top} allocation sites in stage {stage_name} (growth during the stage)\n\n")
+                for stat in allocated:
+                    f.write(f"{stat}\n")
+
+        if self._sampler:
+            with open(f"{self.prefix}.collapsed", "w", encoding="utf-8") as f:
+                for stack, hits in sorted(self._sampler.stacks.items()):
+                    f.write(f"{stack} {hits}\n")
+
+        summary = io.StringIO()
+        pstats.Stats(self.profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        print(summary.getvalue())
+        print(f"Profile written to {self.prefix}.pstats (allocations in {self.prefix}-alloc.txt"
+              + (f", stacks in {self.prefix}.collapsed)" if self._sampler else ")"))
+
+
+class _StackSampler:
+    """Samples the stacks of all other threads on a background thread."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+
+def stage(name):
+    """
+    Decorator for a pipeline stage: profiled on its own when a --profile run
+    is active, otherwise a plain call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            session = _session
+            if session is None:
+                return func(*args, **kwargs)
+            return session.profile_stage(name, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def from_command_line(name, argv=None):
+    """
+    Remove --profile[=DIR] and --flamegraph from argv (sys.argv by default)
+    and return a ProfileSession for them, or a no-op context without --profile.
+    """
+    argv = sys.argv if argv is None else argv
+    directory, flamegraph, profile = None, False, False
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            profile = True
+            directory = arg.partition("=")[2] or None
+            argv.remove(arg)
+        elif arg == "--flamegraph":
+            flamegraph = True
+            argv.remove(arg)
+    if not profile:
+        return contextlib.nullcontext()
+    return session(name, directory, flamegraph)
+
+
+def session(name, directory=None, flamegraph=False):
+    """A ProfileSession writing to directory, or PROFILE_DIRECTORY from config.py."""
+    if not directory:
+        from settings import PROFILE_DIRECTORY
+        directory = PROFILE_DIRECTORY
+    return ProfileSession(name, directory, flamegraph=flamegraph)
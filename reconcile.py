@@ -0,0 +1,236 @@
+import math
+import re
+from collections import defaultdict, deque, namedtuple
+from difflib import SequenceMatcher
+
+'''
+Credit/debit reconciliation.
+
+Pairs each credit (refund or reversal) with the debit it reverses so the pair
+can be netted out of the split. Debits are hash-indexed on (normalised payee,
+amount bucket) and transactions are visited one day at a time, so each credit
+only looks at a few buckets and expired debits fall out of a sliding window.
+The whole pass is O(n + days), not O(n^2).
+
+Also collapses pending transactions into their posted twins. PocketSmith gives
+the posted transaction a new id and often a slightly different payee or amount
+(tips, FX settlement), so candidates are blocked by date bucket and amount band
+and only the few in neighbouring blocks are scored on payee similarity.
+
+Finally links transfers between two accounts, e.g. a card repayment that
+leaves the debit account and lands on the credit card, by looking up the
+opposite amount on nearby dates in a (date, cents) index of the other account.
+'''
+
+RefundMatch = namedtuple("RefundMatch", ["debit", "credit", "days_apart", "difference_cents"])
+DuplicateMatch = namedtuple("DuplicateMatch", ["pending", "posted", "similarity", "difference_cents"])
+TransferMatch = namedtuple("TransferMatch", ["outgoing", "incoming", "days_apart"])
+
+# Words that banks add to refund descriptions but not to the original purchase
+_NOISE_WORDS = {"REFUND", "REFUNDS", "REVERSAL", "REVERSED", "CREDIT", "RETURN", "CR", "RFND",
+                "PENDING", "AUTHORISATION", "AUTHORIZATION", "AUTH"}
+_NON_ALPHA = re.compile(r"[^A-Z ]+")
+
+
+def normalise_payee(description, tokens=3):
+    """Reduce a payee to its first few meaningful words, e.g. 'REFUND Amazon AU*123' -> 'AMAZON AU'."""
+    words = _NON_ALPHA.sub(" ", str(description or "").upper()).split()
+    return " ".join([word for word in words if word not in _NOISE_WORDS and len(word) > 1][:tokens])
+
+
+def match_refunds(transactions, window_days=60, tolerance_cents=0):
+    """
+    Pair credits with their originating debits.
+
+    A credit matches an unmatched debit with the same normalised payee, an
+    absolute amount within tolerance_cents, dated on or up to window_days
+    before the credit. When several debits qualify, the most recent wins.
+
+    Args:
+        transactions: Iterable of records.Transaction (debits negative,
+            credits positive).
+        window_days: How far back a refund may reach for its purchase.
+        tolerance_cents: Largest allowed difference between the two amounts.
+
+    Returns:
+        A list of RefundMatch(debit, credit, days_apart, difference_cents).
+    """
+    # Bucket width > tolerance means a match can only be in the same or a neighbouring bucket
+    bucket_width = tolerance_cents + 1
+
+    # Group by day so the sweep below runs in date order without a comparison sort
+    by_day = defaultdict(list)
+    for tx in transactions:
+        if tx.amount_cents:
+            by_day[tx.date.toordinal()].append(tx)
+    if not by_day:
+        return []
+
+    open_debits = defaultdict(deque)  # (payee, bucket) -> deque of (day, abs cents, tx), oldest first
+    matches = []
+    first_day, last_day = min(by_day), max(by_day)
+
+    for day in range(first_day, last_day + 1):
+        entries = by_day.get(day)
+        if not entries:
+            continue
+
+        # Index the day's debits first so same-day reversals can match
+        for tx in entries:
+            if tx.amount_cents < 0:
+                key = (normalise_payee(tx.description), -tx.amount_cents // bucket_width)
+                open_debits[key].append((day, -tx.amount_cents, tx))
+
+        for tx in entries:
+            amount_cents = tx.amount_cents
+            if amount_cents <= 0:
+                continue
+            payee = normalise_payee(tx.description)
+            bucket = amount_cents // bucket_width
+            best = None
+            for key in ((payee, bucket), (payee, bucket - 1), (payee, bucket + 1)):
+                candidates = open_debits.get(key)
+                if not candidates:
+                    continue
+                # Slide the window: debits too old for this credit are too old for every later one
+                while candidates and candidates[0][0] < day - window_days:
+                    candidates.popleft()
+                # Newest first; a deque scan is short because buckets are narrow
+                for index in range(len(candidates) - 1, -1, -1):
+                    debit_day, debit_cents, _ = candidates[index]
+                    if abs(debit_cents - amount_cents) <= tolerance_cents:
+                        if best is None or debit_day > best[0]:
+                            best = (debit_day, key, index)
+                        break
+            if best is None:
+                continue
+
+            debit_day, key, index = best
+            _, debit_cents, debit = open_debits[key][index]
+            del open_debits[key][index]
+            matches.append(RefundMatch(debit, tx, day - debit_day, amount_cents - debit_cents))
+
+    return matches
+
+
+def payee_similarity(a, b, threshold=0.0):
+    """
+    Similarity of two normalised payees from 0 to 1 (difflib ratio).
+
+    The cheap upper bounds are checked first, so pairs that cannot reach
+    threshold return 0.0 without running the full comparison.
+    """
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+
+def _is_pending(tx):
+    return str(tx.status or "").lower() == "pending"
+
+
+def collapse_pending_duplicates(transactions, window_days=5, amount_tolerance=0.25, min_similarity=0.6):
+    """
+    Drop pending transactions that also appear as a posted transaction.
+
+    A pending transaction pairs with a posted one of the same sign dated within
+    window_days, whose amount differs by at most amount_tolerance (a fraction
+    of the smaller amount, so 0.25 allows a 25% tip) and whose payee similarity
+    is at least min_similarity. Transactions without an explicit 'pending'
+    status are never dropped, so genuine repeat purchases are left alone.
+
+    Returns (kept, duplicates): the transactions without the collapsed pending
+    ones, in their original order, and a list of
+    DuplicateMatch(pending, posted, similarity, difference_cents).
+    """
+    # Width of a date block and an amount band; a match is always in the same
+    # or a neighbouring block/band, so each pending looks at nine buckets at most
+    day_width = window_days + 1
+    band_width = math.log1p(amount_tolerance) if amount_tolerance > 0 else None
+
+    def band(cents):
+        return int(math.log(cents) / band_width) if band_width else cents
+
+    pending, posted_blocks = [], defaultdict(list)
+    for position, tx in enumerate(transactions):
+        amount_cents = tx.amount_cents
+        if not amount_cents:
+            continue
+        entry = (position, tx, tx.date.toordinal(), amount_cents, normalise_payee(tx.description, tokens=4))
+        if _is_pending(tx):
+            pending.append(entry)
+        else:
+            posted_blocks[(entry[2] // day_width, band(abs(amount_cents)))].append(entry)
+
+    duplicates, dropped, used = [], set(), set()
+    for position, tx, day, amount_cents, payee in pending:
+        abs_cents = abs(amount_cents)
+        best = None
+        for day_block in (day // day_width - 1, day // day_width, day // day_width + 1):
+            for amount_band in (band(abs_cents) - 1, band(abs_cents), band(abs_cents) + 1):
+                for candidate in posted_blocks.get((day_block, amount_band), ()):
+                    other_position, _, other_day, other_cents, other_payee = candidate
+                    if other_position in used or (other_cents > 0) != (amount_cents > 0):
+                        continue
+                    if abs(other_day - day) > window_days:
+                        continue
+                    smaller, larger = sorted((abs_cents, abs(other_cents)))
+                    if larger > smaller * (1 + amount_tolerance):
+                        continue
+                    similarity = payee_similarity(payee, other_payee, min_similarity)
+                    if similarity < min_similarity:
+                        continue
+                    # Most similar payee wins, then the closest date, then the closest amount
+                    rank = (similarity, -abs(other_day - day), -abs(other_cents - amount_cents))
+                    if best is None or rank > best[0]:
+                        best = (rank, candidate)
+        if best is None:
+            continue
+
+        rank, (other_position, other_tx, _, other_cents, _) = best
+        used.add(other_position)
+        dropped.add(position)
+        duplicates.append(DuplicateMatch(tx, other_tx, rank[0], other_cents - amount_cents))
+
+    kept = [tx for position, tx in enumerate(transactions) if position not in dropped]
+    return kept, duplicates
+
+
+def match_transfers(transactions, other_transactions, window_days=2):
+    """
+    Link opposite-sign pairs between two accounts' transactions.
+
+    other_transactions is indexed once by (day, cents); each transaction then
+    looks up the negated amount on the days within window_days, nearest day
+    first, so the pass is O(n + m) however long either list is. Each
+    transaction is linked at most once.
+
+    Returns a list of TransferMatch(outgoing, incoming, days_apart), where
+    outgoing is the negative side of the pair.
+    """
+    index = defaultdict(deque)  # (day, cents) -> deque of transactions, in input order
+    for tx in other_transactions:
+        if tx.amount_cents:
+            index[(tx.date.toordinal(), tx.amount_cents)].append(tx)
+
+    # Nearest days first: 0, -1, +1, -2, +2, ...
+    offsets = [0] + [sign * days for days in range(1, window_days + 1) for sign in (-1, 1)]
+
+    matches = []
+    for tx in transactions:
+        if not tx.amount_cents:
+            continue
+        day = tx.date.toordinal()
+        for offset in offsets:
+            candidates = index.get((day + offset, -tx.amount_cents))
+            if candidates:
+                other = candidates.popleft()
+                outgoing, incoming = (tx, other) if tx.amount_cents < 0 else (other, tx)
+                matches.append(TransferMatch(outgoing, incoming, abs(offset)))
+                break
+    return matches
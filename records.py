@@ -0,0 +1,71 @@
+from datetime import date, datetime
+
+'''
+Compact transaction record shared by every script.
+
+A Transaction has fixed __slots__ instead of a per-row dict, a parsed
+datetime.date and an integer amount in cents, so rows are several times
+smaller than the dicts they replace and sums of amounts are exact. Only the
+spreadsheets see dollars, through the amount property.
+'''
+
+
+def to_cents(amount):
+    """Convert a dollar amount (float, int or numeric string) to integer cents."""
+    return int(round(float(amount) * 100))
+
+
+def parse_date(value):
+    """Return value as a datetime.date, from a date, datetime or 'YYYY-MM-DD...' string."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class Transaction:
+    """One transaction from any account. amount_cents is signed: debits are negative."""
+
+    __slots__ = ("id", "date", "description", "amount_cents", "account_id", "category",
+                 "bank_category", "label", "status", "transfer_id", "weekly_file")
+
+    def __init__(self, id, date, description, amount_cents, account_id=None, category=None,
+                 bank_category=None, label=None, status=None, transfer_id=None, weekly_file=None):
+        self.id = id
+        self.date = date
+        self.description = description
+        self.amount_cents = amount_cents
+        self.account_id = account_id
+        self.category = category
+        self.bank_category = bank_category
+        self.label = label
+        self.status = status
+        self.transfer_id = transfer_id
+        self.weekly_file = weekly_file
+
+    @classmethod
+    def from_api(cls, tx, account_id=None):
+        """Build a Transaction from a PocketSmith API transaction."""
+        category = tx.get('category') or {}
+        return cls(
+            id=tx.get('id'),
+            date=parse_date(tx['date']),
+            description=tx.get('payee', ""),
+            amount_cents=to_cents(tx.get('amount', 0)),
+            account_id=account_id,
+            bank_category=category.get('title', ""),
+            status=tx.get('status'),
+        )
+
+    @property
+    def amount(self):
+        """Amount in dollars, for spreadsheets and display."""
+        return self.amount_cents / 100
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"Transaction(id={self.id!r}, date={self.date!s}, description={self.description!r}, "
+                f"amount={self.amount:.2f}, label={self.label!r})")
@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+import metrics
+from settings import (
+    PEOPLE,
+    ULTIMATE_AWARDS_CC_ID,
+    TRANSACTION_DIRECTORY,
+    REPORT_CACHE_PATH,
+    DB_CONFIG,
+)
+
+'''
+Spend reports computed straight from the data, without opening Excel.
+
+- settlement(): what each person owes over any date range, using the same rule
+  as the weekly summary table (own labels plus an equal share of "Both").
+- category_spend(): spend per bank category (or label / month).
+- period_deltas(): either report per month/quarter/year with the change from
+  the previous period.
+
+Every report is a GROUP BY over one of three sources: the local transaction
+store (default, indexed on date), the Postgres shared_transactions table that
+bank_feeds_psql populates, or the weekly workbooks themselves. Aggregates for
+closed periods (ending before the current month) can no longer change and are
+cached in REPORT_CACHE_PATH.
+
+Example:
+    python reports.py settlement --quarter 2025Q2
+    python reports.py categories --year 2025 --source postgres
+    python reports.py deltas --kind settlement --period month --start-date 2025-01-01
+'''
+
+GROUP_COLUMNS = ("label", "bank_category", "month")
+
+
+class StoreSource:
+    """Card transactions in the local SQLite transaction store."""
+
+    name = "store"
+
+    def __init__(self, store=None):
+        from transaction_store import TransactionStore
+        self.store = store or TransactionStore()
+
+    def aggregate(self, start_date, end_date, group_by):
+        expressions = {"label": "label", "bank_category": "bank_category", "month": "substr(date, 1, 7)"}
+        select = ", ".join(f"{expressions[column]} AS {column}" for column in group_by)
+        sql = (
+            f"SELECT {select + ', ' if select else ''}SUM(amount_cents) AS amount_cents, COUNT(*) AS count "
+            "FROM transactions WHERE account_id = ? AND date >= ? AND date <= ? AND transfer_id IS NULL"
+        )
+        if group_by:
+            sql += " GROUP BY " + ", ".join(group_by)
+        params = (str(ULTIMATE_AWARDS_CC_ID), start_date.isoformat(), end_date.isoformat())
+        return [dict(row) for row in self.store.conn.execute(sql, params) if row["count"]]
+
+
+class PostgresSource:
+    """The shared_transactions table populated by bank_feeds_psql."""
+
+    name = "postgres"
+
+    def aggregate(self, start_date, end_date, group_by):
+        # Imported here so the other sources work without the database driver
+        import psycopg2
+
+        expressions = {"label": "label", "bank_category": "bank_category", "month": "to_char(date, 'YYYY-MM')"}
+        select = ", ".join(f"{expressions[column]} AS {column}" for column in group_by)
+        sql = (
+            f"SELECT {select + ', ' if select else ''}"
+            "ROUND(SUM(amount) * 100)::bigint AS amount_cents, COUNT(*) AS count "
+            "FROM shared_transactions WHERE date >= %s AND date <= %s"
+        )
+        if group_by:
+            sql += " GROUP BY " + ", ".join(expressions[column] for column in group_by)
+
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, (start_date, end_date))
+                names = [description[0] for description in cursor.description]
+                return [dict(zip(names, row)) for row in cursor.fetchall() if row[-1]]
+        finally:
+            conn.close()
+
+
+class WorkbookSource:
+    """
+    The weekly workbooks in TRANSACTION_DIRECTORY, aggregated in Python.
+
+    Workbooks rendered before a card repayment was linked still list it, so
+    rows matching a transfer linked in the transaction store (same date,
+    description and amount) are left out, as StoreSource leaves them out.
+    """
+
+    name = "workbooks"
+
+    def __init__(self, directory=None, store=None):
+        self.directory = directory or TRANSACTION_DIRECTORY
+        self._store = store
+
+    @property
+    def store(self):
+        if self._store is None:
+            from transaction_store import TransactionStore
+            self._store = TransactionStore()
+        return self._store
+
+    def _transfers(self, start_date, end_date):
+        """Linked card transfers in the range, counted by (date, description, amount_cents)."""
+        return Counter(
+            (tx.date, tx.description, tx.amount_cents)
+            for tx in self.store.query(account_id=ULTIMATE_AWARDS_CC_ID, start_date=start_date, end_date=end_date)
+            if tx.transfer_id is not None
+        )
+
+    def _rows(self):
+        from openpyxl import load_workbook
+        from records import to_cents
+
+        for file in sorted(os.listdir(self.directory)):
+            if not (file.endswith(".xlsx") and "Week" in file):
+                continue
+            with metrics.timer("workbook.load"):
+                wb = load_workbook(os.path.join(self.directory, file), read_only=True, data_only=True)
+            try:
+                # Columns: Date, Description, Amount, Category, Bank Category, Label
+                for values in wb.active.iter_rows(min_row=2, max_col=6, values_only=True):
+                    tx_date, description, amount, _, bank_category, label = values
+                    if not isinstance(amount, (int, float)) or tx_date is None:
+                        continue
+                    if isinstance(tx_date, datetime):
+                        tx_date = tx_date.date()
+                    else:
+                        try:
+                            tx_date = datetime.strptime(str(tx_date)[:10], "%Y-%m-%d").date()
+                        except ValueError:
+                            continue
+                    yield tx_date, description, bank_category, label, to_cents(amount)
+            finally:
+                wb.close()
+
+    def aggregate(self, start_date, end_date, group_by):
+        groups = {}
+        transfers = self._transfers(start_date, end_date)
+        for tx_date, description, bank_category, label, amount_cents in self._rows():
+            if not start_date <= tx_date <= end_date:
+                continue
+            if transfers[(tx_date, description, amount_cents)]:
+                transfers[(tx_date, description, amount_cents)] -= 1
+                continue
+            values = {"label": label, "bank_category": bank_category, "month": tx_date.strftime("%Y-%m")}
+            key = tuple(values[column] for column in group_by)
+            total = groups.setdefault(key, [0, 0])
+            total[0] += amount_cents
+            total[1] += 1
+        return [
+            {**dict(zip(group_by, key)), "amount_cents": amount_cents, "count": count}
+            for key, (amount_cents, count) in groups.items()
+        ]
+
+
+SOURCES = {"store": StoreSource, "postgres": PostgresSource, "workbooks": WorkbookSource}
+
+
+class ReportCache:
+    """JSON cache of aggregates for periods that have closed."""
+
+    def __init__(self, path=None):
+        self.path = path or REPORT_CACHE_PATH
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+
+    def clear(self):
+        self._entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def is_closed(end_date, today=None):
+    """A period is closed once it ends before the current month starts."""
+    today = today or date.today()
+    return end_date < today.replace(day=1)
+
+
+def aggregate(start_date, end_date, group_by=(), source=None, cache=None):
+    """
+    Sum amount_cents and count transactions per group between two dates (inclusive).
+
+    Results for closed periods are served from and written to the cache.
+    """
+    source = source or StoreSource()
+    group_by = tuple(group_by)
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(unknown)}; choose from {', '.join(GROUP_COLUMNS)}")
+
+    key = f"{source.name}|{start_date}|{end_date}|{','.join(group_by)}"
+    if cache is not None and is_closed(end_date):
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    rows = source.aggregate(start_date, end_date, group_by)
+    if cache is not None and is_closed(end_date):
+        cache.set(key, rows)
+    return rows
+
+
+def settlement(start_date, end_date, source=None, cache=None):
+    """
+    What each person owes between two dates.
+
+    Mirrors the weekly summary table: a person's own labelled amounts plus an
+    equal share of everything labelled "Both". Returns {person: dollars, "Total": dollars}.
+    """
+    by_label = {row["label"]: row["amount_cents"] for row in
+                aggregate(start_date, end_date, ("label",), source, cache)}
+    shared = by_label.get("Both", 0) / len(PEOPLE)
+    owed = {person: round((by_label.get(person, 0) + shared) / 100, 2) for person in PEOPLE}
+    owed["Total"] = round(sum(owed.values()), 2)
+    return owed
+
+
+def category_spend(start_date, end_date, by="bank_category", source=None, cache=None):
+    """
+    Spend per group between two dates as a list of {by, amount, count}.
+
+    Amounts keep the sign of the transactions, so spend is negative. Groups
+    are sorted by spend (-amount), largest first; groups that net to a credit
+    come last.
+    """
+    rows = [{by: row[by], "amount": row["amount_cents"] / 100, "count": row["count"]}
+            for row in aggregate(start_date, end_date, (by,), source, cache)]
+    return sorted(rows, key=lambda row: -row["amount"], reverse=True)
+
+
+def period_bounds(day, period):
+    """First and last day of the month, quarter or year containing day."""
+    months = {"month": 1, "quarter": 3, "year": 12}[period]
+    start = date(day.year, ((day.month - 1) // months) * months + 1, 1)
+    month_index = start.month - 1 + months
+    following = date(start.year + month_index // 12, month_index % 12 + 1, 1)
+    return start, following - timedelta(days=1)
+
+
+def split_periods(start_date, end_date, period):
+    """Split a date range into (name, start, end) months, quarters or years."""
+    periods = []
+    current = start_date
+    while current <= end_date:
+        period_start, period_end = period_bounds(current, period)
+        if period == "month":
+            name = period_start.strftime("%Y-%m")
+        elif period == "quarter":
+            name = f"{period_start.year}Q{(period_start.month - 1) // 3 + 1}"
+        else:
+            name = str(period_start.year)
+        periods.append((name, max(period_start, start_date), min(period_end, end_date)))
+        current = period_end + timedelta(days=1)
+    return periods
+
+
+def period_deltas(start_date, end_date, period="month", kind="category", source=None, cache=None):
+    """
+    Report per period with the change from the previous period.
+
+    kind is "category" (spend per bank category) or "settlement" (per person).
+    Returns a list of {"period", "values": {key: dollars}, "deltas": {key: dollars}}.
+    Each period is aggregated (and cached) separately, so extending a range only
+    queries the new periods.
+    """
+    results, previous = [], None
+    for name, period_start, period_end in split_periods(start_date, end_date, period):
+        if kind == "settlement":
+            values = settlement(period_start, period_end, source, cache)
+        else:
+            values = {row["bank_category"]: row["amount"] for row in
+                      category_spend(period_start, period_end, "bank_category", source, cache)}
+        deltas = {}
+        if previous is not None:
+            for key in set(values) | set(previous):
+                deltas[key] = round(values.get(key, 0) - previous.get(key, 0), 2)
+        results.append({"period": name, "values": values, "deltas": deltas})
+        previous = values
+    return results
+
+
+def parse_range(args):
+    """Resolve --month/--quarter/--year/--start-date/--end-date into a date range."""
+    today = date.today()
+    if args.month:
+        return period_bounds(datetime.strptime(args.month, "%Y-%m").date(), "month")
+    if args.quarter:
+        year, quarter = args.quarter.upper().replace("-", "").split("Q")
+        return period_bounds(date(int(year), (int(quarter) - 1) * 3 + 1, 1), "quarter")
+    if args.year:
+        return date(int(args.year), 1, 1), date(int(args.year), 12, 31)
+    start = datetime.strptime(args.start_date, "%Y-%m-%d").date() if args.start_date else today.replace(day=1)
+    end = datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else today
+    return start, end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-person and per-category spend reports")
+    parser.add_argument("report", choices=["settlement", "categories", "deltas"])
+    parser.add_argument("--source", choices=sorted(SOURCES), default="store")
+    parser.add_argument("--month", help="YYYY-MM")
+    parser.add_argument("--quarter", help="YYYYQn, e.g. 2025Q2")
+    parser.add_argument("--year")
+    parser.add_argument("--start-date", help="YYYY-MM-DD (default: start of this month)")
+    parser.add_argument("--end-date", help="YYYY-MM-DD (default: today)")
+    parser.add_argument("--by", choices=["bank_category", "label", "month"], default="bank_category",
+                        help="Grouping for the categories report")
+    parser.add_argument("--period", choices=["month", "quarter", "year"], default="month",
+                        help="Period length for the deltas report")
+    parser.add_argument("--kind", choices=["category", "settlement"], default="category",
+                        help="What the deltas report compares")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not update the cache")
+    parser.add_argument("--clear-cache", action="store_true", help="Drop all cached results first")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    start_date, end_date = parse_range(args)
+    source = SOURCES[args.source]()
+    cache = None if args.no_cache else ReportCache()
+    if args.clear_cache and cache is not None:
+        cache.clear()
+
+    if args.report == "settlement":
+        result = settlement(start_date, end_date, source, cache)
+    elif args.report == "categories":
+        result = category_spend(start_date, end_date, args.by, source, cache)
+    else:
+        result = period_deltas(start_date, end_date, args.period, args.kind, source, cache)
+
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+        return result
+
+    print(f"\n{args.report.title()} from {start_date} to {end_date} ({source.name})")
+    if args.report == "settlement":
+        for person, amount in result.items():
+            print(f"  {person:<20} {amount:>12,.2f}")
+    elif args.report == "categories":
+        for row in result:
+            print(f"  {str(row[args.by]):<30} {row['amount']:>12,.2f} ({row['count']})")
+    else:
+        for entry in result:
+            print(f"\n  {entry['period']}")
+            for key, amount in sorted(entry["values"].items(), key=lambda item: str(item[0])):
+                delta = entry["deltas"].get(key)
+                change = f"  ({delta:+,.2f})" if delta is not None else ""
+                print(f"    {str(key):<28} {amount:>12,.2f}{change}")
+    return result
+
+
+if __name__ == "__main__":
+    import profiling
+    metrics.start("reports")
+    with profiling.from_command_line("reports"):
+        main()
@@ -1,7 +1,12 @@
+import argparse
+import contextlib
 import subprocess
 import sys
 import os
 
+# Extra arguments passed to every script run from the menu (e.g. --profile)
+SCRIPT_ARGS = []
+
 def clear_screen():
     """Clear the terminal screen based on the operating system."""
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -13,8 +18,9 @@ def print_menu():
     print("2. Run collate_spreadsheets.py")
     print("3. Run BudgetUpdater.py")
     print("4. Run all programs in sequence")
-    print("5. Exit")
-    print("\nPlease enter your choice (1-5): ")
+    print("5. Run full pipeline in-process")
+    print("6. Exit")
+    print("\nPlease enter your choice (1-6): ")
 
 def run_script(script_name):
     """Run a Python script and wait for it to complete."""
@@ -22,7 +28,7 @@ def run_script(script_name):
         print(f"\nRunning {script_name}...")
         # Use the same Python interpreter that's running this script
         python_executable = sys.executable
-        result = subprocess.run([python_executable, script_name], check=True)
+        result = subprocess.run([python_executable, script_name, *SCRIPT_ARGS], check=True)
         print(f"\n{script_name} completed successfully!")
         return True
     except subprocess.CalledProcessError as e:
@@ -52,7 +58,60 @@ def run_all_programs():
         if i < len(programs):
             wait_for_user()
 
+def run_pipeline(start_date=None, verbose=False, record=None, replay=None, recorded_latency=False):
+    """
+    Run all stages in-process as a DAG (see pipeline.py), optionally recording
+    the PocketSmith responses to a fixture or replaying them from one (see api_recording.py).
+    """
+    import pipeline
+    if not (record or replay):
+        return pipeline.run_pipeline(start_date=start_date, verbose=verbose)
+
+    import api_recording
+    with api_recording.session(record, replay, recorded_latency):
+        return pipeline.run_pipeline(start_date=start_date, verbose=verbose)
+
+def parse_args(argv=None):
+    """Parse command-line options for non-interactive runs."""
+    parser = argparse.ArgumentParser(description="Finance program runner")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run all stages in-process without the menu")
+    parser.add_argument("--start-date",
+                        help="Start date (YYYY-MM-DD) for --pipeline; defaults to the last run date")
+    parser.add_argument("--verbose", action="store_true", help="Show detailed logs")
+    parser.add_argument("--record", metavar="FILE",
+                        help="Record the PocketSmith responses of a --pipeline run to a .json.gz fixture")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="Answer PocketSmith requests of a --pipeline run from a recorded fixture")
+    parser.add_argument("--recorded-latency", action="store_true",
+                        help="With --replay, delay each response by its recorded latency")
+    parser.add_argument("--metrics", choices=["json", "openmetrics"],
+                        help="Write stage timings and counters for a --pipeline run (default: METRICS_FORMAT in config.py)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="Profile with cProfile and tracemalloc, writing reports to DIR "
+                             "(default: PROFILE_DIRECTORY in config.py); menu scripts are profiled too")
+    parser.add_argument("--flamegraph", action="store_true",
+                        help="With --profile, also write sampled stacks in collapsed flame graph format")
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
+    if args.pipeline:
+        import metrics
+        metrics.start("pipeline", fmt=args.metrics)
+        profile = contextlib.nullcontext()
+        if args.profile is not None:
+            import profiling
+            profile = profiling.session("pipeline", args.profile, args.flamegraph)
+        with profile:
+            succeeded = run_pipeline(args.start_date, args.verbose, args.record, args.replay, args.recorded_latency)
+        sys.exit(0 if succeeded else 1)
+
+    if args.profile is not None:
+        SCRIPT_ARGS.append(f"--profile={args.profile}" if args.profile else "--profile")
+        if args.flamegraph:
+            SCRIPT_ARGS.append("--flamegraph")
+
     while True:
         clear_screen()
         print_menu()
@@ -73,10 +132,13 @@ def main():
                 run_all_programs()
                 wait_for_user()
             elif choice == '5':
+                run_pipeline()
+                wait_for_user()
+            elif choice == '6':
                 print("\nExiting program. Goodbye!")
                 break
             else:
-                print("\nInvalid choice. Please enter a number between 1 and 5.")
+                print("\nInvalid choice. Please enter a number between 1 and 6.")
                 wait_for_user()
                 
         except KeyboardInterrupt:
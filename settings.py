@@ -0,0 +1,103 @@
+import os
+from functools import lru_cache
+import config
+
+'''
+Settings the scripts read, taken from config.py with defaults for everything
+optional.
+
+config.py is copied from config_template.py once and then edited by hand, so
+it keeps whatever names the template had when it was copied. Scripts import
+their settings from here rather than from config directly: the names every
+config.py has always defined are read as they are, and names added to the
+template since fall back to the defaults below when config.py does not set
+them. An older config.py therefore keeps working without edits. The defaults
+live only here; config_template.py lists commented examples of overriding
+them.
+'''
+
+# Always defined in config.py
+POCKETSMITH_API_KEY = config.POCKETSMITH_API_KEY
+ULTIMATE_AWARDS_CC_ID = config.ULTIMATE_AWARDS_CC_ID
+DEBIT_ID = config.DEBIT_ID
+PEOPLE = config.PEOPLE
+SPREADSHEET_DIRECTORY = config.SPREADSHEET_DIRECTORY
+SUMMARY_FILE = config.SUMMARY_FILE
+CURRENT_YEAR = config.CURRENT_YEAR
+TRANSACTION_DIRECTORY = config.TRANSACTION_DIRECTORY
+BACKUP_DIRECTORY = config.BACKUP_DIRECTORY
+MASTER_SPREADSHEET_NAME = config.MASTER_SPREADSHEET_NAME
+DB_CONFIG = config.DB_CONFIG
+DAYS_TO_FETCH = config.DAYS_TO_FETCH
+
+# Optional: the defaults below apply unless config.py sets the name (examples
+# are at the end of config_template.py)
+POCKETSMITH_API_URL = getattr(config, "POCKETSMITH_API_URL", 'https://api.pocketsmith.com/v2')
+# RUBY_FILL, JACK_FILL and BOTH_FILL are openpyxl PatternFills built lazily from these colours
+FILL_COLORS = getattr(config, "FILL_COLORS", {
+    "RUBY_FILL": "FF2C55",  # Red
+    "JACK_FILL": "5582AE",  # Blue
+    "BOTH_FILL": "00FF00",  # Green
+})
+
+# "single" collates every month into MASTER_SPREADSHEET_NAME; "sharded" writes one workbook per month
+# plus an index to MASTER_SHARD_DIRECTORY (see month_shards.py)
+MASTER_LAYOUT = getattr(config, "MASTER_LAYOUT", "single")
+MASTER_SHARD_DIRECTORY = getattr(config, "MASTER_SHARD_DIRECTORY",
+                                 os.path.join(SPREADSHEET_DIRECTORY, f"{CURRENT_YEAR} Monthly Spend/"))
+SHARD_CLOSE_DAYS = getattr(config, "SHARD_CLOSE_DAYS", 7)  # Days after a month ends before its shard is closed
+
+# Files the scripts keep next to the spreadsheets
+TRANSACTION_STORE_PATH = getattr(config, "TRANSACTION_STORE_PATH",
+                                 os.path.join(SPREADSHEET_DIRECTORY, "transactions.db"))  # transaction_store.py
+ARCHIVE_DIRECTORY = getattr(config, "ARCHIVE_DIRECTORY",
+                            os.path.join(SPREADSHEET_DIRECTORY, "Archive/"))  # transaction_archive.py
+REPORT_CACHE_PATH = getattr(config, "REPORT_CACHE_PATH",
+                            os.path.join(SPREADSHEET_DIRECTORY, "report_cache.json"))  # reports.py
+COLLATION_STATE_PATH = getattr(config, "COLLATION_STATE_PATH",
+                               os.path.join(SPREADSHEET_DIRECTORY, "collation_state.json"))  # --all-years
+CATALOG_PATH = getattr(config, "CATALOG_PATH", os.path.join(SPREADSHEET_DIRECTORY, "catalog.db"))
+CATALOG_POLL_SECONDS = getattr(config, "CATALOG_POLL_SECONDS", 5)  # transaction_catalog.py --watch interval
+
+# Journal of fetched pages, so an interrupted fetch resumes (see checkpoint.py)
+CHECKPOINT_PATH = getattr(config, "CHECKPOINT_PATH", os.path.join(SPREADSHEET_DIRECTORY, "checkpoints.db"))
+CHECKPOINT_MAX_AGE_HOURS = getattr(config, "CHECKPOINT_MAX_AGE_HOURS", 24)  # Older runs start over
+
+# Refunds, pending/posted duplicates and transfers (see reconcile.py)
+REFUND_WINDOW_DAYS = getattr(config, "REFUND_WINDOW_DAYS", 60)  # How far back a refund may reach
+REFUND_TOLERANCE_CENTS = getattr(config, "REFUND_TOLERANCE_CENTS", 0)  # Allowed refund/purchase difference
+DEDUP_WINDOW_DAYS = getattr(config, "DEDUP_WINDOW_DAYS", 5)  # Days between a pending row and its posted twin
+DEDUP_AMOUNT_TOLERANCE = getattr(config, "DEDUP_AMOUNT_TOLERANCE", 0.25)  # Allowed amount change, as a fraction
+DEDUP_MIN_SIMILARITY = getattr(config, "DEDUP_MIN_SIMILARITY", 0.6)  # Minimum payee similarity (0-1)
+TRANSFER_WINDOW_DAYS = getattr(config, "TRANSFER_WINDOW_DAYS", 3)  # Days a repayment may take to land
+
+# Run metrics, profiles and the parsed workbook cache (see metrics.py, profiling.py, workbook_cache.py)
+METRICS_FORMAT = getattr(config, "METRICS_FORMAT", None)  # None, 'json' or 'openmetrics'
+METRICS_DIRECTORY = getattr(config, "METRICS_DIRECTORY", os.path.join(SPREADSHEET_DIRECTORY, "Metrics/"))
+METRICS_RUN_LOG = getattr(config, "METRICS_RUN_LOG", False)
+PROFILE_DIRECTORY = getattr(config, "PROFILE_DIRECTORY", os.path.join(SPREADSHEET_DIRECTORY, "Profiles/"))
+WORKBOOK_CACHE_DIRECTORY = getattr(config, "WORKBOOK_CACHE_DIRECTORY", os.path.join(SPREADSHEET_DIRECTORY, "Cache/"))
+WORKBOOK_CACHE_MAX_MB = getattr(config, "WORKBOOK_CACHE_MAX_MB", 256)  # 0 turns the cache off
+
+@lru_cache(maxsize=None)
+def ensure_directories():
+    """Create the transaction and backup directories if needed. Runs once per process."""
+    os.makedirs(TRANSACTION_DIRECTORY, exist_ok=True)
+    if not os.path.exists(BACKUP_DIRECTORY):
+        print("Back up directory created")
+        os.makedirs(BACKUP_DIRECTORY)
+
+
+@lru_cache(maxsize=None)
+def _solid_fill(color):
+    from openpyxl.styles import PatternFill
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def __getattr__(name):
+    """Build the colour fills on first use so importing settings stays cheap."""
+    if name in FILL_COLORS:
+        # Older config.py files build the fills themselves
+        fill = vars(config).get(name)
+        return fill if fill is not None else _solid_fill(FILL_COLORS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
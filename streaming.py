@@ -0,0 +1,233 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+from datetime import timedelta
+import atomic_save
+import metrics
+from settings import ULTIMATE_AWARDS_CC_ID, ensure_directories
+from transaction_store import TransactionStore
+
+'''
+Streaming fetch -> label -> write pipeline with bounded memory.
+
+Pages are fetched from PocketSmith on a background thread (one page ahead by
+default) while the previous page is labelled and handed to the sinks, so the
+first rows are written before the last page has arrived and only a couple of
+pages are ever held in memory, whatever the date range.
+
+Sinks take labelled records.Transaction rows one page at a time:
+
+- StoreSink: upserts each page into the transaction store.
+- CsvSink: appends each page to a CSV file.
+- XlsxSink: appends to a plain (unstyled) write-only workbook.
+
+Example:
+    python streaming.py --start-date 2025-01-01 --csv 2025.csv --no-store
+'''
+
+COLUMNS = ["id", "date", "description", "amount", "category", "bank_category", "label", "status"]
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=1):
+    """
+    Iterate over iterable on a background thread, staying up to depth items ahead.
+
+    Exceptions raised by the producer are re-raised in the consumer. If the
+    consumer stops early, the producer stops after its current item.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+class StoreSink:
+    """Upserts labelled rows into the transaction store, one transaction per page."""
+
+    def __init__(self, store=None, account_id=ULTIMATE_AWARDS_CC_ID, weekly_file=None):
+        self.store = store or TransactionStore()
+        self.account_id = account_id
+        self.weekly_file = weekly_file
+        self.count = 0
+
+    def write(self, rows):
+        self.count += self.store.upsert_transactions(self.account_id, rows, weekly_file=self.weekly_file)
+
+    def close(self):
+        pass
+
+
+class StreamHistory:
+    """
+    The rows already streamed in this run, standing in for the transaction
+    store when nothing is stored (--no-store). Pending twins and refunds are
+    then only matched within the stream: queries see the earlier pages, and
+    the store's write-backs (merging stored pending rows, relabelling stored
+    credits) do nothing, as earlier pages have already been written out.
+
+    Pages arrive newest first, so rows more than window_days newer than the
+    latest page can no longer match anything and are dropped.
+    """
+
+    def __init__(self, window_days):
+        self.window = timedelta(days=window_days)
+        self.rows = []
+
+    def add(self, rows):
+        if rows:
+            cutoff = max(tx.date for tx in rows) + self.window
+            self.rows = [tx for tx in self.rows if tx.date <= cutoff] + list(rows)
+        return rows
+
+    def query(self, account_id=None, start_date=None, end_date=None):
+        """Streamed rows dated from start_date to end_date; the stream is a single account."""
+        return [tx for tx in self.rows
+                if (start_date is None or tx.date >= start_date) and (end_date is None or tx.date <= end_date)]
+
+    def merge_duplicates(self, replacements):
+        pass
+
+    def fill_labels(self, updates):
+        pass
+
+
+class CsvSink:
+    """Appends labelled rows to a CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows([tx.id, tx.date.isoformat(), tx.description, f"{tx.amount:.2f}",
+                                tx.category, tx.bank_category, tx.label, tx.status] for tx in rows)
+        self._file.flush()
+        self.count += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxSink:
+    """
+    Appends labelled rows to a write-only workbook.
+
+    Write-only workbooks stream rows to a temporary file instead of keeping
+    cells in memory, so they carry no styling, validation or summary table;
+    render the styled weekly workbook from the store for that.
+    """
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.count = 0
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Transactions")
+        self._ws.append(COLUMNS)
+
+    def write(self, rows):
+        for tx in rows:
+            self._ws.append([getattr(tx, column) for column in COLUMNS])
+        self.count += len(rows)
+
+    def close(self):
+        ensure_directories()
+        with metrics.timer("workbook.save"):
+            atomic_save.save_workbook(self._wb, self.path)
+        metrics.count("workbook.bytes_written", os.path.getsize(self.path))
+
+
+def run_stream(pages, stages, sinks, depth=1):
+    """
+    Push pages through stages into sinks, one page at a time.
+
+    Args:
+        pages: Iterable of lists of transactions, fetched lazily.
+        stages: Functions taking and returning a list of rows for one page.
+        sinks: Objects with write(rows) and close().
+        depth: How many pages to fetch ahead of the one being processed.
+
+    Returns the number of rows written. Sinks are closed even on error.
+    """
+    written = 0
+    try:
+        for page in prefetch(pages, depth):
+            for stage in stages:
+                page = stage(page)
+            for sink in sinks:
+                with metrics.timer(f"sink.{type(sink).__name__}"):
+                    sink.write(page)
+            written += len(page)
+    finally:
+        for sink in sinks:
+            sink.close()
+    return written
+
+
+def main(argv=None):
+    import bank_feeds
+
+    parser = argparse.ArgumentParser(description="Stream card transactions from PocketSmith into the store, CSV or XLSX")
+    parser.add_argument("--start-date", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--csv", help="Also write the labelled rows to this CSV file")
+    parser.add_argument("--xlsx", help="Also write the labelled rows to this (unstyled) workbook")
+    parser.add_argument("--no-store", action="store_true", help="Do not write to the transaction store")
+    args = parser.parse_args(argv)
+
+    sinks = [] if args.no_store else [StoreSink()]
+    if args.csv:
+        sinks.append(CsvSink(args.csv))
+    if args.xlsx:
+        sinks.append(XlsxSink(args.xlsx))
+    if not sinks:
+        parser.error("nothing to write: drop --no-store or pass --csv/--xlsx")
+
+    store = None if args.no_store else sinks[0].store
+    count = bank_feeds.stream_transactions(args.start_date, sinks, store)
+    print(f"Streamed {count} transactions.")
+
+
+if __name__ == "__main__":
+    import profiling
+    metrics.start("streaming")
+    with profiling.from_command_line("streaming"):
+        main()
@@ -0,0 +1,41 @@
+"""
+Shared test setup.
+
+The scripts import their settings from a config.py that only exists on the
+user's machine, so one is generated from config_template.py pointing at a
+throwaway spreadsheet directory before any repo module is imported, the same
+way the benchmarks do. Real spreadsheets are never touched.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="budget-tests-")
+SPREADSHEET_DIRECTORY = os.path.join(WORKDIR, "spreadsheets") + os.sep
+
+
+def write_scratch_config(workdir):
+    """Generate a config.py pointing at a scratch spreadsheet directory."""
+    with open(os.path.join(REPO_ROOT, "config_template.py")) as f:
+        template = f.read()
+    config_dir = os.path.join(workdir, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.py"), "w") as f:
+        f.write(template.replace("your/path/here", SPREADSHEET_DIRECTORY.replace("\\", "/")))
+    return config_dir
+
+
+sys.path[:0] = [write_scratch_config(WORKDIR), REPO_ROOT]
+
+
+@pytest.fixture
+def store():
+    """An empty in-memory transaction store."""
+    from transaction_store import TransactionStore
+
+    store = TransactionStore(":memory:")
+    yield store
+    store.close()
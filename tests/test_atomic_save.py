@@ -0,0 +1,63 @@
+import os
+import stat
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import atomic_save
+from atomic_save import replacing, save_workbook
+
+
+def workbook(value):
+    wb = Workbook()
+    wb.active["A1"] = value
+    return wb
+
+
+def read(path):
+    return load_workbook(path).active["A1"].value
+
+
+def test_failed_save_leaves_the_old_file_and_no_temporary(tmp_path):
+    path = str(tmp_path / "week.xlsx")
+    save_workbook(workbook("old"), path)
+
+    with pytest.raises(RuntimeError):
+        with replacing(path) as temp_path:
+            workbook("new").save(temp_path)
+            raise RuntimeError("crash mid-save")
+
+    assert read(path) == "old"
+    assert os.listdir(tmp_path) == ["week.xlsx"]
+
+
+def test_backup_keeps_the_replaced_version(tmp_path):
+    path = str(tmp_path / "week.xlsx")
+    backup_path = str(tmp_path / "Backups" / "week.xlsx")
+    save_workbook(workbook("old"), path)
+    old_inode = os.stat(path).st_ino
+
+    save_workbook(workbook("new"), path, backup_path=backup_path)
+
+    assert read(path) == "new"
+    assert read(backup_path) == "old"
+    assert os.stat(backup_path).st_ino == old_inode
+
+
+@pytest.mark.skipif(os.name != "posix", reason="file modes are POSIX only")
+def test_new_file_gets_the_umask_default_and_a_replaced_file_keeps_its_mode(tmp_path):
+    path = str(tmp_path / "week.xlsx")
+    save_workbook(workbook("old"), path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == atomic_save._DEFAULT_MODE
+
+    os.chmod(path, 0o640)
+    save_workbook(workbook("new"), path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_saving_does_not_touch_the_umask(tmp_path, monkeypatch):
+    def umask(mask):
+        raise AssertionError("os.umask called while saving")
+
+    monkeypatch.setattr(os, "umask", umask)
+    save_workbook(workbook("new"), str(tmp_path / "week.xlsx"))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import bank_feeds_psql
+import checkpoint
+from bank_feeds import FetchError
+from checkpoint import Checkpoint
+from settings import DAYS_TO_FETCH, ULTIMATE_AWARDS_CC_ID
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoints.db")
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_PATH", path)
+    return path
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Record the start date and params of each fetch, then fail it so main stops."""
+    calls = []
+
+    def fetch(start_date, checkpoint):
+        calls.append((start_date, checkpoint.params))
+        raise FetchError(2, 503)
+
+    monkeypatch.setattr(bank_feeds_psql, "fetch_transactions", fetch)
+    return calls
+
+
+def test_fresh_run_fetches_days_to_fetch(journal, fetches, capsys):
+    bank_feeds_psql.main()
+
+    start_date = (datetime.now() - timedelta(days=DAYS_TO_FETCH)).strftime("%Y-%m-%d")
+    assert fetches[0][0] == start_date
+    assert f"(spans {DAYS_TO_FETCH} days)" in capsys.readouterr().out
+
+
+def test_resumed_run_reports_its_pinned_range(journal, fetches, capsys):
+    Checkpoint(f"bank_feeds_psql:{ULTIMATE_AWARDS_CC_ID}:2026-01-01",
+               params={"start_date": "2026-01-01", "end_date": "2026-01-31 09:30:00"}).close()
+
+    bank_feeds_psql.main()
+
+    assert fetches == [("2026-01-01", {"start_date": "2026-01-01", "end_date": "2026-01-31 09:30:00"})]
+    out = capsys.readouterr().out
+    assert "Resuming the interrupted fetch from 2026-01-01." in out
+    assert "starting from 2026-01-01 to 2026-01-31 (spans 30 days)." in out
@@ -0,0 +1,33 @@
+from datetime import date
+
+from openpyxl import Workbook
+
+from bucket_balances import SHEET_NAME, BucketBalances, balance_names
+
+
+def test_colliding_categories_get_numbered_names_in_first_seen_order():
+    names = balance_names(["Data-Annotation", "Salary", "Data Annotation", "data annotation", "Data Annotation 2"])
+
+    assert names == {
+        "Data-Annotation": "Bucket_Data_Annotation",
+        "Salary": "Bucket_Salary",
+        "Data Annotation": "Bucket_Data_Annotation_2",
+        "data annotation": "Bucket_data_annotation_3",
+        "Data Annotation 2": "Bucket_Data_Annotation_2_2",
+    }
+
+
+def test_each_colliding_category_keeps_its_own_balance():
+    balances = BucketBalances()
+    balances.add(date(2026, 3, 2), "Data-Annotation", 10000)
+    balances.add(date(2026, 3, 9), "Data Annotation", 2500)
+    workbook = Workbook()
+
+    balances.write(workbook)
+
+    sheet = workbook[SHEET_NAME]
+    values = {}
+    for name in ("Bucket_Data_Annotation", "Bucket_Data_Annotation_2"):
+        [(_, cell)] = workbook.defined_names[name].destinations
+        values[name] = sheet[cell.replace("$", "")].value
+    assert values == {"Bucket_Data_Annotation": 100.0, "Bucket_Data_Annotation_2": 25.0}
@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+import pytest
+from openpyxl import Workbook
+
+from BudgetUpdater import BudgetUpdater
+from transaction_store import TransactionStore
+
+MONTHS = [date(2026, 4, 1), date(2026, 3, 1), date(2026, 2, 1), date(2026, 1, 1)]
+
+
+def write_debit_file(path, days):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Date", "Description", "Amount", "Category"])
+    for day in days:
+        ws.append([day, f"Purchase {day:%b}", -10.0, "Groceries"])
+    wb.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def updater():
+    # Only the file reading is under test, so the summary workbook is never loaded
+    updater = BudgetUpdater.__new__(BudgetUpdater)
+    updater.verbose = False
+    return updater
+
+
+@pytest.mark.parametrize("days", [MONTHS, MONTHS[::-1], [MONTHS[1], MONTHS[3], MONTHS[0], MONTHS[2]]],
+                         ids=["newest-first", "oldest-first", "shuffled"])
+def test_read_debit_rows_returns_rows_after_since_in_any_order(updater, tmp_path, days):
+    path = write_debit_file(tmp_path / "Debit Transactions 2026.xlsx", days)
+
+    rows = updater._read_debit_rows(since=datetime(2026, 2, 15), debit_file=path)
+
+    assert sorted(tx.date for tx in rows) == [date(2026, 3, 1), date(2026, 4, 1)]
+
+
+def test_read_debit_rows_stops_early_on_an_untouched_export(updater, tmp_path):
+    path = write_debit_file(tmp_path / "Debit Transactions 2026.xlsx", MONTHS + [date(2026, 5, 1)])
+    TransactionStore().mark_workbook_synced(path)
+
+    rows = updater._read_debit_rows(since=datetime(2026, 2, 15), debit_file=path)
+
+    # The export is trusted to be newest first, so the out-of-order May row is never reached
+    assert [tx.date for tx in rows] == [date(2026, 4, 1), date(2026, 3, 1)]
+
+
+def test_read_debit_rows_without_since_reads_everything(updater, tmp_path):
+    path = write_debit_file(tmp_path / "Debit Transactions 2026.xlsx", MONTHS[::-1])
+
+    assert len(updater._read_debit_rows(debit_file=path)) == 4
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import pytest
+
+import bank_feeds
+from checkpoint import FETCHED, Checkpoint
+from fake_pocketsmith import FakePocketSmith
+from settings import ULTIMATE_AWARDS_CC_ID
+
+JOB = "bank_feeds:test:2026-03-01"
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "checkpoints.db")
+
+
+def test_unfinished_run_is_resumed_with_its_pages_and_params(journal):
+    first = Checkpoint(JOB, params={"end_date": "2026-03-31"}, path=journal)
+    first.add_page(1, [{"id": 1}])
+    first.add_page(2, [{"id": 2}])
+    first.mark("stream")
+    first.close()
+
+    resumed = Checkpoint(JOB, params={"end_date": "2026-04-30"}, path=journal)
+
+    assert resumed.resumed
+    assert resumed.params == {"end_date": "2026-03-31"}
+    assert resumed.pages() == [(1, [{"id": 1}]), (2, [{"id": 2}])]
+    assert resumed.done("stream") and not resumed.done(FETCHED)
+
+
+def test_completed_run_starts_over(journal):
+    first = Checkpoint(JOB, path=journal)
+    first.add_page(1, [{"id": 1}])
+    first.complete()
+    first.close()
+
+    assert Checkpoint.latest("bank_feeds:", path=journal) is None
+    again = Checkpoint(JOB, path=journal)
+    assert not again.resumed and again.pages() == []
+
+
+def test_stale_run_starts_over(journal):
+    first = Checkpoint(JOB, path=journal)
+    first.add_page(1, [{"id": 1}])
+    first.close()
+
+    again = Checkpoint(JOB, path=journal, max_age_hours=-1)
+
+    assert not again.resumed and again.pages() == []
+
+
+def test_latest_finds_the_unfinished_run_by_prefix(journal):
+    Checkpoint("bank_feeds_psql:test:2026-01-01", params={"start_date": "2026-01-01"}, path=journal).close()
+
+    latest = Checkpoint.latest("bank_feeds_psql:", path=journal)
+
+    assert latest.resumed and latest.params == {"start_date": "2026-01-01"}
+    assert Checkpoint.latest("bank_feeds:", path=journal) is None
+
+
+def test_interrupted_fetch_resumes_after_the_journaled_pages(journal, monkeypatch):
+    today = date.today()
+    rows = [{"id": 800000 + i, "date": (today - timedelta(days=i)).isoformat(), "payee": f"Shop {i}",
+             "amount": -10.0, "status": "posted"} for i in range(7)]
+    # The range is pinned when the run starts, so the two newest rows are outside it
+    params = {"end_date": str(today - timedelta(days=2))}
+    start_date = (today - timedelta(days=30)).isoformat()
+
+    with FakePocketSmith({ULTIMATE_AWARDS_CC_ID: rows}, page_size=2) as server:
+        monkeypatch.setattr(bank_feeds, "POCKETSMITH_API_URL", server.base_url)
+        pages = bank_feeds.iter_transaction_pages(start_date, Checkpoint(JOB, params=params, path=journal))
+        next(pages)
+        pages.close()  # Interrupted after the first page
+        assert server.stats["ok"] == 1
+
+        checkpoint = Checkpoint(JOB, params={"end_date": str(today)}, path=journal)
+        fetched = bank_feeds.fetch_transactions(start_date, checkpoint)
+
+        # Pages 2 and 3, then the empty page 4
+        assert server.stats["ok"] == 4
+    assert checkpoint.resumed and checkpoint.done(FETCHED)
+    assert sorted(tx.id for tx in fetched) == [800000 + i for i in range(2, 7)]
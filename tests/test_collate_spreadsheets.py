@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+import collate_spreadsheets
+from collate_spreadsheets import SpreadsheetCollator
+
+
+@pytest.fixture
+def collations(monkeypatch):
+    """Make collating a year fail with the given errors in turn, then succeed."""
+    calls = []
+
+    def install(*errors):
+        def collate(self, preloaded_workbooks=None, store=None):
+            calls.append(self.year)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+
+        monkeypatch.setattr(SpreadsheetCollator, "collate_monthly_spreadsheets", collate)
+        return calls
+
+    return install
+
+
+def test_year_is_collated_again_while_the_database_is_locked(collations):
+    calls = collations(sqlite3.OperationalError("database is locked"))
+
+    assert collate_spreadsheets._collate_year(2025, [], verbose=False) == 2025
+    assert calls == [2025, 2025]
+
+
+def test_other_database_errors_are_not_retried(collations):
+    calls = collations(sqlite3.OperationalError("no such table: transactions"))
+
+    with pytest.raises(sqlite3.OperationalError):
+        collate_spreadsheets._collate_year(2025, [], verbose=False)
+    assert calls == [2025]
+
+
+def test_locked_database_gives_up_after_the_last_attempt(collations):
+    locked = sqlite3.OperationalError("database is locked")
+    calls = collations(locked, locked, locked)
+
+    with pytest.raises(sqlite3.OperationalError):
+        collate_spreadsheets._collate_year(2025, [], verbose=False, attempts=3)
+    assert len(calls) == 3
@@ -0,0 +1,73 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+import requests
+
+import bank_feeds
+import pipeline
+import updateMyBuckets
+from fake_pocketsmith import FakePocketSmith
+from conftest import REPO_ROOT
+from settings import DEBIT_ID, SPREADSHEET_DIRECTORY, SUMMARY_FILE, ULTIMATE_AWARDS_CC_ID, ensure_directories
+
+sys.path.append(os.path.join(REPO_ROOT, "benchmarks"))
+from synthetic import write_summary_workbook  # noqa: E402
+
+
+def api_row(id, day, payee, amount):
+    return {"id": id, "date": day.isoformat(), "payee": payee, "amount": amount, "status": "posted",
+            "category": {"title": "Groceries"}}
+
+
+@pytest.fixture
+def card_only_server(monkeypatch):
+    """A fake PocketSmith that knows the card account but answers 404 for the debit account."""
+    today = date.today()
+    rows = [api_row(700000 + i, today - timedelta(days=i), f"Shop {i}", -12.5) for i in range(5)]
+    with FakePocketSmith({ULTIMATE_AWARDS_CC_ID: rows}) as server:
+        monkeypatch.setattr(bank_feeds, "POCKETSMITH_API_URL", server.base_url)
+        monkeypatch.setattr(updateMyBuckets, "POCKETSMITH_API_URL", server.base_url)
+        yield server
+
+
+def test_failed_debit_fetch_raises(card_only_server):
+    with pytest.raises(requests.RequestException):
+        updateMyBuckets.updateMyBuckets().fetch_transactions()
+
+
+def test_weekly_workbook_is_written_when_the_debit_fetch_fails(card_only_server, monkeypatch):
+    linked = []
+    monkeypatch.setattr(bank_feeds, "link_card_transfers", lambda *args: linked.append(args))
+    start_date = (date.today() - timedelta(days=6)).isoformat()
+
+    p = pipeline.build_default_pipeline(start_date)
+    results = p.run()
+
+    assert {"fetch_debit", "store_debit", "update_budget"} <= p.failed
+    assert "write_weekly" not in p.failed and len(results["write_weekly"]) == 1
+    assert linked == []  # No fresh debit rows, so repayments are not linked this run
+
+
+def test_debit_rows_are_stored_and_exported_once(monkeypatch):
+    today = date.today()
+    card = [api_row(710000 + i, today - timedelta(days=i), f"Shop {i}", -12.5) for i in range(3)]
+    debit = [api_row(720000 + i, today - timedelta(days=i), f"Debit {i}", -4.0) for i in range(3)]
+    ensure_directories()
+    write_summary_workbook(os.path.join(SPREADSHEET_DIRECTORY, SUMMARY_FILE), today.year, today - timedelta(days=30))
+
+    calls = []
+    for name in ("store_transactions", "export_transactions"):
+        original = getattr(updateMyBuckets.updateMyBuckets, name)
+        monkeypatch.setattr(updateMyBuckets.updateMyBuckets, name,
+                            lambda self, *args, _name=name, _original=original: (calls.append(_name),
+                                                                                  _original(self, *args))[1])
+    with FakePocketSmith({ULTIMATE_AWARDS_CC_ID: card, DEBIT_ID: debit}) as server:
+        monkeypatch.setattr(bank_feeds, "POCKETSMITH_API_URL", server.base_url)
+        monkeypatch.setattr(updateMyBuckets, "POCKETSMITH_API_URL", server.base_url)
+        p = pipeline.build_default_pipeline((today - timedelta(days=6)).isoformat())
+        p.run()
+
+    assert not p.failed - {"archive"}
+    assert sorted(calls) == ["export_transactions", "store_transactions"]
@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+
+from records import Transaction
+from reconcile import collapse_pending_duplicates, match_refunds, match_transfers
+
+DAY = date(2026, 3, 2)
+
+
+def tx(id, days, description, amount_cents, status="posted"):
+    return Transaction(id=id, date=DAY + timedelta(days=days), description=description,
+                       amount_cents=amount_cents, status=status)
+
+
+def pairs(matches, first="debit", second="credit"):
+    return sorted((getattr(match, first).id, getattr(match, second).id) for match in matches)
+
+
+def test_refund_matches_its_purchase_despite_refund_wording():
+    purchase = tx(1, 0, "Amazon AU*1A2345", -4599)
+    refund = tx(2, 10, "REFUND Amazon AU*987", 4599)
+
+    [match] = match_refunds([refund, purchase])
+
+    assert (match.debit, match.credit, match.days_apart, match.difference_cents) == (purchase, refund, 10, 0)
+
+
+def test_refund_reaches_back_only_window_days():
+    transactions = [tx(1, 0, "Myer", -5000), tx(2, 61, "Myer refund", 5000)]
+
+    assert match_refunds(transactions, window_days=60) == []
+    assert pairs(match_refunds(transactions, window_days=61)) == [(1, 2)]
+
+
+def test_amounts_must_agree_within_the_tolerance():
+    transactions = [tx(1, 0, "Uber Eats", -2000), tx(2, 3, "Uber Eats", 1985)]
+
+    assert match_refunds(transactions) == []
+    [match] = match_refunds(transactions, tolerance_cents=15)
+    assert match.difference_cents == -15
+
+
+def test_most_recent_purchase_wins_and_each_purchase_is_refunded_once():
+    transactions = [tx(1, 0, "Kmart", -1500), tx(2, 5, "Kmart", -1500),
+                    tx(3, 6, "Kmart refund", 1500), tx(4, 7, "Kmart refund", 1500), tx(5, 8, "Kmart refund", 1500)]
+
+    assert pairs(match_refunds(transactions)) == [(1, 4), (2, 3)]
+
+
+def test_same_day_reversal_matches():
+    assert pairs(match_refunds([tx(2, 0, "Reversal Coles", 830), tx(1, 0, "Coles", -830)])) == [(1, 2)]
+
+
+def test_different_payees_do_not_match():
+    assert match_refunds([tx(1, 0, "Bunnings", -2500), tx(2, 1, "Officeworks", 2500)]) == []
+
+
+def test_pending_row_collapses_into_its_posted_twin():
+    pending = tx(1, 0, "SQ *CAFE MELBOURNE PENDING", -1850, status="pending")
+    posted = tx(2, 2, "SQ *CAFE MELBOURNE", -2150)
+    other = tx(3, 1, "Woolworths", -6400)
+
+    kept, [match] = collapse_pending_duplicates([pending, other, posted])
+
+    assert kept == [other, posted]
+    assert (match.pending, match.posted, match.difference_cents) == (pending, posted, -300)
+
+
+def test_pending_row_is_kept_outside_the_window_or_tolerance():
+    pending = tx(1, 0, "Netflix", -1699, status="pending")
+
+    assert collapse_pending_duplicates([pending, tx(2, 6, "Netflix", -1699)])[1] == []
+    assert collapse_pending_duplicates([pending, tx(2, 1, "Netflix", -2200)])[1] == []
+    assert collapse_pending_duplicates([pending, tx(2, 1, "Spotify", -1699)])[1] == []
+
+
+def test_repeat_purchases_without_a_pending_status_are_left_alone():
+    transactions = [tx(1, 0, "Translink", -480), tx(2, 0, "Translink", -480), tx(3, 1, "Translink", -480)]
+
+    assert collapse_pending_duplicates(transactions) == (transactions, [])
+
+
+def test_each_posted_row_absorbs_one_pending_row():
+    transactions = [tx(1, 0, "Shell Coles Express", -6000, status="pending"),
+                    tx(2, 0, "Shell Coles Express", -6000, status="pending"),
+                    tx(3, 1, "Shell Coles Express", -6000)]
+
+    kept, duplicates = collapse_pending_duplicates(transactions)
+
+    assert [t.id for t in kept] == [2, 3]
+    assert pairs(duplicates, "pending", "posted") == [(1, 3)]
+
+
+def test_transfer_links_the_opposite_amount_on_the_nearest_day():
+    repayment = tx(1, 2, "Payment received, thank you", 50000)
+    debits = [tx(10, 0, "Transfer to card", -50000), tx(11, 1, "Transfer to card", -50000),
+              tx(12, 2, "Rent", -50000 + 1)]
+
+    [match] = match_transfers([repayment], debits, window_days=2)
+
+    assert (match.outgoing.id, match.incoming.id, match.days_apart) == (11, 1, 1)
+
+
+def test_transfers_outside_the_window_or_with_the_same_sign_are_not_linked():
+    assert match_transfers([tx(1, 3, "Payment", 50000)], [tx(10, 0, "Transfer", -50000)], window_days=2) == []
+    assert match_transfers([tx(1, 0, "Payment", 50000)], [tx(10, 0, "Deposit", 50000)]) == []
+
+
+def test_each_transaction_is_linked_at_most_once():
+    repayments = [tx(1, 0, "Payment", 20000), tx(2, 0, "Payment", 20000)]
+
+    matches = match_transfers(repayments, [tx(10, 0, "Transfer", -20000)])
+
+    assert pairs(matches, "outgoing", "incoming") == [(10, 1)]
@@ -0,0 +1,68 @@
+from datetime import date
+
+from openpyxl import Workbook
+
+import reports
+from records import Transaction
+from reports import StoreSource, WorkbookSource
+from settings import DEBIT_ID, ULTIMATE_AWARDS_CC_ID
+
+START, END = date(2026, 3, 1), date(2026, 3, 31)
+
+
+def tx(id, day, description, amount_cents, bank_category, label=None):
+    return Transaction(id=id, date=day, description=description, amount_cents=amount_cents,
+                       bank_category=bank_category, label=label)
+
+
+CARD = [
+    tx(1, date(2026, 3, 2), "Supermarket", -12000, "Groceries", "Both"),
+    tx(2, date(2026, 3, 3), "Cinema", -3000, "Entertainment", "Jack"),
+    tx(3, date(2026, 3, 4), "Bakery", -4500, "Groceries", "Ruby"),
+    tx(4, date(2026, 3, 9), "Airline refund", 9000, "Travel", "Both"),
+    tx(5, date(2026, 3, 10), "Payment received", 50000, "Credit Card Payment"),
+]
+
+
+def write_weekly(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Date - Week 1", "Description", "Amount", "Category", "Bank Category", "Label"])
+    for row in rows:
+        ws.append([row.date, row.description, row.amount, None, row.bank_category, row.label])
+    wb.save(path)
+
+
+def stored(store):
+    store.upsert_transactions(ULTIMATE_AWARDS_CC_ID, CARD)
+    store.upsert_transactions(DEBIT_ID, [tx(90, date(2026, 3, 9), "Card repayment", -50000, "Transfer")])
+    assert len(store.link_transfers(ULTIMATE_AWARDS_CC_ID, DEBIT_ID)) == 1
+    return store
+
+
+def test_category_spend_lists_the_largest_spend_first(store):
+    spend = reports.category_spend(START, END, source=StoreSource(stored(store)))
+
+    assert [(row["bank_category"], row["amount"]) for row in spend] == [
+        ("Groceries", -165.0), ("Entertainment", -30.0), ("Travel", 90.0)]
+
+
+def test_workbook_source_leaves_out_linked_transfers(store, tmp_path):
+    # Rendered before the repayment was linked, so the workbook still lists it
+    write_weekly(tmp_path / "02-10 Mar Week 1 - 2026.xlsx", CARD)
+
+    from_workbooks = WorkbookSource(str(tmp_path), store=stored(store))
+
+    for group_by in [(), ("label",), ("bank_category",)]:
+        key = lambda row: tuple(str(row.get(column)) for column in group_by)
+        assert sorted(from_workbooks.aggregate(START, END, group_by), key=key) == \
+            sorted(StoreSource(store).aggregate(START, END, group_by), key=key)
+
+
+def test_workbook_source_keeps_an_unlinked_row_with_the_same_amount(store, tmp_path):
+    write_weekly(tmp_path / "02-10 Mar Week 1 - 2026.xlsx", CARD + [
+        tx(6, date(2026, 3, 20), "Payment received", 50000, "Credit Card Payment")])
+
+    [total] = WorkbookSource(str(tmp_path), store=stored(store)).aggregate(START, END, ())
+
+    assert total == {"amount_cents": 50000 - 12000 - 3000 - 4500 + 9000, "count": 5}
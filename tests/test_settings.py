@@ -0,0 +1,35 @@
+import re
+import subprocess
+import sys
+
+import config
+import settings
+from conftest import REPO_ROOT
+
+
+def test_template_sets_no_optional_setting():
+    """Optional defaults live only in settings.py; the template merely shows commented examples."""
+    optional = [name for name in vars(settings) if name.isupper() and not hasattr(config, name)]
+    assert "MASTER_LAYOUT" in optional
+    with open(f"{REPO_ROOT}/config_template.py") as f:
+        assigned = set(re.findall(r"^([A-Z_]+)\s*=", f.read(), re.MULTILINE))
+    assert not assigned & set(optional)
+
+
+def test_old_config_imports_every_entry_point(tmp_path):
+    # The names the very first config_template.py defined, and nothing else
+    (tmp_path / "config.py").write_text(
+        "import os\n"
+        "POCKETSMITH_API_KEY = 'key'\nULTIMATE_AWARDS_CC_ID = '1'\nDEBIT_ID = '2'\nPEOPLE = ['Jack', 'Ruby']\n"
+        f"SPREADSHEET_DIRECTORY = {str(tmp_path)!r}\nSUMMARY_FILE = 'summary.xlsm'\nCURRENT_YEAR = 2026\n"
+        "TRANSACTION_DIRECTORY = os.path.join(SPREADSHEET_DIRECTORY, '2026 Transactions/')\n"
+        "BACKUP_DIRECTORY = os.path.join(SPREADSHEET_DIRECTORY, 'Backup/')\n"
+        "MASTER_SPREADSHEET_NAME = '2026 Monthly Spend.xlsx'\nDB_CONFIG = {}\nDAYS_TO_FETCH = 30\n"
+    )
+    code = ("import sys; sys.path[:0] = [sys.argv[1], sys.argv[2]]\n"
+            "import bank_feeds, updateMyBuckets, BudgetUpdater, collate_spreadsheets, pipeline, transaction_catalog\n"
+            "import settings; print(settings.POCKETSMITH_API_URL, settings.RUBY_FILL.fgColor.rgb)\n")
+    result = subprocess.run([sys.executable, "-c", code, str(tmp_path), REPO_ROOT],
+                            capture_output=True, text=True, cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["https://api.pocketsmith.com/v2", "00FF2C55"]
@@ -0,0 +1,111 @@
+import glob
+import os
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+
+pytest.importorskip("pyarrow")
+
+import transaction_archive
+from records import Transaction
+from transaction_archive import LEGACY, MIGRATION_DIRECTORY, STORE, load_slice
+
+CARD = "1234567"
+
+
+def stored(store):
+    store.upsert_transactions(CARD, [Transaction(1, date(2024, 3, 5), "Supermarket", -12000, label="Both"),
+                                     Transaction(2, date(2024, 3, 9), "Cafe", -500, label="Jack")])
+    return store
+
+
+def write_legacy_workbook(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "March"
+    ws.append(["Date - Week 1", "Description", "Amount", "Category", "Bank Category", "Label"])
+    ws.append([date(2024, 3, 2), "Legacy purchase", -12.5, None, "Dining", "Jack"])
+    ws.append([date(2024, 3, 3), "Legacy dinner", -7.5, None, "Dining", "Ruby"])
+    wb.save(path)
+    return str(path)
+
+
+def write_old_layout(archive_dir, store):
+    """An archive as written before partitions had a source: year=/month=/account_id= only."""
+    import pyarrow.dataset
+
+    table = transaction_archive._to_table(store.query(include_transfers=False)).drop(["source"])
+    legacy = transaction_archive._to_table([Transaction(None, date(2024, 3, 2), "Legacy purchase", -1250, CARD)],
+                                           LEGACY).drop(["source"])
+    for part, rows in enumerate((table, legacy)):
+        pyarrow.dataset.write_dataset(
+            rows, archive_dir, format="parquet",
+            partitioning=pyarrow.dataset.partitioning(rows.select(["year", "month", "account_id"]).schema,
+                                                      flavor="hive"),
+            existing_data_behavior="overwrite_or_ignore", basename_template=f"old-{part}-{{i}}.parquet")
+
+
+def descriptions(archive_dir, source=None):
+    return sorted(load_slice(archive_dir=archive_dir, source=source)["description"].to_pylist())
+
+
+def test_export_and_backfill_each_replace_only_their_own_partition(store, tmp_path):
+    archive_dir = str(tmp_path / "Archive")
+    workbook = write_legacy_workbook(tmp_path / "2024 Monthly Spend.xlsx")
+
+    assert transaction_archive.archive_master_workbook(workbook, CARD, archive_dir) == 2
+    assert transaction_archive.export_archive(stored(store), archive_dir) == 2
+    assert transaction_archive.export_archive(store, archive_dir) == 2
+    assert transaction_archive.archive_master_workbook(workbook, CARD, archive_dir) == 2
+
+    assert descriptions(archive_dir, STORE) == ["Cafe", "Supermarket"]
+    assert descriptions(archive_dir, LEGACY) == ["Legacy dinner", "Legacy purchase"]
+
+
+def test_old_layout_is_migrated_into_source_partitions(store, tmp_path):
+    archive_dir = str(tmp_path / "Archive")
+    write_old_layout(archive_dir, stored(store))
+
+    transaction_archive.export_archive(store, archive_dir)
+
+    assert descriptions(archive_dir, STORE) == ["Cafe", "Supermarket"]
+    assert descriptions(archive_dir, LEGACY) == ["Legacy purchase"]
+    assert glob.glob(os.path.join(archive_dir, "year=*", "month=*", "account_id=*", "*.parquet")) == []
+    assert not os.path.exists(os.path.join(archive_dir, MIGRATION_DIRECTORY))
+
+
+def test_interrupted_migration_is_finished_without_counting_rows_twice(store, tmp_path, monkeypatch):
+    archive_dir = str(tmp_path / "Archive")
+    write_old_layout(archive_dir, stored(store))
+    finish = transaction_archive._finish_migration
+
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(transaction_archive, "_finish_migration", crash)
+    with pytest.raises(KeyboardInterrupt):
+        transaction_archive.export_archive(store, archive_dir)
+    # Staged but not yet swapped in: readers still see only the old files
+    assert descriptions(archive_dir) == ["Cafe", "Legacy purchase", "Supermarket"]
+
+    monkeypatch.setattr(transaction_archive, "_finish_migration", finish)
+    transaction_archive.export_archive(store, archive_dir)
+
+    assert descriptions(archive_dir) == ["Cafe", "Legacy purchase", "Supermarket"]
+    assert descriptions(archive_dir, LEGACY) == ["Legacy purchase"]
+
+
+def test_migration_staged_without_a_ready_marker_is_started_again(store, tmp_path):
+    archive_dir = str(tmp_path / "Archive")
+    write_old_layout(archive_dir, stored(store))
+    # A crash while staging leaves a partial rewrite and no marker
+    partial = os.path.join(archive_dir, MIGRATION_DIRECTORY, "year=2024", "month=3", f"account_id={CARD}",
+                           "source=store")
+    os.makedirs(partial)
+    with open(os.path.join(partial, "part-0.parquet"), "wb") as f:
+        f.write(b"truncated")
+
+    transaction_archive.export_archive(store, archive_dir)
+
+    assert descriptions(archive_dir) == ["Cafe", "Legacy purchase", "Supermarket"]
@@ -0,0 +1,99 @@
+import os
+import threading
+from datetime import date
+
+from openpyxl import load_workbook
+
+import bank_feeds
+from records import Transaction
+from transaction_store import TransactionStore
+
+
+def tx(id, amount_cents=-1250, category=None, label=None, day=date(2026, 3, 2)):
+    return Transaction(id=id, date=day, description=f"Shop {id}", amount_cents=amount_cents,
+                       category=category, label=label)
+
+
+def test_writer_waits_for_another_connections_lock(tmp_path):
+    path = str(tmp_path / "transactions.db")
+    holder, writer = TransactionStore(path), TransactionStore(path)
+    holder.conn.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.5, holder.conn.commit)
+    release.start()
+    try:
+        assert writer.upsert_transactions("debit", [tx(1)]) == 1
+    finally:
+        release.join()
+        holder.close()
+        writer.close()
+
+
+def test_linked_transfers_are_left_out_of_spend(store):
+    store.upsert_transactions("card", [tx(1, amount_cents=50000), tx(2)])
+    store.upsert_transactions("debit", [tx(10, amount_cents=-50000, day=date(2026, 3, 1))])
+
+    [match] = store.link_transfers("card", "debit", window_days=2)
+
+    assert (match.outgoing.id, match.incoming.id) == (10, 1)
+    assert {row.id: row.transfer_id for row in store.query()} == {1: 10, 2: None, 10: 1}
+    assert [row.id for row in store.query(include_transfers=False)] == [2]
+    # Already linked rows are not linked again
+    assert store.link_transfers("card", "debit", window_days=2) == []
+
+
+def test_upsert_refreshes_bank_fields_and_keeps_existing_labels(store):
+    store.upsert_transactions("card", [tx(1, category="Dining", label="Jack")], weekly_file="week1.xlsx")
+
+    fetched = tx(1, amount_cents=-1400, category="Groceries", label="Both")
+    fetched.status = "posted"
+    assert store.upsert_transactions("card", [fetched, tx(None)], weekly_file="week2.xlsx") == 1
+
+    [row] = store.query()
+    assert (row.amount_cents, row.status, row.category, row.label, row.weekly_file) == \
+        (-1400, "posted", "Dining", "Jack", "week1.xlsx")
+
+
+def test_fetch_fills_labels_only_while_they_were_never_set(store):
+    store.upsert_transactions("card", [tx(1)])
+    store.upsert_transactions("card", [tx(1, category="Dining", label="Both")])
+
+    [row] = store.query()
+    assert (row.category, row.label) == ("Dining", "Both")
+
+
+def test_hand_edits_survive_later_fetches_even_when_cleared(store):
+    store.upsert_transactions("card", [tx(1, category="Dining", label="Both"), tx(2)])
+    store.set_labels({1: (None, None)})
+
+    store.upsert_transactions("card", [tx(1, category="Dining", label="Both")])
+    store.fill_labels({1: ("Travel", "Jack"), 2: ("Travel", "Jack")})
+
+    assert {row.id: (row.category, row.label) for row in store.query()} == \
+        {1: (None, None), 2: ("Travel", "Jack")}
+
+
+def test_merge_duplicates_moves_a_pending_row_to_its_posted_id(store):
+    store.upsert_transactions("card", [tx(1, label="Ruby"), tx(2), tx(3)], weekly_file="week1.xlsx")
+
+    store.merge_duplicates({1: 11, 2: 3})
+    store.upsert_transactions("card", [tx(11, amount_cents=-1300)], weekly_file="week2.xlsx")
+
+    assert {row.id: (row.amount_cents, row.label, row.weekly_file) for row in store.query()} == \
+        {3: (-1250, None, "week1.xlsx"), 11: (-1300, "Ruby", "week1.xlsx")}
+
+
+def test_labels_edited_in_the_weekly_workbook_are_synced_back(store, tmp_path):
+    path = str(tmp_path / "02-08 Mar Week 1 - 2026.xlsx")
+    store.upsert_transactions("card", [tx(1, label="Both"), tx(2, label="Jack")], weekly_file=os.path.basename(path))
+    bank_feeds.save_to_excel(store.query(newest_first=True), path)
+    assert store.sync_labels_from_workbook(path) == 0
+
+    wb = load_workbook(path)
+    row = next(row for row in wb.active.iter_rows(min_row=2) if row[1].value == "Shop 2")
+    row[5].value = "Ruby"
+    wb.save(path)
+
+    assert store.sync_labels_from_workbook(path) == 1
+    assert store.sync_labels_from_workbook(path) == 0  # Unchanged since the last sync
+    store.upsert_transactions("card", [tx(2, label="Jack")])
+    assert {row.id: row.label for row in store.query()} == {1: "Both", 2: "Ruby"}
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pytest
+from openpyxl import Workbook
+
+import workbook_cache
+from workbook_cache import WorkbookCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return WorkbookCache(directory=str(tmp_path / "Cache"), max_bytes=10 * 1024 * 1024)
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    calls = []
+    fingerprint = workbook_cache.fingerprint
+
+    def counting(path):
+        calls.append(path)
+        return fingerprint(path)
+
+    monkeypatch.setattr(workbook_cache, "fingerprint", counting)
+    return calls
+
+
+def write_workbook(path, value):
+    wb = Workbook()
+    wb.active["A1"] = value
+    wb.save(path)
+    return str(path)
+
+
+def test_unchanged_file_is_loaded_without_hashing(cache, hashes, tmp_path):
+    path = write_workbook(tmp_path / "week.xlsx", "first")
+
+    assert cache.load(path).active["A1"].value == "first"
+    assert cache.load(path).active["A1"].value == "first"
+
+    assert hashes == [path]
+
+
+def test_edited_file_is_parsed_again(cache, hashes, tmp_path):
+    path = write_workbook(tmp_path / "week.xlsx", "first")
+    cache.load(path)
+    stat = os.stat(path)
+
+    write_workbook(path, "second")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.load(path).active["A1"].value == "second"
+    assert len(hashes) == 2
+
+
+def test_copy_with_the_same_bytes_reuses_the_snapshot(cache, tmp_path):
+    path = write_workbook(tmp_path / "week.xlsx", "first")
+    cache.load(path)
+    copy = shutil.copy(path, tmp_path / "copy.xlsx")
+
+    assert cache.load(copy).active["A1"].value == "first"
+    snapshots = [name for name in os.listdir(cache.directory) if name.endswith(workbook_cache.SUFFIX)]
+    assert len(snapshots) == 1
+
+
+def test_key_files_of_evicted_snapshots_are_removed(cache, tmp_path):
+    path = write_workbook(tmp_path / "week.xlsx", "first")
+    cache.load(path)
+
+    cache.max_bytes = 1
+    cache.evict()
+
+    assert os.listdir(cache.directory) == []
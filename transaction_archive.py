@@ -0,0 +1,336 @@
+import argparse
+import glob
+import os
+import shutil
+from datetime import date
+import metrics
+from settings import ARCHIVE_DIRECTORY
+from records import Transaction, parse_date, to_cents
+from transaction_store import TransactionStore
+
+'''
+Parquet archive of transactions for fast multi-year analysis.
+
+export_archive() writes the transaction store out as a Hive-partitioned Parquet
+dataset (year=/month=/account_id=/source=) with a typed date column, integer-cent
+amounts and dictionary-encoded category/label columns. load_slice() reads a
+filtered slice back through pyarrow.dataset, so partition pruning and row-group
+statistics skip everything outside the requested range and files are memory
+mapped rather than copied. category_rollup() aggregates a slice in Arrow.
+
+Yearly "Monthly Spend.xlsx" files from before the store existed can be added
+once with archive_master_workbook(). Their rows go in source=legacy partitions
+and the store's in source=store ones, so an export and a backfill of the same
+month each only replace their own rows.
+
+pyarrow is optional and only imported when the archive is used:
+    pip install pyarrow
+'''
+
+PARTITION_COLUMNS = ["year", "month", "account_id", "source"]
+STORE = "store"
+LEGACY = "legacy"
+# Where _migrate_layout stages its rewrite; dataset scans skip names starting with "_"
+MIGRATION_DIRECTORY = "_migration"
+MIGRATION_READY = "READY"
+
+
+def _require_pyarrow():
+    """Import pyarrow on first use with a helpful error if it is missing."""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.fs
+    except ImportError as e:
+        raise ImportError("The transaction archive needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def pyarrow_available():
+    try:
+        _require_pyarrow()
+        return True
+    except ImportError:
+        return False
+
+
+def _schema():
+    pa = _require_pyarrow()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("description", pa.string()),
+        ("amount_cents", pa.int64()),
+        ("category", dictionary),
+        ("bank_category", dictionary),
+        ("label", dictionary),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("account_id", pa.string()),
+        ("source", pa.string()),
+    ])
+
+
+def _to_table(transactions, source=STORE):
+    """Build an Arrow table from records.Transaction."""
+    pa = _require_pyarrow()
+    dates = [tx.date for tx in transactions]
+    columns = {
+        "id": [tx.id for tx in transactions],
+        "date": dates,
+        "description": [tx.description for tx in transactions],
+        "amount_cents": [tx.amount_cents for tx in transactions],
+        "category": [tx.category for tx in transactions],
+        "bank_category": [tx.bank_category for tx in transactions],
+        "label": [tx.label for tx in transactions],
+        "year": [d.year for d in dates],
+        "month": [d.month for d in dates],
+        "account_id": [str(tx.account_id) for tx in transactions],
+        "source": [source] * len(transactions),
+    }
+    return pa.Table.from_pydict(columns, schema=_schema())
+
+
+def _migrate_layout(archive_dir):
+    """
+    Move files written before partitions had a source (year=/month=/account_id=
+    only) into source= partitions: rows without a PocketSmith id are legacy.
+
+    The rewrite is staged in MIGRATION_DIRECTORY and its row count checked
+    before a ready marker listing the old files is written. Only then are the
+    old files removed and the new ones moved into place. An interrupted
+    migration is finished from the marker, or staged again if the marker was
+    never written, so no row is lost or counted twice.
+    """
+    pa = _require_pyarrow()
+    staging = os.path.join(archive_dir, MIGRATION_DIRECTORY)
+    ready = os.path.join(staging, MIGRATION_READY)
+    if not os.path.exists(ready):
+        shutil.rmtree(staging, ignore_errors=True)
+        files = glob.glob(os.path.join(glob.escape(archive_dir), "year=*", "month=*", "account_id=*", "*.parquet"))
+        if not files:
+            return
+        table = pa.dataset.dataset(files, format="parquet", partitioning="hive",
+                                   partition_base_dir=archive_dir).to_table()
+        source = pa.compute.if_else(pa.compute.is_null(table["id"]), LEGACY, STORE)
+        table = table.append_column("source", source)
+        schema = _schema()
+        _write(table.select(schema.names).cast(schema), staging, migrate=False)
+        written = pa.dataset.dataset(staging, format="parquet", partitioning="hive").count_rows()
+        if written != table.num_rows:
+            raise RuntimeError(f"Archive migration wrote {written} of {table.num_rows} rows; "
+                               f"the old files in {archive_dir} were left in place")
+        with open(ready, "w") as f:
+            f.write("\n".join(os.path.relpath(path, archive_dir) for path in files))
+            f.flush()
+            os.fsync(f.fileno())
+    _finish_migration(archive_dir, staging, ready)
+
+
+def _finish_migration(archive_dir, staging, ready):
+    """Remove the old files listed in the ready marker and move the staged partitions into place."""
+    with open(ready) as f:
+        old_files = f.read().splitlines()
+    for path in old_files:
+        try:
+            os.remove(os.path.join(archive_dir, path))
+        except FileNotFoundError:
+            pass
+    pattern = os.path.join(glob.escape(staging), "year=*", "month=*", "account_id=*", "source=*", "*.parquet")
+    for staged in glob.glob(pattern):
+        partition = os.path.join(archive_dir, os.path.relpath(os.path.dirname(staged), staging))
+        os.makedirs(partition, exist_ok=True)
+        # The staged file replaces the whole partition, as write_dataset's delete_matching would
+        for existing in glob.glob(os.path.join(glob.escape(partition), "*.parquet")):
+            if os.path.basename(existing) != os.path.basename(staged):
+                os.remove(existing)
+        os.replace(staged, os.path.join(partition, os.path.basename(staged)))
+    shutil.rmtree(staging)
+
+
+def _write(table, archive_dir, migrate=True):
+    """Write a table into the dataset, replacing only the partitions it touches."""
+    pa = _require_pyarrow()
+    if migrate:
+        _migrate_layout(archive_dir)
+    pa.dataset.write_dataset(
+        table,
+        archive_dir,
+        format="parquet",
+        partitioning=pa.dataset.partitioning(table.select(PARTITION_COLUMNS).schema, flavor="hive"),
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+
+
+def export_archive(store=None, archive_dir=None, start_date=None, end_date=None):
+    """
+    Export transactions from the store to the Parquet archive.
+
+    Pass start_date/end_date to refresh only recent months; every partition
+    touched by the exported rows is rewritten in full, so export whole months.
+    Linked transfers between accounts are not spend and are left out.
+    Returns the number of rows written.
+    """
+    store = store or TransactionStore()
+    archive_dir = archive_dir or ARCHIVE_DIRECTORY
+    transactions = store.query(start_date=start_date, end_date=end_date, include_transfers=False)
+    if not transactions:
+        return 0
+    _write(_to_table(transactions), archive_dir)
+    return len(transactions)
+
+
+def archive_master_workbook(path, account_id, archive_dir=None):
+    """
+    Add a legacy yearly "Monthly Spend.xlsx" to the archive (one-off backfill).
+
+    Reads columns A-F (Date, Description, Amount, Category, Bank Category,
+    Label) of every month sheet in read-only mode, skipping the per-week header
+    rows and summary tables. Rows have no PocketSmith id and are written to
+    source=legacy partitions, which export_archive() never touches; backfilling
+    the same workbook again replaces its earlier rows. Returns the row count.
+    """
+    from openpyxl import load_workbook
+
+    transactions = []
+    with metrics.timer("workbook.load"):
+        wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            for values in ws.iter_rows(min_row=1, max_col=6, values_only=True):
+                tx_date, description, amount, category, bank_category, label = values
+                if not isinstance(amount, (int, float)) or not isinstance(tx_date, (str, date)):
+                    continue
+                try:
+                    tx_date = parse_date(tx_date)
+                except ValueError:
+                    continue
+                transactions.append(Transaction(None, tx_date, description, to_cents(amount), account_id,
+                                                category, bank_category, label))
+    finally:
+        wb.close()
+
+    if transactions:
+        _write(_to_table(transactions, LEGACY), archive_dir or ARCHIVE_DIRECTORY)
+    return len(transactions)
+
+
+def _dataset(archive_dir):
+    pa = _require_pyarrow()
+    return pa.dataset.dataset(
+        archive_dir,
+        format="parquet",
+        partitioning="hive",
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def load_slice(start_date=None, end_date=None, label=None, account_id=None,
+               category=None, source=None, columns=None, archive_dir=None):
+    """
+    Load a filtered slice of the archive as a pyarrow Table. source is
+    "store" or "legacy" to read only exported or only backfilled rows.
+
+    Filters are pushed down to the scan: year/month partitions outside the date
+    range are never opened, and Parquet statistics skip non-matching row groups.
+    """
+    pa = _require_pyarrow()
+    field = pa.dataset.field
+    year, month = field("year"), field("month")
+    start_date = start_date and parse_date(start_date)
+    end_date = end_date and parse_date(end_date)
+
+    # Year/month conditions prune whole partitions; the date conditions trim the edges
+    conditions = []
+    if start_date is not None:
+        conditions += [
+            (year > start_date.year) | ((year == start_date.year) & (month >= start_date.month)),
+            field("date") >= pa.scalar(start_date),
+        ]
+    if end_date is not None:
+        conditions += [
+            (year < end_date.year) | ((year == end_date.year) & (month <= end_date.month)),
+            field("date") <= pa.scalar(end_date),
+        ]
+    if account_id is not None:
+        conditions.append(field("account_id") == str(account_id))
+    if label is not None:
+        conditions.append(field("label") == label)
+    if category is not None:
+        conditions.append(field("bank_category") == category)
+    if source is not None:
+        conditions.append(field("source") == source)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return _dataset(archive_dir or ARCHIVE_DIRECTORY).to_table(columns=columns, filter=expression)
+
+
+def category_rollup(start_date=None, end_date=None, by=("year", "bank_category"), archive_dir=None, **filters):
+    """
+    Sum spend per group over a slice of the archive.
+
+    Returns a list of dicts with the group columns plus 'amount' in dollars and
+    'count', sorted by the group columns.
+    """
+    by = list(by)
+    table = load_slice(start_date, end_date, columns=by + ["amount_cents"],
+                       archive_dir=archive_dir, **filters)
+    # Group keys must be plain values, not dictionary indices
+    for name in by:
+        column = table[name]
+        if str(column.type).startswith("dictionary"):
+            table = table.set_column(table.schema.get_field_index(name), name,
+                                     column.cast(column.type.value_type))
+    grouped = table.group_by(by).aggregate([("amount_cents", "sum"), ("amount_cents", "count")])
+
+    rows = [{
+        **{name: row[name] for name in by},
+        "amount": row["amount_cents_sum"] / 100,
+        "count": row["amount_cents_count"],
+    } for row in grouped.to_pylist()]
+    rows.sort(key=lambda row: tuple("" if row[name] is None else str(row[name]) for name in by))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parquet archive of transactions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Export the transaction store to the archive")
+    export.add_argument("--start-date", help="Only refresh months from this date (YYYY-MM-DD)")
+
+    backfill = subparsers.add_parser("backfill", help="Add a legacy yearly Monthly Spend workbook")
+    backfill.add_argument("workbook")
+    backfill.add_argument("--account-id", required=True)
+
+    rollup = subparsers.add_parser("rollup", help="Print spend per year and category")
+    rollup.add_argument("--start-date")
+    rollup.add_argument("--end-date")
+    rollup.add_argument("--by", default="year,bank_category",
+                        help="Comma-separated group columns (default: year,bank_category)")
+    rollup.add_argument("--label")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        print(f"Archived {export_archive(start_date=args.start_date)} transactions to {ARCHIVE_DIRECTORY}")
+    elif args.command == "backfill":
+        count = archive_master_workbook(args.workbook, args.account_id)
+        print(f"Archived {count} transactions from {os.path.basename(args.workbook)}")
+    else:
+        by = [name.strip() for name in args.by.split(",")]
+        for row in category_rollup(args.start_date, args.end_date, by=by, label=args.label):
+            keys = "  ".join(str(row[name]) for name in by)
+            print(f"{keys:<50} {row['amount']:>12,.2f} ({row['count']})")
+
+
+if __name__ == "__main__":
+    import profiling
+    metrics.start("transaction_archive")
+    with profiling.from_command_line("transaction_archive"):
+        main()
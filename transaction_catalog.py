@@ -0,0 +1,372 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date, datetime
+import metrics
+from settings import (
+    CATALOG_PATH,
+    CATALOG_POLL_SECONDS,
+    CURRENT_YEAR,
+    DEBIT_ID,
+    TRANSACTION_DIRECTORY,
+    ULTIMATE_AWARDS_CC_ID,
+)
+
+'''
+Persistent catalog of the files in the transaction directories.
+
+Every file is recorded once in a small SQLite database (CATALOG_PATH) with what
+its name says about it (weekly card workbook or Debit Transactions file, its
+account, year, month, week and date range), its size, modification time and
+a content checksum. refresh() only hashes files whose size or modification
+time moved, and brings the catalog up to date.
+
+The collator and BudgetUpdater refresh the catalog and look their files up
+here instead of parsing directory listings. Change detection does not depend
+on who refreshed last: each consumer (e.g. "watch") keeps its own cursor, the
+checksum of every file as of the last time it processed them, and pending()
+compares the catalog with that cursor. watch() polls the directories and
+redoes only the work a change affects: collating the years whose weekly
+files changed, and updating the budget when the current year or the debit
+file changed. Only then does acknowledge() move its cursor on.
+'''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,              -- weekly, debit or other
+    account_id TEXT,
+    year INTEGER,
+    month INTEGER,
+    week INTEGER,
+    start_date TEXT,                 -- YYYY-MM-DD, weekly files only
+    end_date TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    cataloged_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_kind_year ON files (kind, year);
+CREATE TABLE IF NOT EXISTS processed (
+    consumer TEXT NOT NULL,          -- e.g. watch
+    path TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,          -- content the consumer last processed
+    PRIMARY KEY (consumer, path)
+);
+"""
+
+MONTH_ABBREVIATIONS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                       "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+_MONTH = re.compile(r"\b(" + "|".join(MONTH_ABBREVIATIONS) + r")\b")
+_WEEK = re.compile(r"Week\s*(\d+)")
+_YEAR = re.compile(r"\s(\d{4})\.xlsx$")
+_DAYS = re.compile(r"^(\d{1,2})-(\d{1,2})\s")
+_DEBIT = re.compile(r"^Debit Transactions\s*(.*?)\.xlsx$")
+
+FileInfo = namedtuple("FileInfo", ["kind", "account_id", "year", "month", "week", "start_date", "end_date"])
+CatalogEntry = namedtuple("CatalogEntry", ["path", "directory", "name"] + list(FileInfo._fields)
+                          + ["size", "mtime_ns", "checksum"])
+Changes = namedtuple("Changes", ["added", "modified", "removed"])
+
+
+def _period(start_day, end_day, month, year):
+    """Dates of a weekly file's 'DD-DD' range; the start falls in the previous month when it is the larger day."""
+    try:
+        end = date(year, month, end_day)
+        if start_day <= end_day:
+            return date(year, month, start_day), end
+        previous_year, previous_month = (year - 1, 12) if month == 1 else (year, month - 1)
+        return date(previous_year, previous_month, min(start_day, monthrange(previous_year, previous_month)[1])), end
+    except ValueError:
+        return None, None
+
+
+def parse_name(name):
+    """
+    What a transaction directory file name says about it, e.g.
+    '20-27 Dec Week 4 - 2024.xlsx' -> a weekly card file for week 4 of December
+    2024, 20-27 December. Parts that cannot be read are None.
+    """
+    debit = _DEBIT.match(name)
+    if debit:
+        year = debit.group(1)
+        return FileInfo("debit", DEBIT_ID, int(year) if year.isdigit() else None, None, None, None, None)
+    if not (name.endswith(".xlsx") and "Week" in name) or name.startswith("~$"):
+        return FileInfo("other", None, None, None, None, None, None)
+
+    month = _MONTH.search(name)
+    week = _WEEK.search(name)
+    year = _YEAR.search(name)
+    days = _DAYS.match(name)
+    month = MONTH_ABBREVIATIONS.index(month.group(1)) + 1 if month else None
+    year = int(year.group(1)) if year else None
+    start_date = end_date = None
+    if days and month and year:
+        start_date, end_date = _period(int(days.group(1)), int(days.group(2)), month, year)
+    return FileInfo("weekly", ULTIMATE_AWARDS_CC_ID, year, month, int(week.group(1)) if week else None,
+                    start_date, end_date)
+
+
+def _checksum(path):
+    import workbook_cache
+    return workbook_cache.fingerprint(path)[1]
+
+
+def _row_entry(row):
+    values = dict(row)
+    for key in ("start_date", "end_date"):
+        if values[key]:
+            values[key] = date.fromisoformat(values[key])
+    return CatalogEntry(**{field: values[field] for field in CatalogEntry._fields})
+
+
+class Catalog:
+    """The files in the transaction directories, as recorded in CATALOG_PATH."""
+
+    def __init__(self, path=None):
+        self.path = path or CATALOG_PATH
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Worker processes collating other years refresh the same catalog
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _directories(directories):
+        return [os.path.join(os.path.abspath(directory), "") for directory in directories or [TRANSACTION_DIRECTORY]]
+
+    def refresh(self, directories=None):
+        """
+        Bring the catalog up to date with directories (TRANSACTION_DIRECTORY by
+        default) and return the Changes since the last refresh by anyone.
+        Lookups call this too, so consumers use pending() to see what changed
+        since they last processed the files. Raises OSError if a directory
+        cannot be listed.
+        """
+        directories = self._directories(directories)
+        added, modified, removed = [], [], []
+        with metrics.timer("catalog.refresh"):
+            known = {}
+            for directory in directories:
+                for row in self.conn.execute("SELECT * FROM files WHERE directory = ?", (directory,)):
+                    known[row["path"]] = _row_entry(row)
+
+            seen = set()
+            updates = []
+            for directory in directories:
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if name.startswith(("~$", ".")) or not os.path.isfile(path):
+                        continue  # Excel lock files, files being saved (see atomic_save.py) and folders
+                    try:
+                        stat = os.stat(path)
+                        entry = known.get(path)
+                        if entry is not None and (entry.size, entry.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                            seen.add(path)
+                            continue
+                        checksum = _checksum(path)
+                    except FileNotFoundError:
+                        continue  # Removed since the listing
+                    seen.add(path)
+                    metrics.count("catalog.files_hashed")
+                    entry_now = CatalogEntry(path, directory, name, *parse_name(name), stat.st_size,
+                                             stat.st_mtime_ns, checksum)
+                    updates.append(entry_now)
+                    if entry is None:
+                        added.append(entry_now)
+                    elif entry.checksum != checksum:
+                        modified.append(entry_now)
+
+            removed = [entry for path, entry in known.items() if path not in seen]
+            now = datetime.now().isoformat(timespec="seconds")
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO files ({', '.join(CatalogEntry._fields)}, cataloged_at) "
+                    f"VALUES ({', '.join('?' * (len(CatalogEntry._fields) + 1))})",
+                    [tuple(entry._replace(start_date=entry.start_date and entry.start_date.isoformat(),
+                                          end_date=entry.end_date and entry.end_date.isoformat())) + (now,)
+                     for entry in updates])
+                self.conn.executemany("DELETE FROM files WHERE path = ?", [(entry.path,) for entry in removed])
+        metrics.count("catalog.changes", len(added) + len(modified) + len(removed))
+        return Changes(added, modified, removed)
+
+    def entries(self, kind=None, year=None, directories=None):
+        """Catalogued files, optionally of one kind, year and set of directories, ordered by name."""
+        sql = "SELECT * FROM files WHERE 1 = 1"
+        params = []
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        if year is not None:
+            sql += " AND year = ?"
+            params.append(year)
+        if directories is not None:
+            directories = self._directories(directories)
+            sql += f" AND directory IN ({', '.join('?' * len(directories))})"
+            params.extend(directories)
+        return [_row_entry(row) for row in self.conn.execute(sql + " ORDER BY name", params)]
+
+    def latest_debit(self, directories=None):
+        """The newest Debit Transactions file: the latest year in its name, then the most recently modified."""
+        entries = self.entries(kind="debit", directories=directories)
+        return max(entries, key=lambda entry: (entry.year or 0, entry.mtime_ns), default=None)
+
+    def pending(self, consumer, directories=None):
+        """The Changes in directories since consumer last acknowledged them, as of the last refresh."""
+        current = {entry.path: entry for entry in self.entries(directories=directories)}
+        directories = self._directories(directories)
+        processed = {row["path"]: row for row in self.conn.execute(
+            f"SELECT * FROM processed WHERE consumer = ? AND directory IN ({', '.join('?' * len(directories))})",
+            [consumer] + directories)}
+        added = [entry for path, entry in current.items() if path not in processed]
+        modified = [entry for path, entry in current.items()
+                    if path in processed and processed[path]["checksum"] != entry.checksum]
+        # Removed files are gone from the catalog; what their name says is enough to route them
+        removed = [CatalogEntry(row["path"], row["directory"], row["name"], *parse_name(row["name"]), 0, 0,
+                                row["checksum"])
+                   for path, row in processed.items() if path not in current]
+        return Changes(added, modified, removed)
+
+    def acknowledge(self, consumer, changes):
+        """Move consumer's cursor past changes, once it has processed them."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO processed (consumer, path, directory, name, checksum) VALUES (?, ?, ?, ?, ?)",
+                [(consumer, entry.path, entry.directory, entry.name, entry.checksum)
+                 for entry in changes.added + changes.modified])
+            self.conn.executemany("DELETE FROM processed WHERE consumer = ? AND path = ?",
+                                  [(consumer, entry.path) for entry in changes.removed])
+
+
+def affected_work(changes):
+    """The work a set of Changes calls for, as (years to collate, whether to update the budget)."""
+    years = set()
+    update_budget = False
+    for entry in changes.added + changes.modified + changes.removed:
+        if entry.kind == "weekly" and entry.year is not None:
+            years.add(entry.year)
+            update_budget = update_budget or entry.year == CURRENT_YEAR
+        elif entry.kind == "debit":
+            update_budget = True
+    return years, update_budget
+
+
+def _changed_debit_file(changes):
+    """The newest Debit Transactions file that was added or modified, or None."""
+    entries = [entry for entry in changes.added + changes.modified if entry.kind == "debit"]
+    entry = max(entries, key=lambda entry: (entry.year or 0, entry.mtime_ns), default=None)
+    return entry.path if entry else None
+
+
+def process_changes(changes, directories, verbose=False):
+    """
+    Collate the years changes touched and update the budget if they call for
+    it. A changed Debit Transactions file is read for the budget's new rows;
+    otherwise they come from the transaction store as usual.
+    """
+    from collate_spreadsheets import SpreadsheetCollator
+    from transaction_store import TransactionStore
+
+    years, update_budget = affected_work(changes)
+    for year in sorted(years):
+        print(f"Collating {year}...")
+        with metrics.timer("catalog.collate"):
+            SpreadsheetCollator(verbose=verbose, year=year, directories=directories).collate_monthly_spreadsheets(
+                store=TransactionStore())
+    if update_budget:
+        from BudgetUpdater import BudgetUpdater
+
+        print("Updating the budget...")
+        with metrics.timer("catalog.update_budget"):
+            budget = BudgetUpdater(verbose=verbose)
+            # Work from what is on disk; no new fetch
+            budget.run_all_updates(debit_transactions=[], debit_file=_changed_debit_file(changes))
+            budget.save_workbook()
+    return years, update_budget
+
+
+def watch_directories():
+    """TRANSACTION_DIRECTORY and every other '{year} Transactions' folder."""
+    from collate_spreadsheets import discover_years
+
+    directories = [os.path.join(os.path.abspath(path), "") for _, path in sorted(discover_years().items())]
+    current = os.path.join(os.path.abspath(TRANSACTION_DIRECTORY), "")
+    return directories if current in directories else directories + [current]
+
+
+WATCH = "watch"  # watch()'s cursor in the processed table
+
+
+def watch(interval=None, settle=1.0, once=False, verbose=False, catalog=None):
+    """
+    Poll the transaction directories every interval seconds (CATALOG_POLL_SECONDS)
+    and process what changed since the last time watch processed them, even
+    if another script has refreshed the catalog since. Polls repeat until one
+    finds nothing new for settle seconds, so a file still being saved is
+    handled once. Changes that fail to process are retried on the next poll.
+    With once=True, refresh and process a single time and return.
+    """
+    interval = CATALOG_POLL_SECONDS if interval is None else interval
+    catalog = catalog or Catalog()
+    while True:
+        directories = watch_directories()
+        try:
+            catalog.refresh(directories)
+            changes = catalog.pending(WATCH, directories)
+            while any(changes):
+                time.sleep(settle)
+                if not any(catalog.refresh(directories)):
+                    break
+            changes = catalog.pending(WATCH, directories)
+        except OSError as e:
+            print(f"Error accessing transaction directory: {e}")
+            changes = Changes([], [], [])
+
+        if any(changes):
+            names = sorted({entry.name for entry in changes.added + changes.modified + changes.removed})
+            print(f"{len(names)} file(s) changed: {', '.join(names)}")
+            try:
+                process_changes(changes, directories, verbose=verbose)
+                catalog.acknowledge(WATCH, changes)
+            except Exception as e:
+                print(f"Error processing changes: {e}")  # Keep watching
+        if once:
+            return changes
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog the transaction directories and process changed files")
+    parser.add_argument("--watch", action="store_true", help="Keep polling and process changes as they happen")
+    parser.add_argument("--interval", type=float, help=f"Seconds between polls (default: {CATALOG_POLL_SECONDS})")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    metrics.start("transaction_catalog")
+    if args.watch:
+        try:
+            watch(args.interval, verbose=args.verbose)
+        except KeyboardInterrupt:
+            pass
+    else:
+        watch(once=True, verbose=args.verbose)
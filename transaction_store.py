@@ -0,0 +1,310 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+import metrics
+from settings import TRANSACTION_STORE_PATH, TRANSFER_WINDOW_DAYS, ensure_directories
+from reconcile import match_transfers
+from records import Transaction, parse_date, to_cents
+
+'''
+Local SQLite store that is the single source of truth for fetched transactions.
+
+Fetchers upsert what they pull from PocketSmith here, keyed by the PocketSmith
+transaction id, and every spreadsheet (weekly, collated, buckets) is rendered
+from queries against it. Rows go in and come out as records.Transaction, with
+amounts stored as integer cents so sums are exact.
+
+Labels and categories are filled in by fetches only while they have never
+been set. Once a Category or Label is corrected by hand in a weekly workbook
+(synced back with sync_labels_from_workbook) the row is marked edited, and
+later fetches leave both fields alone, even ones deliberately cleared.
+
+Transfers between accounts (e.g. card repayments from the debit account) are
+linked in pairs through transfer_id and left out of spend with
+include_transfers=False.
+'''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,          -- PocketSmith transaction id
+    account_id TEXT NOT NULL,
+    date TEXT NOT NULL,              -- YYYY-MM-DD
+    description TEXT,
+    amount_cents INTEGER NOT NULL,
+    category TEXT,
+    bank_category TEXT,
+    label TEXT,
+    status TEXT,                     -- PocketSmith status, e.g. pending or posted
+    transfer_id INTEGER,             -- other side of an inter-account transfer
+    weekly_file TEXT,                -- weekly workbook the transaction was first rendered into
+    edited INTEGER NOT NULL DEFAULT 0,  -- 1 once category/label were edited by hand
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS idx_transactions_label ON transactions (label);
+CREATE INDEX IF NOT EXISTS idx_transactions_weekly_file ON transactions (weekly_file);
+
+CREATE TABLE IF NOT EXISTS workbook_sync (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = [
+    ("status", "ALTER TABLE transactions ADD COLUMN status TEXT"),
+    ("transfer_id", "ALTER TABLE transactions ADD COLUMN transfer_id INTEGER"),
+    ("edited", "ALTER TABLE transactions ADD COLUMN edited INTEGER NOT NULL DEFAULT 0"),
+]
+
+UPSERT = """
+INSERT INTO transactions (id, account_id, date, description, amount_cents, category,
+                          bank_category, label, status, weekly_file, updated_at)
+VALUES (:id, :account_id, :date, :description, :amount_cents, :category,
+        :bank_category, :label, :status, :weekly_file, :updated_at)
+ON CONFLICT (id) DO UPDATE SET
+    date = excluded.date,
+    description = excluded.description,
+    amount_cents = excluded.amount_cents,
+    bank_category = excluded.bank_category,
+    status = excluded.status,
+    category = CASE WHEN transactions.edited THEN transactions.category
+                    ELSE COALESCE(transactions.category, excluded.category) END,
+    label = CASE WHEN transactions.edited THEN transactions.label
+                 ELSE COALESCE(transactions.label, excluded.label) END,
+    weekly_file = COALESCE(transactions.weekly_file, excluded.weekly_file),
+    updated_at = excluded.updated_at
+"""
+
+# How long a write waits for another connection's lock before "database is locked"
+BUSY_TIMEOUT_SECONDS = 30
+
+COLUMNS = "id, account_id, date, description, amount_cents, category, bank_category, label, status, transfer_id, weekly_file"
+
+
+class TransactionStore:
+    """Thin wrapper around the SQLite transactions database."""
+
+    def __init__(self, path=None):
+        self.path = path or TRANSACTION_STORE_PATH
+        self._conn = None
+
+    @property
+    def conn(self):
+        """Open the database on first use and make sure the schema exists."""
+        if self._conn is None:
+            if self.path != ":memory:":
+                ensure_directories()
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # The pipeline hands the store between worker threads, and collate_all_years opens it
+            # from one process per year, so writers wait for each other's locks instead of failing
+            self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(transactions)")}
+            for column, statement in MIGRATIONS:
+                if column not in existing:
+                    self._conn.execute(statement)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def upsert_transactions(self, account_id, transactions, weekly_file=None):
+        """
+        Insert or refresh transactions for one account.
+
+        transactions are records.Transaction; rows without an id are skipped.
+        Returns the number of rows written.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        rows = [{
+            'id': tx.id,
+            'account_id': str(account_id),
+            'date': tx.date.isoformat(),
+            'description': tx.description,
+            'amount_cents': tx.amount_cents,
+            'category': tx.category,
+            'bank_category': tx.bank_category,
+            'label': tx.label,
+            'status': tx.status,
+            'weekly_file': weekly_file,
+            'updated_at': now,
+        } for tx in transactions if tx.id is not None]
+
+        with self.conn:
+            self.conn.executemany(UPSERT, rows)
+        return len(rows)
+
+    def query(self, account_id=None, start_date=None, end_date=None, label=None,
+              weekly_file=None, status=None, include_transfers=True, newest_first=False):
+        """
+        Return transactions matching every given filter as a list of records.Transaction.
+
+        Dates are inclusive (date objects or YYYY-MM-DD strings). Pass
+        include_transfers=False to leave out linked inter-account transfers.
+        """
+        clauses, params = [], []
+        for column, op, value in (
+            ('account_id', '=', account_id and str(account_id)),
+            ('date', '>=', start_date and parse_date(start_date).isoformat()),
+            ('date', '<=', end_date and parse_date(end_date).isoformat()),
+            ('label', '=', label),
+            ('weekly_file', '=', weekly_file),
+            ('status', '=', status),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if not include_transfers:
+            clauses.append("transfer_id IS NULL")
+
+        sql = f"SELECT {COLUMNS} FROM transactions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY date DESC, id DESC" if newest_first else " ORDER BY date, id"
+
+        return [
+            Transaction(id, parse_date(date), description, amount_cents, account_id, category,
+                        bank_category, label, status, transfer_id, weekly_file)
+            for (id, account_id, date, description, amount_cents, category, bank_category, label,
+                 status, transfer_id, weekly_file) in self.conn.execute(sql, params)
+        ]
+
+    def has_account(self, account_id):
+        """Whether any transactions have been stored for account_id."""
+        row = self.conn.execute(
+            "SELECT 1 FROM transactions WHERE account_id = ? LIMIT 1", (str(account_id),)
+        ).fetchone()
+        return row is not None
+
+    def weekly_files(self, year=None):
+        """Names of the weekly workbooks rendered from the store, optionally for one year."""
+        sql = "SELECT DISTINCT weekly_file FROM transactions WHERE weekly_file IS NOT NULL"
+        params = []
+        if year is not None:
+            sql += " AND weekly_file LIKE ?"
+            params.append(f"% - {year}.xlsx")
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def set_labels(self, updates):
+        """Apply {id: (category, label)} edits made outside the store (e.g. in Excel) and mark them edited."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET category = ?, label = ?, edited = 1 WHERE id = ?",
+                [(category, label, tx_id) for tx_id, (category, label) in updates.items()],
+            )
+
+    def fill_labels(self, updates):
+        """Apply {id: (category, label)} where those are not set and were never edited, e.g. refunds matched later."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET category = COALESCE(category, ?), label = COALESCE(label, ?) "
+                "WHERE id = ? AND NOT edited",
+                [(category, label, tx_id) for tx_id, (category, label) in updates.items()],
+            )
+
+    def merge_duplicates(self, replacements):
+        """
+        Fold stored pending transactions into their posted twins.
+
+        replacements maps {pending_id: posted_id}. The pending row takes the
+        posted id, keeping its category, label and weekly workbook, so the
+        posted transaction's upsert refreshes it instead of adding a second row.
+        If the posted id is already stored the pending row is just deleted.
+        """
+        with self.conn:
+            for pending_id, posted_id in replacements.items():
+                exists = self.conn.execute("SELECT 1 FROM transactions WHERE id = ?", (posted_id,)).fetchone()
+                if exists:
+                    self.conn.execute("DELETE FROM transactions WHERE id = ?", (pending_id,))
+                else:
+                    self.conn.execute("UPDATE transactions SET id = ? WHERE id = ?", (posted_id, pending_id))
+
+    def link_transfers(self, to_account_id, from_account_id, start_date=None, window_days=None):
+        """
+        Link unlinked credits on to_account_id with the debits on from_account_id
+        that paid them, e.g. card repayments made from the debit account.
+
+        Pairs have opposite amounts and are at most window_days apart (default
+        TRANSFER_WINDOW_DAYS). Both rows get the other's id in transfer_id.
+        Returns the list of TransferMatch pairs linked.
+        """
+        window_days = TRANSFER_WINDOW_DAYS if window_days is None else window_days
+        credits = [tx for tx in self.query(account_id=to_account_id, start_date=start_date, include_transfers=False)
+                   if tx.amount_cents > 0]
+        if not credits:
+            return []
+        # Debits can be dated a few days before the earliest credit
+        debit_start = credits[0].date - timedelta(days=window_days)
+        debits = [tx for tx in self.query(account_id=from_account_id, start_date=debit_start, include_transfers=False)
+                  if tx.amount_cents < 0]
+
+        matches = match_transfers(credits, debits, window_days=window_days)
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET transfer_id = ? WHERE id = ?",
+                [pair for match in matches for pair in ((match.outgoing.id, match.incoming.id),
+                                                        (match.incoming.id, match.outgoing.id))],
+            )
+        return matches
+
+    def mark_workbook_synced(self, path):
+        """Record that a workbook on disk matches the store, e.g. right after rendering it."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workbook_sync (path, mtime) VALUES (?, ?)",
+                (path, os.path.getmtime(path)),
+            )
+
+    def workbook_synced(self, path):
+        """Whether the workbook at path is unchanged since mark_workbook_synced recorded it."""
+        synced = self.conn.execute("SELECT mtime FROM workbook_sync WHERE path = ?", (path,)).fetchone()
+        return synced is not None and synced[0] >= os.path.getmtime(path)
+
+    def sync_labels_from_workbook(self, path):
+        """
+        Copy hand-edited Category/Label cells from a weekly workbook back into the store.
+
+        Rows are matched on (date, description, amount) within the workbook's
+        weekly_file. The workbook is only parsed when its mtime changed since the
+        last sync, so unchanged weeks never touch XLSX parsing. Returns the number
+        of transactions updated.
+        """
+        if not os.path.exists(path) or self.workbook_synced(path):
+            return 0
+
+        from openpyxl import load_workbook
+
+        stored = {}
+        for tx in self.query(weekly_file=os.path.basename(path)):
+            stored.setdefault((tx.date, tx.description, tx.amount_cents), []).append(tx)
+
+        updates = {}
+        with metrics.timer("workbook.load"):
+            wb = load_workbook(path, read_only=True)
+        try:
+            # Columns: Date, Description, Amount, Category, Bank Category, Label
+            for values in wb.active.iter_rows(min_row=2, max_col=6, values_only=True):
+                date, description, amount, category, _, label = values
+                if date is None or not isinstance(amount, (int, float)):
+                    continue
+                try:
+                    date = parse_date(date)
+                except ValueError:
+                    continue
+                matches = stored.get((date, description, to_cents(amount)))
+                if matches:
+                    tx = matches.pop(0)
+                    if (tx.category, tx.label) != (category, label):
+                        updates[tx.id] = (category, label)
+        finally:
+            wb.close()
+
+        self.set_labels(updates)
+        self.mark_workbook_synced(path)
+        return len(updates)
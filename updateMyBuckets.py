@@ -1,83 +1,86 @@
 import requests
-import pandas as pd
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 import os
+import atomic_save
+import metrics
 
 # Import configuration variables
-from config import (
+from settings import (
     DEBIT_ID, 
     POCKETSMITH_API_KEY, 
+    POCKETSMITH_API_URL,
     TRANSACTION_DIRECTORY,
-    JACK_FILL
+    ensure_directories
 )
+from records import Transaction
+from transaction_store import TransactionStore
+# openpyxl and JACK_FILL are imported in create_excel_file so that importing this
+# module (e.g. from BudgetUpdater or the pipeline's fetch stage) stays cheap.
 
 class updateMyBuckets:
     def __init__(self):
         """Initialize the class with API key and base URL for PocketSmith."""
         self.api_key = POCKETSMITH_API_KEY
-        self.base_url = "https://api.pocketsmith.com/v2"
+        self.base_url = POCKETSMITH_API_URL
         self.headers = {
             "Authorization": f"Key {self.api_key}",
             "Accept": "application/json"
         }
-        # Define border style for cells
-        self.cell_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
 
     def fetch_transactions(self):
         """
         Fetch all debit transactions from PocketSmith API.
-        Returns a list of transaction data.
+        Returns a list of transaction data. A failed request raises
+        requests.RequestException, so it is never mistaken for an empty fetch.
         """
-        try:
-            url = f"{self.base_url}/accounts/{DEBIT_ID}/transactions"
+        url = f"{self.base_url}/accounts/{DEBIT_ID}/transactions"
+        with metrics.timer("http.request", histogram=True):
             response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            transactions = response.json()
-            return transactions
-        except requests.RequestException as e:
-            print(f"Error fetching transactions: {e}")
-            return []
+        metrics.count("http.bytes", len(response.content))
+        response.raise_for_status()
+        transactions = response.json()
+        metrics.count("debit.rows", len(transactions))
+        return transactions
 
     def format_transaction_data(self, transactions):
         """
-        Format the raw transaction data into a structured list for Excel export.
-        Returns a list of dictionaries with required fields.
+        Format the raw transaction data into records for the store and Excel export.
+        Returns a list of records.Transaction; the PocketSmith category is the bank_category.
         """
         formatted_data = []
         for transaction in transactions:
-            formatted_data.append({
-                "Date": transaction.get("date", ""),
-                "Description": transaction.get("payee", ""),
-                "Amount": transaction.get("amount", 0),
-                "Category": transaction.get("category", {}).get("title", "Uncategorized")
-            })
+            record = Transaction.from_api(transaction, DEBIT_ID)
+            record.bank_category = (transaction.get("category") or {}).get("title", "Uncategorized")
+            formatted_data.append(record)
         return formatted_data
 
+    @metrics.timed("debit.build")
     def create_excel_file(self, transaction_data):
         """
         Create and format an Excel file with the transaction data.
-        Saves the file in the specified TRANSACTION_DIRECTORY.
+        Saves the file in the specified TRANSACTION_DIRECTORY and returns its
+        path, or None if it could not be saved.
         """
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+        from openpyxl.utils import get_column_letter
+        from settings import JACK_FILL
+
+        # Define border style for cells
+        cell_border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+
         # Create output directory if it doesn't exist
-        if not os.path.exists(TRANSACTION_DIRECTORY):
-            print("Creating a new directory for the output file because it does not exist...")
-            os.makedirs(TRANSACTION_DIRECTORY)
+        ensure_directories()
 
         # Generate filename with current date in "DD Mon YY" format
         current_date = datetime.now().strftime("%Y")
         output_file = os.path.join(TRANSACTION_DIRECTORY, f"Debit Transactions {current_date}.xlsx")
 
-        # Convert data to DataFrame
-        df = pd.DataFrame(transaction_data)
-
         # Create a new workbook and select the active sheet
         wb = Workbook()
         ws = wb.active
@@ -95,16 +98,17 @@ class updateMyBuckets:
             cell.font = header_font
             cell.fill = header_fill
             cell.alignment = Alignment(horizontal="center")
-            cell.border = self.cell_border
+            cell.border = cell_border
 
         # Write data rows
-        for row_num, row_data in enumerate(transaction_data, 2):
+        for row_num, tx in enumerate(transaction_data, 2):
+            row_data = {"Date": tx.date, "Description": tx.description, "Amount": tx.amount, "Category": tx.bank_category}
             for col_num, header in enumerate(headers, 1):
                 cell = ws.cell(row=row_num, column=col_num)
                 
                 if header == "Amount":
-                    # Set the actual numeric value
-                    amount = float(row_data[header])
+                    # Set the actual numeric value (exact cents from the record)
+                    amount = row_data[header]
                     cell.value = amount
                     # Use Excel's standard Currency format with 2 decimal places
                     cell.number_format = '$#,##0.00;- $#,##0.00'
@@ -117,7 +121,7 @@ class updateMyBuckets:
                 # Apply JACK_FILL from config to all data cells
                 cell.fill = JACK_FILL
                 # Add border to all data cells
-                cell.border = self.cell_border
+                cell.border = cell_border
                 
                 # Set alignment: center for all columns except Description (column B)
                 if col_num == 2:  # Column B (Description)
@@ -125,6 +129,8 @@ class updateMyBuckets:
                 else:
                     cell.alignment = Alignment(horizontal="center")
 
+        metrics.count("cells.written", len(headers) * (len(transaction_data) + 1))
+
         # Auto-adjust column widths
         for column in ws.columns:
             max_length = 0
@@ -145,24 +151,63 @@ class updateMyBuckets:
 
         # Save the workbook
         try:
-            wb.save(output_file)
+            with metrics.timer("workbook.save"):
+                atomic_save.save_workbook(wb, output_file)
+            metrics.count("workbook.bytes_written", os.path.getsize(output_file))
             print(f"Transactions exported successfully to {output_file}")
+            return output_file
         except Exception as e:
             print(f"Error saving Excel file: {e}")
+            return None
+
+    def store_transactions(self, transaction_data, store=None):
+        """
+        Record formatted debit transactions in the transaction store and link
+        card repayments among them to the card credits they paid.
+        Returns the store so callers can query it.
+        """
+        import bank_feeds
+
+        store = store or TransactionStore()
+        store.upsert_transactions(DEBIT_ID, transaction_data)
+        bank_feeds.link_card_transfers(min((tx.date for tx in transaction_data), default=None), store)
+        return store
+
+    def save_transactions(self, transaction_data, store=None):
+        """
+        Record formatted debit transactions in the transaction store and render
+        the Debit Transactions file from the account's full stored history,
+        newest first. The file is marked synced so readers know that order can
+        be relied on until it is edited.
+        Returns the store so callers can query it.
+        """
+        store = self.store_transactions(transaction_data, store)
+        self.export_transactions(store)
+        return store
+
+    def export_transactions(self, store=None):
+        """Render the Debit Transactions file from the account's stored history. Returns its path or None."""
+        store = store or TransactionStore()
+        output_file = self.create_excel_file(store.query(account_id=DEBIT_ID, newest_first=True))
+        if output_file:
+            store.mark_workbook_synced(output_file)
+        return output_file
 
     def run(self):
         """
         Main method to orchestrate the transaction fetching and Excel export process.
         """
-        raw_transactions = self.fetch_transactions()
-        if raw_transactions:
-            formatted_data = self.format_transaction_data(raw_transactions)
-            if formatted_data:
-                self.create_excel_file(formatted_data)
-            else:
-                print("No transactions found to export.")
-        else:
+        try:
+            raw_transactions = self.fetch_transactions()
+        except requests.RequestException as e:
+            print(f"Error fetching transactions: {e}")
             print("Failed to fetch transactions.")
+            return
+        formatted_data = self.format_transaction_data(raw_transactions)
+        if formatted_data:
+            self.save_transactions(formatted_data)
+        else:
+            print("No transactions found to export.")
 
 """
 if __name__ == "__main__":
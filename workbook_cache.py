@@ -0,0 +1,254 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from io import BytesIO
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import metrics
+from openpyxl import load_workbook
+from openpyxl.cell import Cell
+from openpyxl.styles.cell_style import StyleArray
+from settings import WORKBOOK_CACHE_DIRECTORY, WORKBOOK_CACHE_MAX_MB
+
+'''
+Snapshot cache for parsed workbooks.
+
+load(path) returns the same openpyxl workbook as load_workbook(path), but the
+first parse of each file is also saved as a snapshot in
+WORKBOOK_CACHE_DIRECTORY. Later loads of an unchanged file unpickle the
+snapshot instead of parsing the XML again, which is several times faster for
+weekly and monthly spreadsheets.
+
+A file is looked up by its path, size and modification time (a small .key
+file per combination), so a hit costs one stat and never reads the workbook.
+Only when that key misses is the file hashed: snapshots themselves are named
+by content hash and load options, so a file that was rewritten or copied
+with the same bytes still reuses its snapshot. Cells are stored compactly
+as (row, column, value, type, style id) tuples against a per-sheet table of
+style index arrays, and the rest of the workbook (styles, widths, merged
+cells, conditional formatting, VBA parts) is pickled as is.
+
+The directory is kept under WORKBOOK_CACHE_MAX_MB by removing the least
+recently used snapshots; set it to 0 to turn the cache off. Snapshots are
+pickles, so only point WORKBOOK_CACHE_DIRECTORY at a directory you own.
+'''
+
+FORMAT_VERSION = 1
+SUFFIX = ".snap"
+KEY_SUFFIX = ".key"
+_HASH_CHUNK = 1 << 20
+
+_lock = threading.Lock()
+
+
+def fingerprint(path):
+    """The size and BLAKE2b content hash of a file, as (size, hex digest)."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return os.path.getsize(path), digest.hexdigest()
+
+
+def _flags(keep_vba, data_only):
+    flags = ("v" if keep_vba else "") + ("d" if data_only else "")
+    return f"-{flags}" if flags else ""
+
+
+def _snapshot_path(directory, size, digest, keep_vba, data_only):
+    return os.path.join(directory, f"{digest}-{size}{_flags(keep_vba, data_only)}{SUFFIX}")
+
+
+def _key_path(directory, path, stat, keep_vba, data_only):
+    """Where the name of path's snapshot is recorded while its size and modification time stay the same."""
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8")
+    digest = hashlib.blake2b(key, digest_size=20).hexdigest()
+    return os.path.join(directory, f"{digest}{_flags(keep_vba, data_only)}{KEY_SUFFIX}")
+
+
+def _compact_sheet(sheet):
+    """Plain cells as tuples against a table of distinct style arrays; anything else kept as objects."""
+    styles = {}
+    cells = []
+    objects = []
+    for (row, column), cell in sheet._cells.items():
+        if type(cell) is not Cell or cell._hyperlink is not None or cell._comment is not None:
+            objects.append(cell)  # Merged cells, links and comments are rare, so they are pickled whole
+            continue
+        style_id = styles.setdefault(tuple(cell._style), len(styles))
+        cells.append((row, column, cell._value, cell.data_type, style_id))
+    return list(styles), cells, objects
+
+
+def _restore_sheet(sheet, styles, cells, objects):
+    arrays = [StyleArray(style) for style in styles]
+    sheet_cells = sheet._cells
+    new_cell = Cell.__new__
+    for row, column, value, data_type, style_id in cells:
+        # Skip Cell.__init__, which type-checks the value again
+        cell = new_cell(Cell)
+        cell.parent = sheet
+        cell.row = row
+        cell.column = column
+        cell._value = value
+        cell.data_type = data_type
+        cell._hyperlink = None
+        cell._comment = None
+        cell._style = StyleArray(arrays[style_id])
+        sheet_cells[(row, column)] = cell
+    for cell in objects:
+        sheet_cells[(cell.row, cell.column)] = cell
+
+
+def _dump(workbook, source):
+    """Serialise a workbook, taking its cells out of the sheets while it is pickled."""
+    sheets = [sheet for sheet in workbook._sheets if hasattr(sheet, "_cells")]
+    vba = workbook.vba_archive
+    saved = [sheet._cells for sheet in sheets]
+    compact = [_compact_sheet(sheet) for sheet in sheets]
+    try:
+        for sheet in sheets:
+            sheet._cells = {}
+        workbook.vba_archive = None
+        return pickle.dumps({
+            "version": FORMAT_VERSION,
+            "source": source,
+            "workbook": workbook,
+            "sheets": compact,
+            "vba": {name: vba.read(name) for name in vba.namelist()} if vba is not None else None,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for sheet, cells in zip(sheets, saved):
+            sheet._cells = cells
+        workbook.vba_archive = vba
+
+
+def _load_snapshot(path):
+    with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    if snapshot.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} snapshot")
+    workbook = snapshot["workbook"]
+    sheets = [sheet for sheet in workbook._sheets if hasattr(sheet, "_cells")]
+    for sheet, compact in zip(sheets, snapshot["sheets"]):
+        _restore_sheet(sheet, *compact)
+    if snapshot["vba"] is not None:
+        # The same in-memory archive load_workbook(keep_vba=True) attaches for saving
+        workbook.vba_archive = ZipFile(BytesIO(), "a", ZIP_DEFLATED)
+        for name, content in snapshot["vba"].items():
+            workbook.vba_archive.writestr(name, content)
+    return workbook
+
+
+class WorkbookCache:
+    """Snapshots of parsed workbooks in directory, kept under max_bytes by evicting the least recently used."""
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or WORKBOOK_CACHE_DIRECTORY
+        self.max_bytes = WORKBOOK_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+
+    def load(self, path, keep_vba=False, data_only=False):
+        """load_workbook(path, keep_vba=..., data_only=...), from a snapshot when the file is unchanged."""
+        if not self.max_bytes:
+            return load_workbook(path, keep_vba=keep_vba, data_only=data_only)
+
+        key = _key_path(self.directory, path, os.stat(path), keep_vba, data_only)
+        snapshot = self._read_key(key)
+        if snapshot is None:
+            metrics.count("workbook_cache.hashes")
+            size, digest = fingerprint(path)
+            snapshot = _snapshot_path(self.directory, size, digest, keep_vba, data_only)
+            self._write(key, os.path.basename(snapshot).encode("utf-8"))
+        if os.path.exists(snapshot):
+            try:
+                with metrics.timer("workbook_cache.load"):
+                    workbook = _load_snapshot(snapshot)
+                os.utime(snapshot)  # Most recently used
+                metrics.count("workbook_cache.hits")
+                return workbook
+            except Exception:
+                # Unreadable or from another openpyxl version: parse again and replace it
+                self._remove(snapshot)
+
+        metrics.count("workbook_cache.misses")
+        workbook = load_workbook(path, keep_vba=keep_vba, data_only=data_only)
+        self.store(snapshot, workbook, path)
+        return workbook
+
+    def _read_key(self, key):
+        """The snapshot path recorded in a key file, or None if there is none."""
+        try:
+            with open(key, "rb") as f:
+                return os.path.join(self.directory, os.path.basename(f.read().decode("utf-8")))
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _write(self, path, data):
+        """Write a file in the cache directory atomically. Returns whether it was written."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            return True
+        except OSError:
+            self._remove(temp_path)
+            return False
+
+    def store(self, snapshot, workbook, source=None):
+        """Write a snapshot atomically, then evict old ones past max_bytes."""
+        with metrics.timer("workbook_cache.store"):
+            data = _dump(workbook, source)
+        if self._write(snapshot, data):
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used snapshots until the directory fits in
+        max_bytes, and the key files of snapshots that are gone.
+        """
+        with _lock:
+            entries = []
+            names = os.listdir(self.directory)
+            for name in names:
+                if name.endswith(SUFFIX):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(os.path.join(self.directory, name))
+                metrics.count("workbook_cache.evictions")
+                total -= size
+            for name in names:
+                if name.endswith(KEY_SUFFIX):
+                    key = os.path.join(self.directory, name)
+                    snapshot = self._read_key(key)
+                    if snapshot is None or not os.path.exists(snapshot):
+                        self._remove(key)
+
+    def clear(self):
+        """Remove every snapshot and key file."""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith((SUFFIX, KEY_SUFFIX)):
+                    self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load(path, keep_vba=False, data_only=False):
+    """Load a workbook through the default cache in WORKBOOK_CACHE_DIRECTORY."""
+    return WorkbookCache().load(path, keep_vba=keep_vba, data_only=data_only)